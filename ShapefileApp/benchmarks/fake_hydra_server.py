@@ -0,0 +1,273 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+#    Copyright (c) 2016, Philipp Meier
+#
+#    This file is part of the Hydra Platform ShapefileApp (HydraShapefileApp).
+#
+#    HydraShapefileApp is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by the
+#    Free Software Foundation, either version 3 of the License, or (at your
+#    option) any later version.
+#
+#    HydraShapefileApp is distributed in the hope that it will be useful, but
+#    WITHOUT ANY WARRANTY; without even the implied warranty of MERCHANTABILITY
+#    or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public License
+#    for more details.
+#
+#    You should have received a copy of the GNU General Public License along
+#    with HydraShapefileApp.  If not, see <http://www.gnu.org/licenses/>.
+
+
+import sys
+import gzip
+import json
+import argparse as ap
+import threading
+
+from io import BytesIO
+
+try:
+    from BaseHTTPServer import BaseHTTPRequestHandler
+    from BaseHTTPServer import HTTPServer
+    from SocketServer import ThreadingMixIn
+except ImportError:
+    from http.server import BaseHTTPRequestHandler
+    from http.server import HTTPServer
+    from socketserver import ThreadingMixIn
+
+
+class FakeHydra(object):
+    """An in-memory stand-in for the parts of the Hydra Platform JSON-RPC
+    API used by the app. Every public rpc_* method implements the call of
+    the same name. Networks are kept as dicts in the format returned by
+    get_network, the data of a scenario by resource attribute ID.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.attributes = dict()
+        self.projects = dict()
+        self.networks = dict()
+        self.data = dict()
+        self.ids = dict()
+
+    def next_id(self, kind):
+        self.ids[kind] = self.ids.get(kind, 0) + 1
+        return self.ids[kind]
+
+    def call(self, func, args):
+        method = getattr(self, 'rpc_' + func, None)
+        if method is None:
+            raise ValueError("Unknown function %s." % func)
+        with self.lock:
+            return method(**args)
+
+    def rpc_login(self, username=None, password=None):
+        return dict(session_id='benchmark-session', user_id=1)
+
+    def rpc_get_all_attributes(self):
+        return list(self.attributes.values())
+
+    def rpc_add_attribute(self, attr):
+        for existing in self.attributes.values():
+            if existing['name'] == attr['name']:
+                return existing
+        attr = dict(attr, id=self.next_id('attr'))
+        attr.setdefault('dimen', None)
+        self.attributes[attr['id']] = attr
+        return attr
+
+    def rpc_add_attributes(self, attrs):
+        return [self.rpc_add_attribute(attr) for attr in attrs]
+
+    def rpc_add_project(self, project):
+        project = dict(project, id=self.next_id('project'))
+        self.projects[project['id']] = project
+        return project
+
+    def rpc_get_project(self, project_id):
+        return self.projects[project_id]
+
+    def rpc_get_projects(self, **kwargs):
+        return list(self.projects.values())
+
+    def rpc_get_network_project(self, network_id):
+        return self.projects[self.networks[network_id]['project_id']]
+
+    def rpc_get_networks(self, project_id, include_data='N'):
+        return [self._network_summary(network)
+                for network in self.networks.values()
+                if network['project_id'] == project_id]
+
+    def _save_resource(self, resource, res_attr_ids):
+        resource = dict(resource, id=self.next_id('resource'))
+        resource.setdefault('types', [])
+        resource.setdefault('layout', None)
+        resource.setdefault('description', '')
+        attributes = []
+        for res_attr in resource.get('attributes', []):
+            saved = dict(res_attr, id=self.next_id('res_attr'))
+            res_attr_ids[res_attr['id']] = saved['id']
+            attributes.append(saved)
+        resource['attributes'] = attributes
+        return resource
+
+    def _save_data(self, scenario_id, res_scens, res_attr_ids=None):
+        data = self.data.setdefault(scenario_id, dict())
+        saved = []
+        for res_scen in res_scens:
+            res_scen = dict(res_scen)
+            if res_attr_ids is not None:
+                res_scen['resource_attr_id'] = \
+                    res_attr_ids[res_scen['resource_attr_id']]
+            res_scen['value'] = dict(res_scen['value'],
+                                     id=self.next_id('dataset'))
+            data[res_scen['resource_attr_id']] = res_scen
+            saved.append(res_scen)
+        return saved
+
+    def rpc_add_network(self, net):
+        network = dict(net, id=self.next_id('network'))
+        res_attr_ids = dict()
+        node_ids = dict()
+        network['attributes'] = self._save_resource(
+            dict(attributes=net.get('attributes', []), id=None),
+            res_attr_ids)['attributes']
+        network['nodes'] = []
+        for node in net.get('nodes', []):
+            saved = self._save_resource(node, res_attr_ids)
+            node_ids[node['id']] = saved['id']
+            network['nodes'].append(saved)
+        network['links'] = []
+        for link in net.get('links', []):
+            saved = self._save_resource(link, res_attr_ids)
+            saved['node_1_id'] = node_ids.get(link['node_1_id'],
+                                              link['node_1_id'])
+            saved['node_2_id'] = node_ids.get(link['node_2_id'],
+                                              link['node_2_id'])
+            network['links'].append(saved)
+
+        scenarios = []
+        for scenario in net.get('scenarios', []):
+            scenario = dict(scenario, id=self.next_id('scenario'))
+            self._save_data(scenario['id'],
+                            scenario.get('resourcescenarios', []),
+                            res_attr_ids)
+            scenario['resourcescenarios'] = []
+            scenarios.append(scenario)
+        network['scenarios'] = scenarios
+        self.networks[network['id']] = network
+        return self.rpc_get_network(network['id'], include_data='N')
+
+    def _network_summary(self, network):
+        return dict(id=network['id'], name=network['name'],
+                    project_id=network['project_id'],
+                    scenarios=[dict(id=s['id'], name=s['name'])
+                               for s in network['scenarios']])
+
+    def rpc_get_network(self, network_id, include_data='Y', **kwargs):
+        network = dict(self.networks[network_id])
+        scenarios = []
+        for scenario in network['scenarios']:
+            scenario = dict(scenario)
+            if include_data == 'Y':
+                scenario['resourcescenarios'] = \
+                    list(self.data.get(scenario['id'], dict()).values())
+            scenarios.append(scenario)
+        network['scenarios'] = scenarios
+        return network
+
+    def rpc_add_nodes(self, network_id, nodes):
+        network = self.networks[network_id]
+        saved = [self._save_resource(node, dict()) for node in nodes]
+        network['nodes'].extend(saved)
+        return saved
+
+    def rpc_add_links(self, network_id, links):
+        network = self.networks[network_id]
+        saved = [self._save_resource(link, dict()) for link in links]
+        network['links'].extend(saved)
+        return saved
+
+    def rpc_update_resourcedata(self, scenario_id, resource_scenarios):
+        return self._save_data(scenario_id, resource_scenarios)
+
+    def rpc_get_attribute_datasets(self, attr_id, scenario_id):
+        return [res_scen for res_scen in
+                self.data.get(scenario_id, dict()).values()
+                if res_scen['attr_id'] == attr_id]
+
+
+class FakeHydraHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def _read_body(self):
+        if self.headers.get('Transfer-Encoding', '').lower() == 'chunked':
+            chunks = []
+            while True:
+                size = int(self.rfile.readline().strip().split(b';')[0], 16)
+                if size == 0:
+                    self.rfile.readline()
+                    break
+                chunks.append(self.rfile.read(size))
+                self.rfile.readline()
+            body = b''.join(chunks)
+        else:
+            body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        if self.headers.get('Content-Encoding', '').lower() == 'gzip':
+            body = gzip.GzipFile(fileobj=BytesIO(body)).read()
+        return body
+
+    def do_POST(self):
+        self.server.nrequests += 1
+        try:
+            request = json.loads(self._read_body().decode('utf-8'))
+            func, args = list(request.items())[0]
+            result = self.server.hydra.call(func, args)
+            status = 200
+        except Exception as err:
+            result = dict(faultcode='Server', faultstring='%s' % err)
+            status = 500
+        body = json.dumps(result).encode('utf-8')
+
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        if 'gzip' in self.headers.get('Accept-Encoding', '') and \
+                len(body) > 1024:
+            buf = BytesIO()
+            gz = gzip.GzipFile(fileobj=buf, mode='wb', compresslevel=1)
+            gz.write(body)
+            gz.close()
+            body = buf.getvalue()
+            self.send_header('Content-Encoding', 'gzip')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class FakeHydraServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address=('127.0.0.1', 0)):
+        HTTPServer.__init__(self, address, FakeHydraHandler)
+        self.hydra = FakeHydra()
+        self.nrequests = 0
+
+    @property
+    def url(self):
+        return 'http://%s:%s/json' % self.server_address[:2]
+
+
+if __name__ == '__main__':
+    parser = ap.ArgumentParser(description="""Run a local stand-in for the
+    Hydra Platform JSON-RPC API.""")
+    parser.add_argument('-p', '--port', type=int, default=8080)
+    args = parser.parse_args()
+    server = FakeHydraServer(('127.0.0.1', args.port))
+    print(server.url)
+    sys.stdout.flush()
+    server.serve_forever()
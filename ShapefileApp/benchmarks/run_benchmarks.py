@@ -0,0 +1,306 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+#    Copyright (c) 2016, Philipp Meier
+#
+#    This file is part of the Hydra Platform ShapefileApp (HydraShapefileApp).
+#
+#    HydraShapefileApp is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by the
+#    Free Software Foundation, either version 3 of the License, or (at your
+#    option) any later version.
+#
+#    HydraShapefileApp is distributed in the hope that it will be useful, but
+#    WITHOUT ANY WARRANTY; without even the implied warranty of MERCHANTABILITY
+#    or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public License
+#    for more details.
+#
+#    You should have received a copy of the GNU General Public License along
+#    with HydraShapefileApp.  If not, see <http://www.gnu.org/licenses/>.
+
+
+import os
+import sys
+import json
+import time
+import socket
+import shutil
+import tempfile
+import subprocess
+import argparse as ap
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+BASELINE = os.path.join(BENCHMARK_DIR, 'baseline.json')
+PHASES = ['from_shp', 'save_network', 'load_network', 'to_shp']
+
+process_time = getattr(time, 'process_time', None) or time.clock
+
+
+def peak_rss_mb():
+    """Return the peak resident set size of this process in MB or None if
+    it cannot be determined (e.g. on Windows).
+    """
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == 'darwin':
+        return peak / 1024. / 1024.
+    return peak / 1024.
+
+
+def timed(results, phase, func, *func_args, **kwargs):
+    """Call a function and record its wall and CPU time and the peak
+    resident set size of this process at its end as phase in results.
+    """
+    start = time.time()
+    cpu_start = process_time()
+    result = func(*func_args, **kwargs)
+    cpu = process_time() - cpu_start
+    results[phase] = dict(seconds=time.time() - start, cpu_seconds=cpu,
+                          peak_rss_mb=peak_rss_mb())
+    return result
+
+
+def generate(workdir, nnodes, args):
+    """Generate the input shapefiles of a network.
+    """
+    from synthetic_network import generate_network
+
+    nodefile, linkfile = generate_network(
+        os.path.join(workdir, 'input'), nnodes, nattrs=args.attributes,
+        vertices=args.vertices, epsg=args.epsg)
+    return dict(nodefile=nodefile, linkfile=linkfile)
+
+
+def run_import(url, nodefile, linkfile, nnodes, args):
+    """Time reading the shapefiles and saving the network on the server.
+    """
+    from shapefile_lib import ShapefileApp
+
+    results = dict()
+    importer = ShapefileApp(url=url, username='benchmark',
+                            password='benchmark', jobs=args.jobs,
+                            compact=args.compact)
+    importer.login()
+
+    def read_shapefiles():
+        importer.load_attributes()
+        importer.shp_import_nodes([nodefile])
+        importer.shp_import_links([linkfile])
+
+    timed(results, 'from_shp', read_shapefiles)
+    net_summary = timed(results, 'save_network', importer.save_network,
+                        network_name='Benchmark %s' % nnodes,
+                        project_name='Benchmark')
+    return dict(nodes=nnodes, links=len(importer.links),
+                network_id=net_summary.id,
+                scenario_id=net_summary.scenarios[0].id,
+                phases=results)
+
+
+def run_export(url, workdir, network_id, scenario_id, args):
+    """Time loading the saved network and writing it to shapefiles.
+    """
+    from shapefile_lib import ShapefileApp
+
+    results = dict()
+    exporter = ShapefileApp(url=url, username='benchmark',
+                            password='benchmark', jobs=args.jobs)
+    exporter.login()
+    timed(results, 'load_network', exporter.load_network, network_id,
+          scenario_id, lazy=args.lazy)
+    timed(results, 'to_shp', exporter.to_shp, os.path.join(workdir, 'output'),
+          overwrite=True)
+    return dict(phases=results)
+
+
+def free_port():
+    sock = socket.socket()
+    sock.bind(('127.0.0.1', 0))
+    port = sock.getsockname()[1]
+    sock.close()
+    return port
+
+
+def start_server():
+    port = free_port()
+    server = subprocess.Popen([sys.executable,
+                               os.path.join(BENCHMARK_DIR,
+                                            'fake_hydra_server.py'),
+                               '--port', str(port)],
+                              stdout=subprocess.PIPE)
+    url = server.stdout.readline().decode('utf-8').strip()
+    return server, url
+
+
+def run_child(stage, url, workdir, nnodes, args, *stage_args):
+    """Run a stage of the benchmark of one scale in a new process and return
+    its results.
+    """
+    command = [sys.executable, os.path.abspath(__file__),
+               '--child', stage, '--url', url, '--workdir', workdir,
+               '--scales', str(nnodes),
+               '--attributes', str(args.attributes),
+               '--vertices', str(args.vertices),
+               '--epsg', str(args.epsg), '--jobs', str(args.jobs)]
+    if args.compact:
+        command.append('--compact')
+    if args.lazy:
+        command.append('--lazy')
+    command.extend(['--'] + [str(arg) for arg in stage_args])
+    output = subprocess.check_output(command, cwd=BENCHMARK_DIR)
+    return json.loads(output.decode('utf-8').strip().splitlines()[-1])
+
+
+def run_scale(nnodes, args):
+    """Run the benchmark of one scale. The network is generated, imported
+    and exported in three processes, so the memory of one does not show up
+    in the peak resident set size of another.
+    """
+    server, url = start_server()
+    workdir = tempfile.mkdtemp(prefix='shapefileapp_benchmark_')
+    try:
+        files = run_child('generate', url, workdir, nnodes, args)
+        result = run_child('import', url, workdir, nnodes, args,
+                           files['nodefile'], files['linkfile'])
+        exported = run_child('export', url, workdir, nnodes, args,
+                             result.pop('network_id'),
+                             result.pop('scenario_id'))
+        result['phases'].update(exported['phases'])
+        return result
+    finally:
+        server.terminate()
+        server.wait()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def compare(results, baseline, tolerance, memory_tolerance):
+    """Print the results next to the baseline and return the list of
+    (scale, phase, measure) whose wall time ('seconds') or peak resident set
+    size ('peak_rss_mb') exceeds the baseline by more than the respective
+    tolerance.
+    """
+    regressions = []
+    print('%10s %-14s %10s %10s %8s %10s %10s %8s' %
+          ('nodes', 'phase', 'seconds', 'baseline', 'ratio', 'peak MB',
+           'baseline', 'ratio'))
+    for scale, result in sorted(results.items(), key=lambda r: int(r[0])):
+        for phase in PHASES:
+            measured = result['phases'][phase]
+            reference = baseline.get(scale, dict()).get('phases', dict()) \
+                .get(phase, dict())
+            columns = []
+            for measure, limit, fmt in [('seconds', tolerance, '%.2f'),
+                                        ('peak_rss_mb', memory_tolerance,
+                                         '%.0f')]:
+                value = measured.get(measure)
+                ref_value = reference.get(measure)
+                columns.append(fmt % value if value is not None else '-')
+                if value is not None and ref_value:
+                    ratio = value / ref_value
+                    columns.append(fmt % ref_value)
+                    columns.append('%.2f' % ratio)
+                    if ratio > 1. + limit:
+                        regressions.append((scale, phase, measure))
+                        columns[-1] += ' !'
+                else:
+                    columns.extend(['-', '-'])
+            print('%10s %-14s %10s %10s %8s %10s %10s %8s' %
+                  tuple([scale, phase] + columns))
+    return regressions
+
+
+if __name__ == '__main__':
+    parser = ap.ArgumentParser(description="""
+Benchmark the import and export of synthetic networks against a local
+stand-in for the Hydra Platform server (see fake_hydra_server.py).
+
+For every scale a network of that many nodes (and about twice as many
+links) is generated and the phases from_shp (reading the shapefiles),
+save_network, load_network and to_shp are timed separately. Every scale
+runs next to its own server process. The network is generated, imported
+(from_shp and save_network) and exported (load_network and to_shp) in three
+separate processes, so the peak resident set size reported for a phase is
+the peak of its import or export process up to the end of that phase.
+
+Results are compared with a stored baseline (baseline.json next to this
+script, written with --save-baseline on the reference machine). The script
+exits with status 1 if any phase is slower or its peak resident set size
+larger than in the baseline by more than the respective tolerance.
+""", formatter_class=ap.RawDescriptionHelpFormatter)
+    parser.add_argument('-s', '--scales', type=int, nargs='+',
+                        default=[10000, 100000, 1000000],
+                        help="""Numbers of nodes to benchmark (default: 10000
+                        100000 1000000).""")
+    parser.add_argument('-a', '--attributes', type=int, default=5,
+                        help="Numeric attributes per feature (default: 5).")
+    parser.add_argument('-v', '--vertices', type=int, default=5,
+                        help="Vertices per link (default: 5).")
+    parser.add_argument('-e', '--epsg', type=int, default=2056,
+                        help="EPSG code of the network (default: 2056).")
+    parser.add_argument('-j', '--jobs', type=int, default=1,
+                        help="Worker processes of import and export.")
+    parser.add_argument('-c', '--compact', action='store_true',
+                        help="Import into the compact network store.")
+    parser.add_argument('-l', '--lazy', action='store_true',
+                        help="Load the network for the export lazily.")
+    parser.add_argument('-b', '--baseline', default=BASELINE,
+                        help="Baseline file (default: baseline.json).")
+    parser.add_argument('-t', '--tolerance', type=float, default=0.2,
+                        help="""Allowed slowdown relative to the baseline
+                        (default: 0.2, i.e. 20%%).""")
+    parser.add_argument('-m', '--memory-tolerance', type=float, default=0.2,
+                        help="""Allowed growth of the peak resident set size
+                        relative to the baseline (default: 0.2).""")
+    parser.add_argument('-o', '--output',
+                        help="Write the results to this JSON file.")
+    parser.add_argument('--save-baseline', action='store_true',
+                        help="Store the results as new baseline.")
+    parser.add_argument('--child', choices=['generate', 'import', 'export'],
+                        help=ap.SUPPRESS)
+    parser.add_argument('--url', help=ap.SUPPRESS)
+    parser.add_argument('--workdir', help=ap.SUPPRESS)
+    parser.add_argument('stage_args', nargs='*', help=ap.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child is not None:
+        sys.path.append(os.path.join(BENCHMARK_DIR, '..', 'lib'))
+        if args.child == 'generate':
+            result = generate(args.workdir, args.scales[0], args)
+        elif args.child == 'import':
+            nodefile, linkfile = args.stage_args
+            result = run_import(args.url, nodefile, linkfile,
+                                args.scales[0], args)
+        else:
+            network_id, scenario_id = [int(arg) for arg in args.stage_args]
+            result = run_export(args.url, args.workdir, network_id,
+                                scenario_id, args)
+        print(json.dumps(result))
+        sys.exit(0)
+
+    results = dict()
+    for nnodes in args.scales:
+        results[str(nnodes)] = run_scale(nnodes, args)
+
+    if args.output is not None:
+        with open(args.output, 'w') as outfile:
+            json.dump(results, outfile, indent=2, sort_keys=True)
+
+    baseline = dict()
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as baselinefile:
+            baseline = json.load(baselinefile)
+    regressions = compare(results, baseline, args.tolerance,
+                          args.memory_tolerance)
+
+    if args.save_baseline:
+        baseline.update(results)
+        with open(args.baseline, 'w') as baselinefile:
+            json.dump(baseline, baselinefile, indent=2, sort_keys=True)
+
+    if len(regressions) > 0 and not args.save_baseline:
+        print('Worse than the baseline: %s' %
+              ', '.join(['%s %s %s' % r for r in regressions]))
+        sys.exit(1)
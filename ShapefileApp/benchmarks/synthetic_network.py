@@ -0,0 +1,143 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+#    Copyright (c) 2016, Philipp Meier
+#
+#    This file is part of the Hydra Platform ShapefileApp (HydraShapefileApp).
+#
+#    HydraShapefileApp is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by the
+#    Free Software Foundation, either version 3 of the License, or (at your
+#    option) any later version.
+#
+#    HydraShapefileApp is distributed in the hope that it will be useful, but
+#    WITHOUT ANY WARRANTY; without even the implied warranty of MERCHANTABILITY
+#    or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public License
+#    for more details.
+#
+#    You should have received a copy of the GNU General Public License along
+#    with HydraShapefileApp.  If not, see <http://www.gnu.org/licenses/>.
+
+
+import os
+import math
+import random
+import argparse as ap
+
+from osgeo import ogr
+from osgeo import osr
+
+
+def generate_network(outfolder, nnodes, nattrs=5, vertices=5, epsg=2056,
+                     spacing=100., seed=42):
+    """Write a synthetic network as nodes.shp and links.shp to a folder.
+
+    Nodes are placed on a square grid (spacing map units apart, starting at
+    the origin of the projection's usual extent) and links connect every
+    node with its right and upper neighbour, so there are about two links
+    per node. Every link has the given number of vertices, placed with some
+    jitter along the straight line between its nodes. Nodes and links get
+    nattrs numeric attributes and one text attribute.
+
+    Returns the paths of the node and link files.
+    """
+    rnd = random.Random(seed)
+    if not os.path.isdir(outfolder):
+        os.makedirs(outfolder)
+
+    srs = osr.SpatialReference()
+    srs.ImportFromEPSG(epsg)
+    if srs.IsGeographic():
+        origin = (5., 45.)
+        spacing = spacing / 100000.
+    else:
+        origin = (2600000., 1200000.) if epsg == 2056 else (0., 0.)
+
+    ncols = int(math.ceil(math.sqrt(nnodes)))
+    driver = ogr.GetDriverByName('ESRI Shapefile')
+
+    nodefile = os.path.join(outfolder, 'nodes.shp')
+    linkfile = os.path.join(outfolder, 'links.shp')
+    for filename in (nodefile, linkfile):
+        if os.path.exists(filename):
+            driver.DeleteDataSource(filename)
+
+    def create_layer(filename, geom_type):
+        datasource = driver.CreateDataSource(filename)
+        layer = datasource.CreateLayer(
+            os.path.splitext(os.path.basename(filename))[0], srs,
+            geom_type=geom_type)
+        layer.CreateField(ogr.FieldDefn('name', ogr.OFTString))
+        for i in range(nattrs):
+            layer.CreateField(ogr.FieldDefn('attr_%s' % i, ogr.OFTReal))
+        layer.CreateField(ogr.FieldDefn('material', ogr.OFTString))
+        return datasource, layer
+
+    def set_fields(feature, name):
+        feature.SetField(0, name)
+        for i in range(nattrs):
+            feature.SetField(i + 1, rnd.uniform(0., 1000.))
+        feature.SetField(nattrs + 1, rnd.choice(['PVC', 'concrete', 'steel']))
+
+    def position(n):
+        return (origin[0] + (n % ncols) * spacing,
+                origin[1] + (n // ncols) * spacing)
+
+    datasource, layer = create_layer(nodefile, ogr.wkbPoint)
+    layer.StartTransaction()
+    for n in range(nnodes):
+        x, y = position(n)
+        geometry = ogr.Geometry(ogr.wkbPoint)
+        geometry.AddPoint_2D(x, y)
+        feature = ogr.Feature(layer.GetLayerDefn())
+        feature.SetGeometry(geometry)
+        set_fields(feature, 'Node %s' % n)
+        layer.CreateFeature(feature)
+    layer.CommitTransaction()
+    datasource.Destroy()
+
+    datasource, layer = create_layer(linkfile, ogr.wkbLineString)
+    layer.StartTransaction()
+    nlink = 0
+    for n in range(nnodes):
+        for neighbour in (n + 1, n + ncols):
+            if neighbour >= nnodes or \
+                    (neighbour == n + 1 and neighbour % ncols == 0):
+                continue
+            (x0, y0), (x1, y1) = position(n), position(neighbour)
+            geometry = ogr.Geometry(ogr.wkbLineString)
+            geometry.AddPoint_2D(x0, y0)
+            for v in range(1, vertices - 1):
+                f = float(v) / (vertices - 1)
+                jitter = rnd.uniform(-0.1, 0.1) * spacing
+                geometry.AddPoint_2D(x0 + f * (x1 - x0) + jitter,
+                                     y0 + f * (y1 - y0) + jitter)
+            geometry.AddPoint_2D(x1, y1)
+            feature = ogr.Feature(layer.GetLayerDefn())
+            feature.SetGeometry(geometry)
+            set_fields(feature, 'Link %s' % nlink)
+            layer.CreateFeature(feature)
+            nlink += 1
+    layer.CommitTransaction()
+    datasource.Destroy()
+
+    return nodefile, linkfile
+
+
+if __name__ == '__main__':
+    parser = ap.ArgumentParser(description="""Generate a synthetic network
+    as node and link shapefiles.""")
+    parser.add_argument('outfolder')
+    parser.add_argument('-n', '--nodes', type=int, default=10000,
+                        help="Number of nodes (default: 10000).")
+    parser.add_argument('-a', '--attributes', type=int, default=5,
+                        help="Numeric attributes per feature (default: 5).")
+    parser.add_argument('-v', '--vertices', type=int, default=5,
+                        help="Vertices per link (default: 5).")
+    parser.add_argument('-e', '--epsg', type=int, default=2056,
+                        help="EPSG code of the projection (default: 2056).")
+    args = parser.parse_args()
+    for filename in generate_network(args.outfolder, args.nodes,
+                                     nattrs=args.attributes,
+                                     vertices=args.vertices, epsg=args.epsg):
+        print(filename)
@@ -0,0 +1,36 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+#    Copyright (c) 2016, Philipp Meier
+#
+#    This file is part of the Hydra Platform ShapefileApp (HydraShapefileApp).
+#
+#    HydraShapefileApp is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by the
+#    Free Software Foundation, either version 3 of the License, or (at your
+#    option) any later version.
+#
+#    HydraShapefileApp is distributed in the hope that it will be useful, but
+#    WITHOUT ANY WARRANTY; without even the implied warranty of MERCHANTABILITY
+#    or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public License
+#    for more details.
+#
+#    You should have received a copy of the GNU General Public License along
+#    with HydraShapefileApp.  If not, see <http://www.gnu.org/licenses/>.
+
+
+import os
+
+CACHE_DIR = os.path.join(os.path.expanduser('~'), '.hydra', 'ShapefileApp')
+
+
+def cache_path(filename, cache_dir=None):
+    """Return the path of a file in the cache folder of the app, creating the
+    folder if necessary.
+    """
+    if cache_dir is None:
+        cache_dir = CACHE_DIR
+    cache_dir = os.path.abspath(os.path.expanduser(cache_dir))
+    if not os.path.isdir(cache_dir):
+        os.makedirs(cache_dir)
+    return os.path.join(cache_dir, filename)
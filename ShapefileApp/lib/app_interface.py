@@ -21,6 +21,8 @@
 
 import argparse as ap
 
+from formats import FORMATS
+
 
 def export_parser():
     parser = ap.ArgumentParser(prog='ShapefileApp.py', description="""
@@ -40,6 +42,10 @@ Eawag: Swiss Federal Institute of Aquatic Science and Technology
                         help="""HydraPlatform network ID.""")
     parser.add_argument('-s', '--scenario-id',
                         help="""HydraPlatform scenario ID.""")
+    parser.add_argument('-gz', '--gzip', action='store_true',
+                        help="""Compress large requests to the server with
+                        gzip. The server has to support compressed
+                        requests.""")
     parser.add_argument('-url', '--url',
                         help="""URL of HydraPlatform server (defaults to value
                         specified in the config file.""")
@@ -51,8 +57,79 @@ Eawag: Swiss Federal Institute of Aquatic Science and Technology
                         help="""Print the project-network-scenario tree of the
                         HydraPlatform database,
                         """)
+    parser.add_argument('-tw', '--tree-workers', type=int, default=8,
+                        help="""Number of concurrent requests used to fetch
+                        the networks of all projects with --print-tree
+                        (default: 8).""")
+    parser.add_argument('-tt', '--tree-ttl', type=int, default=3600,
+                        help="""Seconds the networks of a project are kept in
+                        the tree cache (default: 3600, 0 disables the
+                        cache).""")
+    parser.add_argument('-tr', '--refresh-tree', action='store_true',
+                        help="""Ignore the tree cache and fetch the whole tree
+                        from the server.""")
+    parser.add_argument('-ti', '--invalidate-tree', type=int, nargs='+',
+                        metavar='PROJECT_ID', default=[],
+                        help="""Remove these projects from the tree cache, so
+                        their networks are fetched again with
+                        --print-tree.""")
     parser.add_argument('-x', '--overwrite', action='store_true',
                         help="Overwrite existing shapefiles on export.")
+    parser.add_argument('-j', '--jobs', type=int, default=1,
+                        help="""Number of worker processes writing the
+                        shapefiles of different node and link types
+                        (default: 1).""")
+    parser.add_argument('-l', '--lazy', action='store_true',
+                        help="""Load the network topology first and fetch the
+                        data of every attribute only when it is exported.
+                        """)
+    parser.add_argument('-cs', '--cache-size', type=int, default=1000000,
+                        help="""Maximum number of datasets kept in memory
+                        with --lazy (default: 1000000).""")
+    parser.add_argument('-f', '--format', default='shapefile',
+                        choices=list(FORMATS.keys()),
+                        help="""Output format: one shapefile per node and link
+                        type (default), one GeoPackage holding all types or
+                        one FlatGeobuf file per type.""")
+    parser.add_argument('-sc', '--sidecar', action='store_true',
+                        help="""Write arrays and timeseries to a NumPy file
+                        (.npz) next to each shapefile. The attribute field
+                        holds the number of the entry in this file.""")
+    parser.add_argument('-ia', '--include-attrs', nargs='+',
+                        help="""Only export these attributes. Data of other
+                        attributes is not loaded from the server.""")
+    parser.add_argument('-ea', '--exclude-attrs', nargs='+',
+                        help="""Export all attributes except these.""")
+    parser.add_argument('-rt', '--types', nargs='+',
+                        help="""Only export nodes and links of these
+                        types.""")
+    parser.add_argument('-bb', '--bbox', nargs=4, type=float,
+                        metavar=('MINX', 'MINY', 'MAXX', 'MAXY'),
+                        help="""Only export nodes and links intersecting this
+                        bounding box (in the projection of the network).""")
+    parser.add_argument('-pr', '--profile', metavar='FILE',
+                        help="""Write a JSON report with the time and CPU
+                        time of every phase of the export, the number of
+                        exported features and the calls to the server to
+                        this file.""")
+    parser.add_argument('-tm', '--trace-memory', action='store_true',
+                        help="""With --profile, also report the peak memory
+                        of every phase. Tracing memory slows the export
+                        down and distorts the timings. It needs Python 3.4
+                        or later, otherwise the report marks memory
+                        tracing as unavailable.""")
+    parser.add_argument('-cp', '--cprofile', metavar='FILE',
+                        help="""With --profile, also write cProfile statistics
+                        of the hot loops (building the network, writing
+                        layers) to this file.""")
+
+    parser.add_argument('-pl', '--progress-log', metavar='FILE',
+                        help="""Also write the progress of the export as JSON
+                        lines (phase, layer, items done, throughput, ETA) to
+                        this file, '-' for standard error.""")
+    parser.add_argument('-pi', '--progress-interval', type=float, default=1.,
+                        help="""Seconds between progress messages (default:
+                        1).""")
 
     return parser
 
@@ -71,6 +148,83 @@ Eawag: Swiss Federal Institute of Aquatic Science and Technology
                         help="Input shapefile containing nodes.")
     parser.add_argument('-il', '--input-links', nargs='+',
                         help="Input shapefile containing links.")
+    parser.add_argument('-fn', '--node-filter',
+                        help="""Only import nodes matching this OGR SQL WHERE
+                        clause, e.g. "TYPE = 'Pump'".""")
+    parser.add_argument('-fl', '--link-filter',
+                        help="""Only import links matching this OGR SQL WHERE
+                        clause.""")
+    parser.add_argument('-bb', '--bbox', nargs=4, type=float,
+                        metavar=('MINX', 'MINY', 'MAXX', 'MAXY'),
+                        help="""Only import features intersecting this
+                        bounding box (in the coordinates of the input
+                        files).""")
+    parser.add_argument('-f', '--format', choices=list(FORMATS.keys()),
+                        help="""Format of the input files. By default the
+                        format is detected. Files holding several layers
+                        (e.g. a GeoPackage used for both nodes and links) are
+                        read by geometry type.""")
+    parser.add_argument('-st', '--snap-tolerance', type=float,
+                        help="""Maximum distance (in map units) between a link
+                        endpoint and the node it is connected to. By default
+                        endpoints are snapped to nodes within 1 mm (0.001 m,
+                        1e-8 degrees in geographic coordinates) and nodes
+                        created from endpoints are only merged if their
+                        coordinates are identical.""")
+    parser.add_argument('-bs', '--batch-size', type=int,
+                        help="""Upload the network in batches of this many
+                        nodes or links instead of one single request. Use
+                        this for very large networks.""")
+    parser.add_argument('-ss', '--stream', action='store_true',
+                        help="""Generate the network upload while it is
+                        sent instead of building it in memory first.""")
+    parser.add_argument('-ic', '--import-cache', action='store_true',
+                        help="""Keep the features read from files in the
+                        import cache, so unchanged files are not read again
+                        by later imports.""")
+    parser.add_argument('-cd', '--cache-dir',
+                        help="""Folder of the import cache (default:
+                        ~/.hydra/ShapefileApp).""")
+    parser.add_argument('-cl', '--cache-limit', type=int, default=1024,
+                        help="""Size of the import cache in MB. The least
+                        recently used files are removed from the cache
+                        beyond it (default: 1024).""")
+    parser.add_argument('-un', '--update-network', type=int,
+                        help="""Update the network with this ID instead of
+                        creating a new network. Only added, removed and
+                        modified nodes, links and attribute values are sent
+                        to the server.""")
+    parser.add_argument('-us', '--update-scenario', type=int,
+                        help="""Scenario whose data is updated with
+                        --update-network (default: the first scenario).""")
+    parser.add_argument('-k', '--key-field',
+                        help="""Field identifying features with
+                        --update-network, either 'name' or an attribute. By
+                        default nodes are matched by their coordinates and
+                        links by their geometry.""")
+    parser.add_argument('-ol', '--online-epsg-lookup', action='store_true',
+                        help="""Query prj2epsg.org if the projection of an
+                        input file is not found in the local EPSG
+                        database.""")
+    parser.add_argument('-j', '--jobs', type=int, default=1,
+                        help="""Number of worker processes used to read the
+                        input files (default: 1).""")
+    parser.add_argument('-c', '--compact', action='store_true',
+                        help="""Keep imported nodes and links in a compact
+                        columnar store. This reduces memory use for very large
+                        networks.""")
+    parser.add_argument('-te', '--target-epsg', type=int,
+                        help="""EPSG code of the projection of the imported
+                        network. Input files in other projections are
+                        transformed on the fly (default: projection of the
+                        first input file).""")
+    parser.add_argument('-wkb', '--wkb-layout', action='store_true',
+                        help="""Store link geometries as WKB (hex encoded)
+                        instead of GeoJSON in the link layout.""")
+    parser.add_argument('-gz', '--gzip', action='store_true',
+                        help="""Compress large requests to the server with
+                        gzip. The server has to support compressed
+                        requests.""")
     parser.add_argument('-url', '--url',
                         help="""URL of HydraPlatform server (defaults to value
                         specified in the config file.""")
@@ -82,5 +236,44 @@ Eawag: Swiss Federal Institute of Aquatic Science and Technology
                         help="""Print the project-network-scenario tree of the
                         HydraPlatform database,
                         """)
+    parser.add_argument('-tw', '--tree-workers', type=int, default=8,
+                        help="""Number of concurrent requests used to fetch
+                        the networks of all projects with --print-tree
+                        (default: 8).""")
+    parser.add_argument('-tt', '--tree-ttl', type=int, default=3600,
+                        help="""Seconds the networks of a project are kept in
+                        the tree cache (default: 3600, 0 disables the
+                        cache).""")
+    parser.add_argument('-tr', '--refresh-tree', action='store_true',
+                        help="""Ignore the tree cache and fetch the whole tree
+                        from the server.""")
+    parser.add_argument('-ti', '--invalidate-tree', type=int, nargs='+',
+                        metavar='PROJECT_ID', default=[],
+                        help="""Remove these projects from the tree cache, so
+                        their networks are fetched again with
+                        --print-tree.""")
+    parser.add_argument('-pr', '--profile', metavar='FILE',
+                        help="""Write a JSON report with the time and CPU
+                        time of every phase of the import, the number of
+                        imported features and the calls to the server to
+                        this file.""")
+    parser.add_argument('-tm', '--trace-memory', action='store_true',
+                        help="""With --profile, also report the peak memory
+                        of every phase. Tracing memory slows the import
+                        down and distorts the timings. It needs Python 3.4
+                        or later, otherwise the report marks memory
+                        tracing as unavailable.""")
+    parser.add_argument('-cp', '--cprofile', metavar='FILE',
+                        help="""With --profile, also write cProfile statistics
+                        of the hot loops (reading files, adding nodes and
+                        links, building the upload) to this file.""")
+
+    parser.add_argument('-pl', '--progress-log', metavar='FILE',
+                        help="""Also write the progress of the import as JSON
+                        lines (phase, layer, items done, throughput, ETA) to
+                        this file, '-' for standard error.""")
+    parser.add_argument('-pi', '--progress-interval', type=float, default=1.,
+                        help="""Seconds between progress messages (default:
+                        1).""")
 
     return parser
@@ -0,0 +1,160 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+#    Copyright (c) 2016, Philipp Meier
+#
+#    This file is part of the Hydra Platform ShapefileApp (HydraShapefileApp).
+#
+#    HydraShapefileApp is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by the
+#    Free Software Foundation, either version 3 of the License, or (at your
+#    option) any later version.
+#
+#    HydraShapefileApp is distributed in the hope that it will be useful, but
+#    WITHOUT ANY WARRANTY; without even the implied warranty of MERCHANTABILITY
+#    or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public License
+#    for more details.
+#
+#    You should have received a copy of the GNU General Public License along
+#    with HydraShapefileApp.  If not, see <http://www.gnu.org/licenses/>.
+
+
+from collections import OrderedDict
+
+
+class DatasetCache(object):
+    """A bounded cache of the datasets of one scenario.
+
+    Datasets are fetched on demand, one attribute at a time, using
+    get_attribute_datasets. The datasets of an attribute (for all resources
+    of the network) form one page of the cache. If the cache holds more than
+    max_datasets datasets, the least recently used pages are dropped. The
+    dataset types of all fetched pages are kept, so the field types of an
+    export can be determined without holding all data in memory. If a set
+    of resource_attr_ids is given, the datasets of other resource attributes
+    (e.g. of resources which were filtered out) are dropped as soon as they
+    are received.
+
+    Resources are exported layer by layer, each accessing the same set of
+    attributes for every resource. Between begin_layer() and end_layer(),
+    the pages of values used are pinned and only other pages are dropped,
+    so a layer needing more datasets than max_datasets fetches every page
+    once instead of once per resource. The limit is enforced again when
+    the layer ends.
+    """
+
+    def __init__(self, conn, scenario_id, max_datasets=1000000,
+                 resource_attr_ids=None):
+        self.conn = conn
+        self.scenario_id = scenario_id
+        self.max_datasets = max_datasets
+        self.resource_attr_ids = resource_attr_ids
+        self.nfetched = 0
+        self._pages = OrderedDict()
+        self._size = 0
+        self._types = dict()
+        self._typed_attrs = set()
+        self._pinned = None
+
+    def begin_layer(self):
+        """Pin the pages used from now on until end_layer() is called.
+        """
+        self._pinned = set()
+
+    def end_layer(self):
+        """Release the pinned pages and drop pages above the limit.
+        """
+        self._pinned = None
+        self._evict()
+
+    def get(self, attr_id, resource_attr_id):
+        """Return the dataset of a resource attribute or None if there is no
+        data for it in the scenario.
+        """
+        if self._pinned is not None:
+            self._pinned.add(attr_id)
+        return self._page(attr_id).get(resource_attr_id)
+
+    def get_type(self, attr_id, resource_attr_id):
+        """Return the dataset type of a resource attribute. This does not pin
+        the page of the attribute.
+        """
+        if attr_id not in self._typed_attrs:
+            self._page(attr_id)
+        return self._types.get(resource_attr_id)
+
+    def _page(self, attr_id):
+        page = self._pages.pop(attr_id, None)
+        if page is None:
+            page = self._fetch(attr_id)
+            self._size += len(page)
+        self._pages[attr_id] = page
+        self._evict()
+        return page
+
+    def _evict(self):
+        """Drop the least recently used pages which are not pinned until the
+        cache holds at most max_datasets datasets or a single page.
+        """
+        for attr_id in list(self._pages.keys()):
+            if self._size <= self.max_datasets or len(self._pages) <= 1:
+                break
+            if self._pinned is not None and attr_id in self._pinned:
+                continue
+            self._size -= len(self._pages.pop(attr_id))
+
+    def _fetch(self, attr_id):
+        res_scens = self.conn.call('get_attribute_datasets',
+                                   {'attr_id': attr_id,
+                                    'scenario_id': self.scenario_id})
+        self.nfetched += 1
+        page = dict()
+        for res_scen in res_scens:
+            if self.resource_attr_ids is not None and \
+                    res_scen['resource_attr_id'] not in self.resource_attr_ids:
+                continue
+            page[res_scen['resource_attr_id']] = res_scen['value']
+            self._types[res_scen['resource_attr_id']] = \
+                res_scen['value']['type']
+        self._typed_attrs.add(attr_id)
+        return page
+
+
+class LazyAttribute(object):
+    """A resource attribute whose data is only loaded from a DatasetCache
+    when its value or dataset type is accessed. It offers the same fields as
+    the attributes created by HydraResource.add_attribute().
+    """
+
+    def __init__(self, attr, res_attr, cache):
+        self.name = attr.name
+        self.attr_id = attr.id
+        self.resource_attr_id = res_attr['id']
+        self.is_var = res_attr['attr_is_var']
+        self._cache = cache
+        self._value = None
+        self._value_set = False
+
+    def _dataset(self):
+        return self._cache.get(self.attr_id, self.resource_attr_id)
+
+    @property
+    def dataset_id(self):
+        dataset = self._dataset()
+        return dataset['id'] if dataset is not None else None
+
+    @property
+    def dataset_type(self):
+        return self._cache.get_type(self.attr_id, self.resource_attr_id)
+
+    @property
+    def value(self):
+        if self._value_set:
+            return self._value
+        dataset = self._dataset()
+        return dataset['value'] if dataset is not None else None
+
+    @value.setter
+    def value(self, value):
+        self._value = value
+        self._value_set = True
@@ -22,8 +22,15 @@
 import os
 import sys
 import json
+import hashlib
 import warnings
 
+from collections import OrderedDict
+
+from osgeo import osr
+
+from app_cache import cache_path
+
 if sys.version.startswith('2'):
     import urllib as ul
     import urllib2 as ul2
@@ -32,6 +39,92 @@ elif sys.version.startswith('3'):
     import urllib.request as ul2
 
 
+class EPSGCache(object):
+    """A persistent least recently used cache of EPSG lookups, keyed by the
+    hash of the normalised WKT. The cache is kept in a JSON file and holds at
+    most max_entries lookups. The file is read once and only written when a
+    new lookup is added; use default_cache() to share one cache.
+    """
+
+    def __init__(self, filename=None, max_entries=256):
+        if filename is None:
+            filename = cache_path('epsg_cache.json')
+        self.filename = filename
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        if os.path.exists(self.filename):
+            try:
+                with open(self.filename) as cachefile:
+                    self._entries = json.load(cachefile,
+                                              object_pairs_hook=OrderedDict)
+            except (ValueError, IOError, OSError):
+                warnings.warn('Ignoring unreadable EPSG cache %s.' %
+                              self.filename)
+
+    def get(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._entries[key] = entry
+        return entry
+
+    def put(self, key, entry):
+        self._entries.pop(key, None)
+        self._entries[key] = entry
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+        try:
+            with open(self.filename, 'w') as cachefile:
+                json.dump(self._entries, cachefile)
+        except (IOError, OSError):
+            warnings.warn('Could not write EPSG cache %s.' % self.filename)
+
+
+_default_cache = None
+
+
+def default_cache():
+    """Return the EPSGCache shared by all lookups without a given cache.
+    """
+    global _default_cache
+    if _default_cache is None:
+        _default_cache = EPSGCache()
+    return _default_cache
+
+
+def normalize_wkt(wkt):
+    """Parse an (ESRI or OGC) WKT string and return the spatial reference
+    and its WKT as written by OSR, which does not depend on formatting.
+    """
+    srs = osr.SpatialReference()
+    if srs.SetFromUserInput(wkt.strip()) != 0:
+        return None, None
+    if srs.GetAuthorityName(None) is None:
+        srs.MorphFromESRI()
+    return srs, srs.ExportToWkt()
+
+
+def offline_lookup(srs, min_confidence=70):
+    """Identify the EPSG codes of a spatial reference using the EPSG database
+    of GDAL/PROJ. The result has the same format as wkt_lookup().
+    """
+    if srs.AutoIdentifyEPSG() == 0 and \
+            srs.GetAuthorityCode(None) is not None:
+        return {u'exact': True,
+                u'codes': [{u'code': srs.GetAuthorityCode(None)}]}
+
+    if not hasattr(srs, 'FindMatches'):
+        return None
+    matches = [(match, confidence) for match, confidence in srs.FindMatches()
+               if confidence >= min_confidence and
+               match.GetAuthorityName(None) == 'EPSG']
+    if len(matches) == 0:
+        return None
+    matches.sort(key=lambda match: -match[1])
+    return {u'exact': len(matches) == 1 or matches[0][1] > matches[1][1],
+            u'codes': [{u'code': match.GetAuthorityCode(None)}
+                       for match, confidence in matches]}
+
+
 def wkt_lookup(searchstring):
     baseurl = 'http://prj2epsg.org/search.json?'
     searchstring = ul.urlencode({'terms': searchstring})
@@ -44,14 +137,40 @@ def wkt_lookup(searchstring):
         return None
 
 
-def prj2epsg(prjfile):
+def prj2epsg(prjfile, online=False, cache=None):
+    """Find the EPSG code(s) of the projection defined in a .prj file, see
+    wkt2epsg().
+    """
     prjfile = os.path.abspath(os.path.expanduser(prjfile))
     prj = open(prjfile)
-    response = wkt_lookup(prj.read())
+    wkt = prj.read()
     prj.close()
+    return wkt2epsg(wkt, online=online, cache=cache)
+
+
+def wkt2epsg(wkt, online=False, cache=None):
+    """Find the EPSG code(s) of a projection given as WKT. The projection is
+    matched against the EPSG database of GDAL/PROJ first. If this fails and
+    online is True, prj2epsg.org is queried. Results are kept in an
+    EPSGCache, by default the shared one of default_cache().
+    """
+    srs, normalized_wkt = normalize_wkt(wkt)
+    if normalized_wkt is None:
+        normalized_wkt = ' '.join(wkt.split())
+    key = hashlib.sha1(normalized_wkt.encode('utf-8')).hexdigest()
+
+    if cache is None:
+        cache = default_cache()
+    response = cache.get(key)
 
     if response is None:
-        return None
+        if srs is not None:
+            response = offline_lookup(srs)
+        if response is None and online:
+            response = wkt_lookup(wkt)
+        if response is None:
+            return None
+        cache.put(key, response)
 
     if not response[u'exact']:
         warnings.warn('No unique result found.')
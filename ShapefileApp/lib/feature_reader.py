@@ -0,0 +1,292 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+#    Copyright (c) 2016, Philipp Meier
+#
+#    This file is part of the Hydra Platform ShapefileApp (HydraShapefileApp).
+#
+#    HydraShapefileApp is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by the
+#    Free Software Foundation, either version 3 of the License, or (at your
+#    option) any later version.
+#
+#    HydraShapefileApp is distributed in the hope that it will be useful, but
+#    WITHOUT ANY WARRANTY; without even the implied warranty of MERCHANTABILITY
+#    or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public License
+#    for more details.
+#
+#    You should have received a copy of the GNU General Public License along
+#    with HydraShapefileApp.  If not, see <http://www.gnu.org/licenses/>.
+
+
+from array import array
+
+from osgeo import ogr
+
+from HydraLib.PluginLib import HydraPluginError
+
+
+def set_filters(layer, attribute_filter=None, spatial_filter=None):
+    """Set the filters of an OGR layer. The attribute filter is an OGR SQL
+    WHERE clause, the spatial filter either an ogr.Geometry, a WKT string or
+    a tuple (minx, miny, maxx, maxy) in layer coordinates. Both filters are
+    evaluated by OGR, so features outside of them are never handed to
+    Python.
+    """
+    if layer.SetAttributeFilter(attribute_filter) != 0:
+        raise HydraPluginError("Invalid attribute filter '%s'." %
+                               attribute_filter)
+
+    if spatial_filter is None:
+        layer.SetSpatialFilter(None)
+    elif isinstance(spatial_filter, ogr.Geometry):
+        layer.SetSpatialFilter(spatial_filter)
+    elif hasattr(spatial_filter, 'upper'):
+        layer.SetSpatialFilter(ogr.CreateGeometryFromWkt(spatial_filter))
+    else:
+        layer.SetSpatialFilterRect(*spatial_filter)
+
+
+def read_features(layer, attribute_filter=None, spatial_filter=None):
+    """Iterate over the features of an OGR layer using its sequential read
+    cursor. Unlike GetFeature(fid) this does not depend on contiguous feature
+    IDs and avoids random access through the index file. See set_filters()
+    for the filters.
+    """
+    set_filters(layer, attribute_filter, spatial_filter)
+    return _next_features(layer)
+
+
+def _next_features(layer):
+    layer.ResetReading()
+    feature = layer.GetNextFeature()
+    while feature is not None:
+        yield feature
+        feature = layer.GetNextFeature()
+
+
+_FIELD_GETTERS = {
+    ogr.OFTInteger: ogr.Feature.GetFieldAsInteger,
+    ogr.OFTInteger64: ogr.Feature.GetFieldAsInteger64,
+    ogr.OFTReal: ogr.Feature.GetFieldAsDouble,
+}
+
+
+def field_schema(layer_defn):
+    """Return a list of (index, name, getter) tuples for all fields of a layer
+    definition. The getter is the typed ogr.Feature accessor matching the
+    field type; everything that is neither integer nor real is read as string.
+    """
+    schema = []
+    for i in range(layer_defn.GetFieldCount()):
+        field_defn = layer_defn.GetFieldDefn(i)
+        getter = _FIELD_GETTERS.get(field_defn.GetType(),
+                                    ogr.Feature.GetFieldAsString)
+        schema.append((i, field_defn.GetName(), getter))
+    return schema
+
+
+class FeatureBatch(object):
+    """The features of one layer in a compact and picklable form.
+
+    Coordinates of all vertices are stored in one flat array (x0, y0, x1,
+    y1, ...). For lines, part_offsets holds the index of the first vertex of
+    every part and feature_offsets the index of the first part of every
+    feature, each with a trailing end marker. Field values are stored as one
+    tuple per feature in the order of field_names.
+
+    A layer may be split into several batches; layer_size is the number of
+    features of the whole layer (None if unknown).
+    """
+
+    def __init__(self, filename, layer_name, srs_wkt, field_names,
+                 geometry_type, layer_size=None):
+        self.filename = filename
+        self.layer_name = layer_name
+        self.layer_size = layer_size
+        self.srs_wkt = srs_wkt
+        self.field_names = field_names
+        self.geometry_type = geometry_type
+        self.coords = array('d')
+        self.part_offsets = array('l', [0])
+        self.feature_offsets = array('l', [0])
+        self.multi = array('b')
+        self.values = []
+
+    def __len__(self):
+        return len(self.values)
+
+    def add_feature(self, geometry, values):
+        if geometry is None:
+            raise HydraPluginError("Feature without geometry in %s." %
+                                   self.filename)
+        geom_type = ogr.GT_Flatten(geometry.GetGeometryType())
+        if self.geometry_type == 'Point':
+            if geom_type != ogr.wkbPoint:
+                raise HydraPluginError(
+                    "Wrong geometry type %s (should be 'Point')" %
+                    geometry.GetGeometryName())
+            self.coords.append(geometry.GetX())
+            self.coords.append(geometry.GetY())
+        else:
+            if geom_type == ogr.wkbLineString:
+                parts = [geometry]
+                self.multi.append(0)
+            elif geom_type == ogr.wkbMultiLineString:
+                parts = [geometry.GetGeometryRef(i)
+                         for i in range(geometry.GetGeometryCount())]
+                self.multi.append(1)
+            else:
+                raise HydraPluginError(
+                    "Wrong geometry type %s (should be 'LineString')" %
+                    geometry.GetGeometryName())
+            for part in parts:
+                for i in range(part.GetPointCount()):
+                    self.coords.append(part.GetX(i))
+                    self.coords.append(part.GetY(i))
+                self.part_offsets.append(len(self.coords) // 2)
+            self.feature_offsets.append(len(self.part_offsets) - 1)
+        self.values.append(values)
+
+    def transform(self, transformation, chunk_size=100000):
+        """Transform all coordinates with an osr.CoordinateTransformation.
+        Coordinates are passed to TransformPoints in chunks of chunk_size
+        points instead of one by one.
+        """
+        coords = array('d')
+        npoints = len(self.coords) // 2
+        for start in range(0, npoints, chunk_size):
+            end = min(start + chunk_size, npoints)
+            points = [(self.coords[2 * i], self.coords[2 * i + 1])
+                      for i in range(start, end)]
+            for point in transformation.TransformPoints(points):
+                coords.append(point[0])
+                coords.append(point[1])
+        self.coords = coords
+
+    def properties(self, i):
+        return dict(zip(self.field_names, self.values[i]))
+
+    def iter_points(self):
+        """Yield x, y and the properties of every point feature.
+        """
+        coords = self.coords
+        for i in range(len(self.values)):
+            yield coords[2 * i], coords[2 * i + 1], self.properties(i)
+
+    def iter_lines(self):
+        """Yield a GeoJSON-like geometry dict and the properties of every
+        line feature.
+        """
+        coords = self.coords
+        for i in range(len(self.values)):
+            parts = []
+            for p in range(self.feature_offsets[i],
+                           self.feature_offsets[i + 1]):
+                parts.append([(coords[2 * v], coords[2 * v + 1])
+                              for v in range(self.part_offsets[p],
+                                             self.part_offsets[p + 1])])
+            if self.multi[i]:
+                geometry = dict(type='MultiLineString', coordinates=parts)
+            else:
+                geometry = dict(type='LineString', coordinates=parts[0])
+            yield geometry, self.properties(i)
+
+
+def read_batch(layer, geometry_type, filename=None, attribute_filter=None,
+               spatial_filter=None):
+    """Read the features of a layer into a FeatureBatch. The geometry type is
+    either 'Point' or 'LineString'.
+    """
+    return next(iter_batches(layer, geometry_type, filename=filename,
+                             attribute_filter=attribute_filter,
+                             spatial_filter=spatial_filter))
+
+
+def iter_batches(layer, geometry_type, filename=None, attribute_filter=None,
+                 spatial_filter=None, chunk_size=None):
+    """Read the features of a layer into FeatureBatches of at most chunk_size
+    features, or into a single batch if chunk_size is None. At least one
+    (possibly empty) batch is yielded per layer.
+    """
+    srs = layer.GetSpatialRef()
+    srs_wkt = srs.ExportToWkt() if srs is not None else None
+    schema = field_schema(layer.GetLayerDefn())
+    field_names = [name for i, name, getter in schema]
+    set_filters(layer, attribute_filter, spatial_filter)
+    # Counting may move the read cursor, so it has to happen before reading
+    layer_size = None
+    if chunk_size is not None:
+        layer_size = layer.GetFeatureCount()
+        if layer_size < 0:
+            layer_size = None
+
+    batch = FeatureBatch(filename, layer.GetName(), srs_wkt, field_names,
+                         geometry_type, layer_size)
+    nbatches = 0
+    for feature in _next_features(layer):
+        values = tuple([getter(feature, i) if feature.IsFieldSet(i) else None
+                        for i, name, getter in schema])
+        batch.add_feature(feature.GetGeometryRef(), values)
+        if len(batch) == chunk_size:
+            nbatches += 1
+            yield batch
+            batch = FeatureBatch(filename, layer.GetName(), srs_wkt,
+                                 field_names, geometry_type, layer_size)
+    if chunk_size is None:
+        batch.layer_size = len(batch)
+    if len(batch) > 0 or nbatches == 0:
+        yield batch
+
+
+def _layer_matches(layer, geometry_type):
+    layer_type = ogr.GT_Flatten(layer.GetGeomType())
+    if geometry_type == 'Point':
+        return layer_type in (ogr.wkbUnknown, ogr.wkbPoint)
+    return layer_type in (ogr.wkbUnknown, ogr.wkbLineString,
+                          ogr.wkbMultiLineString)
+
+
+def read_file_batches(filename, geometry_type, attribute_filter=None,
+                      spatial_filter=None, driver=None):
+    """Read all layers of a file into a list of FeatureBatches, one per
+    layer. See iter_file_batches().
+    """
+    return list(iter_file_batches(filename, geometry_type,
+                                  attribute_filter=attribute_filter,
+                                  spatial_filter=spatial_filter,
+                                  driver=driver))
+
+
+def iter_file_batches(filename, geometry_type, attribute_filter=None,
+                      spatial_filter=None, driver=None, chunk_size=None):
+    """Read the layers of a file into FeatureBatches of at most chunk_size
+    features (see iter_batches()). The file is opened with the given OGR
+    driver or, if None, any driver that can read it. If a file holds more
+    than one layer (e.g. a GeoPackage), only layers of the requested
+    geometry type are read.
+    """
+    if driver is not None:
+        datasource = ogr.GetDriverByName(driver).Open(filename)
+    else:
+        datasource = ogr.Open(filename)
+    if datasource is None:
+        raise HydraPluginError("Shapefile %s not readable!!!" % filename)
+    layers = [datasource.GetLayer(nl)
+              for nl in range(datasource.GetLayerCount())]
+    if len(layers) > 1:
+        layers = [layer for layer in layers
+                  if _layer_matches(layer, geometry_type)]
+    for layer in layers:
+        for batch in iter_batches(layer, geometry_type, filename=filename,
+                                  attribute_filter=attribute_filter,
+                                  spatial_filter=spatial_filter,
+                                  chunk_size=chunk_size):
+            yield batch
+
+
+def read_file_task(args):
+    """Call read_file_batches() with a tuple of arguments. This is the
+    function run by the worker processes of a parallel import.
+    """
+    return read_file_batches(*args)
@@ -0,0 +1,64 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+#    Copyright (c) 2016, Philipp Meier
+#
+#    This file is part of the Hydra Platform ShapefileApp (HydraShapefileApp).
+#
+#    HydraShapefileApp is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by the
+#    Free Software Foundation, either version 3 of the License, or (at your
+#    option) any later version.
+#
+#    HydraShapefileApp is distributed in the hope that it will be useful, but
+#    WITHOUT ANY WARRANTY; without even the implied warranty of MERCHANTABILITY
+#    or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public License
+#    for more details.
+#
+#    You should have received a copy of the GNU General Public License along
+#    with HydraShapefileApp.  If not, see <http://www.gnu.org/licenses/>.
+
+
+from collections import OrderedDict
+
+from HydraLib.PluginLib import HydraPluginError
+
+
+class DataFormat(object):
+    """A file format networks are imported from and exported to, backed by
+    an OGR driver.
+
+    Formats with single_file=True hold all layers of a network in one file,
+    the others one layer per file. Layers are created with the given layer
+    creation options and written in transactions of transaction_size
+    features (None means one transaction per layer).
+    """
+
+    def __init__(self, name, driver, extension, single_file=False,
+                 layer_options=None, transaction_size=10000):
+        self.name = name
+        self.driver = driver
+        self.extension = extension
+        self.single_file = single_file
+        self.layer_options = layer_options if layer_options is not None \
+            else []
+        self.transaction_size = transaction_size
+
+
+FORMATS = OrderedDict([
+    ('shapefile', DataFormat('shapefile', 'ESRI Shapefile', '.shp')),
+    ('gpkg', DataFormat('gpkg', 'GPKG', '.gpkg', single_file=True,
+                        layer_options=['SPATIAL_INDEX=YES'],
+                        transaction_size=None)),
+    ('fgb', DataFormat('fgb', 'FlatGeobuf', '.fgb',
+                       layer_options=['SPATIAL_INDEX=YES'])),
+])
+
+
+def get_format(name):
+    """Return the DataFormat of a given name (see FORMATS).
+    """
+    if name not in FORMATS:
+        raise HydraPluginError("Unknown format %s, use one of %s." %
+                               (name, ', '.join(FORMATS.keys())))
+    return FORMATS[name]
@@ -0,0 +1,100 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+#    Copyright (c) 2016, Philipp Meier
+#
+#    This file is part of the Hydra Platform ShapefileApp (HydraShapefileApp).
+#
+#    HydraShapefileApp is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by the
+#    Free Software Foundation, either version 3 of the License, or (at your
+#    option) any later version.
+#
+#    HydraShapefileApp is distributed in the hope that it will be useful, but
+#    WITHOUT ANY WARRANTY; without even the implied warranty of MERCHANTABILITY
+#    or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public License
+#    for more details.
+#
+#    You should have received a copy of the GNU General Public License along
+#    with HydraShapefileApp.  If not, see <http://www.gnu.org/licenses/>.
+
+
+import struct
+import binascii
+
+WKB_POINT = 1
+WKB_LINESTRING = 2
+WKB_MULTILINESTRING = 5
+
+
+def _linestring_wkb(coords):
+    flat = []
+    for coord in coords:
+        flat.append(coord[0])
+        flat.append(coord[1])
+    return struct.pack('<BII%dd' % len(flat), 1, WKB_LINESTRING,
+                       len(coords), *flat)
+
+
+def geometry_to_wkb(geometry):
+    """Encode a GeoJSON-like Point, LineString or MultiLineString dict as
+    2D little endian WKB, without going through a text representation.
+    """
+    coords = geometry['coordinates']
+    if geometry['type'] == 'Point':
+        return struct.pack('<BIdd', 1, WKB_POINT, coords[0], coords[1])
+    elif geometry['type'] == 'LineString':
+        return _linestring_wkb(coords)
+    elif geometry['type'] == 'MultiLineString':
+        return struct.pack('<BII', 1, WKB_MULTILINESTRING, len(coords)) + \
+            b''.join([_linestring_wkb(part) for part in coords])
+    raise ValueError("Unsupported geometry type %s." % geometry['type'])
+
+
+def wkb_bytes(wkb):
+    """Return WKB as bytes, decoding it first if it is given as hex string
+    (which is how WKB is stored in a JSON layout).
+    """
+    if wkb[:1] in (b'\x00', b'\x01'):
+        return wkb
+    return binascii.unhexlify(wkb)
+
+
+def wkb_hex(wkb):
+    """Return WKB as hex string.
+    """
+    if wkb[:1] in (b'\x00', b'\x01'):
+        return binascii.hexlify(wkb).decode('ascii')
+    return wkb
+
+
+def _read_linestring(wkb, offset):
+    order = '<' if wkb[offset:offset + 1] == b'\x01' else '>'
+    geom_type, npoints = struct.unpack_from(order + 'II', wkb, offset + 1)
+    if geom_type != WKB_LINESTRING:
+        raise ValueError("Expected a 2D LineString in WKB.")
+    flat = struct.unpack_from('%s%dd' % (order, 2 * npoints), wkb,
+                              offset + 9)
+    coords = [(flat[2 * i], flat[2 * i + 1]) for i in range(npoints)]
+    return coords, offset + 9 + 16 * npoints
+
+
+def wkb_to_geometry(wkb):
+    """Decode 2D LineString or MultiLineString WKB (bytes or hex) into a
+    GeoJSON-like dict.
+    """
+    wkb = wkb_bytes(wkb)
+    order = '<' if wkb[:1] == b'\x01' else '>'
+    geom_type, = struct.unpack_from(order + 'I', wkb, 1)
+    if geom_type == WKB_LINESTRING:
+        coords, offset = _read_linestring(wkb, 0)
+        return dict(type='LineString', coordinates=coords)
+    elif geom_type == WKB_MULTILINESTRING:
+        nparts, = struct.unpack_from(order + 'I', wkb, 5)
+        offset = 9
+        parts = []
+        for i in range(nparts):
+            coords, offset = _read_linestring(wkb, offset)
+            parts.append(coords)
+        return dict(type='MultiLineString', coordinates=parts)
+    raise ValueError("Unsupported WKB geometry type %s." % geom_type)
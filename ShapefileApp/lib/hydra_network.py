@@ -19,20 +19,76 @@
 #    with HydraShapefileApp.  If not, see <http://www.gnu.org/licenses/>.
 
 
+import os
+import json
+import time
+import hashlib
 import warnings
 
 from datetime import datetime
+from multiprocessing.pool import ThreadPool
 
 from HydraLib.PluginLib import HydraResource
 from HydraLib.PluginLib import JsonConnection
 from HydraLib.PluginLib import HydraPluginError
 
+from spatial_index import NodeGridIndex
+from incremental_upload import IncrementalUpload
+from network_payload import NetworkPayload
+from network_store import NodeStore
+from network_store import LinkStore
+from dataset_cache import DatasetCache
+from dataset_cache import LazyAttribute
+from geometry_wkb import wkb_to_geometry
+from name_registry import NameRegistry
+from transport import post_stream
+from transport import HydraTransport
+from app_cache import cache_path
+from profiler import Profiler
+from progress import ProgressReporter
+
+
+def resource_envelope(resource):
+    """Return the bounding box (minx, miny, maxx, maxy) of a node or of a
+    link and its layout geometry.
+    """
+    if not hasattr(resource, 'start_node'):
+        return resource.x, resource.y, resource.x, resource.y
+
+    xs = [resource.start_node.x, resource.end_node.x]
+    ys = [resource.start_node.y, resource.end_node.y]
+    layout = resource.layout
+    geometry = None
+    if isinstance(layout, dict):
+        if layout.get('wkb') is not None:
+            geometry = wkb_to_geometry(layout['wkb'])
+        else:
+            geometry = layout.get('geometry')
+    if geometry is not None:
+        if geometry['type'] == 'MultiLineString':
+            parts = geometry['coordinates']
+        else:
+            parts = [geometry['coordinates']]
+        for part in parts:
+            for coord in part:
+                xs.append(coord[0])
+                ys.append(coord[1])
+    return min(xs), min(ys), max(xs), max(ys)
+
 
 class HydraNetwork(HydraResource):
 
-    def __init__(self, url=None, username=None, password=None):
+    def __init__(self, url=None, username=None, password=None,
+                 snap_tolerance=None, compact=False, transport=None,
+                 compress_requests=False, profiler=None, progress=None):
         super(HydraNetwork, self).__init__()
-        self.conn = JsonConnection(url=url, app_name='ShapefileApp')
+        # All calls go through a transport (see HydraTransport), which can be
+        # replaced, e.g. by one connected to a local test server.
+        if transport is None:
+            transport = HydraTransport(JsonConnection(url=url,
+                                                      app_name='ShapefileApp'),
+                                       compress_requests=compress_requests)
+        self.conn = transport
         self.url = url
         self.username = username
         self.password = password
@@ -41,17 +97,40 @@ class HydraNetwork(HydraResource):
         self.hydra_network = None
         self.hydra_scenario = None
         self.hydra_attributes = None
+        self.upload = None
+        self.dataset_cache = None
+        self._include_attrs = None
+        self._exclude_attrs = set()
+        # Measures the phases of imports and exports, disabled by default
+        self.profiler = profiler if profiler is not None else Profiler()
+        # Reports the progress of long running phases, silent by default
+        self.progress = progress if progress is not None \
+            else ProgressReporter()
 
         self.attrs = dict()
         self.attr_ids = dict()
         self.epsg = None
-        self.nodes = dict()
-        self.links = []
-
-        self.link_names = dict()
-        self.node_names = dict()
-
-        self._node_coord_index = dict()
+        # The compact stores keep large networks in columnar form (see
+        # NodeStore), they behave like the dict and list otherwise used.
+        if compact:
+            self.nodes = NodeStore()
+            self.links = LinkStore(self.nodes)
+        else:
+            self.nodes = dict()
+            self.links = []
+
+        # Node and link names, unique regardless of case
+        self.link_names = NameRegistry()
+        self.node_names = NameRegistry()
+
+        # Nodes within snap_tolerance (in map units) of a coordinate are
+        # considered to be located at this coordinate. Without a tolerance,
+        # nodes created from link endpoints are matched exactly and
+        # endpoints are snapped to existing nodes within
+        # default_snap_tolerance().
+        self.snap_tolerance = snap_tolerance
+        self._node_coords = dict()
+        self._node_index = None
 
     def login(self):
         if self.username is not None and self.password is not None:
@@ -60,37 +139,107 @@ class HydraNetwork(HydraResource):
         else:
             self.session_id = self.conn.login()
 
+    def invalidate_tree(self):
+        """Remove the project of the network from the tree cache of the user
+        (see HydraNetworkTree), so the next tree lists the saved network.
+        """
+        if self.project is not None and 'id' in self.project:
+            project_id = self.project['id']
+        elif self.hydra_network is not None and \
+                'project_id' in self.hydra_network:
+            project_id = self.hydra_network['project_id']
+        else:
+            return
+        TreeCache(tree_cache_file(self.url, self.username)).invalidate(
+            project_id)
+
     def load_attributes(self):
         self.hydra_attributes = self.conn.call('get_all_attributes', {})
         for attr in self.hydra_attributes:
             self.attrs[attr.id] = attr
             self.attr_ids[attr.name] = attr.id
 
-    def load_network(self, network_id, scenario_id):
+    def create_attributes(self, names):
+        """Create all attributes of a list of names that are not known to the
+        server yet with one single call.
+        """
+        missing = sorted(set([name for name in names
+                              if self.attr_ids.get(name) is None]))
+        if len(missing) == 0:
+            return
+
+        new_attrs = self.conn.call('add_attributes',
+                                   {'attrs': [dict(name=name)
+                                              for name in missing]})
+        for attr in new_attrs:
+            self.attrs[attr.id] = attr
+            self.attr_ids[attr.name] = attr.id
+
+    def attribute_names(self):
+        """Return the names of all attributes used by the resources of the
+        network. Overload this function to create missing attributes before
+        the network is saved.
+        """
+        return set()
+
+    def load_network(self, network_id, scenario_id, lazy=False,
+                     cache_size=1000000, include_attrs=None,
+                     exclude_attrs=None, types=None, bbox=None):
         """Load a network from HydraPlatform.
+
+        With lazy=True only the topology of the network is loaded at first.
+        The data of an attribute is fetched from the server the first time a
+        value of this attribute is accessed, and kept in a DatasetCache
+        holding at most cache_size datasets.
+
+        The network can be restricted to the attributes listed in
+        include_attrs (or to all except those in exclude_attrs), to nodes and
+        links of the given types and to resources intersecting a bounding box
+        (minx, miny, maxx, maxy). Resources and attributes are filtered
+        before any data is requested, so any of these filters implies lazy
+        loading; only the data of the selected attributes of the selected
+        resources is ever kept.
         """
+        self._include_attrs = set(include_attrs) \
+            if include_attrs is not None else None
+        self._exclude_attrs = set(exclude_attrs) \
+            if exclude_attrs is not None else set()
+        if include_attrs is not None or exclude_attrs is not None or \
+                types is not None or bbox is not None:
+            lazy = True
+
         if self.project is None:
             self.load_project(network_id=network_id)
 
-        self.hydra_network = self.conn.call('get_network',
-                                            {'network_id': network_id,
-                                             'include_data': 'Y'})
+        with self.profiler.phase('get_network'):
+            self.hydra_network = self.conn.call('get_network',
+                                                {'network_id': network_id,
+                                                 'include_data':
+                                                 'N' if lazy else 'Y'})
 
         self.load_attributes()
+        with self.profiler.phase('build_network', hot=True):
+            self._build_network(scenario_id, lazy, cache_size, types, bbox)
+        self.profiler.count('nodes_loaded', len(self.nodes))
+        self.profiler.count('links_loaded', len(self.links))
 
+    def _build_network(self, scenario_id, lazy, cache_size, types, bbox):
+        """Create nodes and links from the network returned by the server.
+        """
         for scenario in self.hydra_network['scenarios']:
             if scenario['id'] == scenario_id:
                 self.hydra_scenario = scenario
                 break
 
-        res_scen_dict = dict()
-        for res_scen in self.hydra_scenario['resourcescenarios']:
-            res_scen_dict.update({res_scen['resource_attr_id']: res_scen})
-
-        # Create node index
-        node_dict = dict()
-        for node in self.hydra_network['nodes']:
-            node_dict.update({node['id']: node})
+        if lazy:
+            res_scen_dict = None
+            self.dataset_cache = DatasetCache(self.conn, scenario_id,
+                                              max_datasets=cache_size,
+                                              resource_attr_ids=set())
+        else:
+            res_scen_dict = dict()
+            for res_scen in self.hydra_scenario['resourcescenarios']:
+                res_scen_dict.update({res_scen['resource_attr_id']: res_scen})
 
         self.name = self.hydra_network['name']
         self.description = self.hydra_network['description']
@@ -104,49 +253,72 @@ class HydraNetwork(HydraResource):
 
         # Add network attributes
         for res_attr in self.hydra_network['attributes']:
-            if res_scen_dict.get(res_attr['id']) is not None:
-                res_scen = res_scen_dict[res_attr['id']]
-                self.add_attribute(self.attrs[res_attr['attr_id']],
-                                   res_attr, res_scen)
-            else:
-                self.add_attribute(self.attrs[res_attr['attr_id']],
-                                   res_attr, None)
+            self._load_attribute(self, res_attr, res_scen_dict)
 
-        # Add nodes and attributes
+        # Add nodes and attributes. Nodes which are not selected are still
+        # created without attributes, links may need them.
+        all_nodes = dict()
+        selected = []
         for node in self.hydra_network['nodes']:
             n_node = HydraNode(x=float(node['x']), y=float(node['y']))
             n_node.name = node['name']
             n_node.layout = node['layout']
             n_node.id = node['id']
             n_node.types = node['types']
+            all_nodes[n_node.id] = n_node
+            if not self._selected_resource(n_node, types, bbox):
+                continue
             for res_attr in node['attributes']:
-                if res_scen_dict.get(res_attr['id']) is not None:
-                    res_scen = res_scen_dict[res_attr['id']]
-                    n_node.add_attribute(self.attrs[res_attr['attr_id']],
-                                         res_attr, res_scen)
-                else:
-                    n_node.add_attribute(self.attrs[res_attr['attr_id']],
-                                         res_attr, None)
-            self.add_node(n_node)
+                self._load_attribute(n_node, res_attr, res_scen_dict)
+            selected.append(n_node)
+        self.add_nodes(selected)
 
         # Add segments and attributes
+        selected = []
         for link in self.hydra_network['links']:
-            n_link = HydraLink(start_node=self.nodes[link['node_1_id']],
-                               end_node=self.nodes[link['node_2_id']])
+            n_link = HydraLink(start_node=all_nodes[link['node_1_id']],
+                               end_node=all_nodes[link['node_2_id']])
             n_link.name = link['name']
             n_link.layout = link['layout']
             n_link.id = link['id']
             n_link.types = link['types']
+            if not self._selected_resource(n_link, types, bbox):
+                continue
             for res_attr in link['attributes']:
-                if res_scen_dict.get(res_attr['id']) is not None:
-                    res_scen = res_scen_dict[res_attr['id']]
-                    n_link.add_attribute(self.attrs[res_attr['attr_id']],
-                                         res_attr, res_scen)
-                else:
-                    n_link.add_attribute(self.attrs[res_attr['attr_id']],
-                                         res_attr, None)
+                self._load_attribute(n_link, res_attr, res_scen_dict)
+            selected.append(n_link)
+        self.add_links(selected)
 
-            self.add_link(n_link)
+    def _selected_resource(self, resource, types=None, bbox=None):
+        """Check if a node or link has one of the given types and intersects
+        the bounding box.
+        """
+        if types is not None:
+            if not set([t['name'] for t in resource.types]) & set(types):
+                return False
+        if bbox is not None:
+            minx, miny, maxx, maxy = resource_envelope(resource)
+            if maxx < bbox[0] or minx > bbox[2] or \
+                    maxy < bbox[1] or miny > bbox[3]:
+                return False
+        return True
+
+    def _load_attribute(self, resource, res_attr, res_scen_dict):
+        """Add a resource attribute and its data to a resource. Without an
+        index of resource scenarios, the data is loaded lazily.
+        """
+        attr = self.attrs[res_attr['attr_id']]
+        if attr.name in self._exclude_attrs or \
+                (self._include_attrs is not None and
+                 attr.name not in self._include_attrs):
+            return
+        if res_scen_dict is None:
+            self.dataset_cache.resource_attr_ids.add(res_attr['id'])
+            resource.attributes.append(LazyAttribute(attr, res_attr,
+                                                     self.dataset_cache))
+        else:
+            resource.add_attribute(attr, res_attr,
+                                   res_scen_dict.get(res_attr['id']))
 
     def load_project(self, project_id=None, network_id=None):
         """Load a project by its ID or by a network ID.
@@ -170,27 +342,94 @@ class HydraNetwork(HydraResource):
                                       {'project': self.project})
 
     def add_node(self, node):
-        if self.node_names.get(node.name.lower()) is not None:
-            add_string = ' (%s)' % self.node_names[node.name.lower()]
-            self.node_names[node.name.lower()] += 1
-            node.name += add_string
-        else:
-            self.node_names[node.name.lower()] = 1
+        node.name = self.node_names.register(node.name)
         self.nodes[node.id] = node
-        self._node_coord_index[(node.x, node.y)] = node.id
+        self._index_node(node)
+
+    def add_nodes(self, nodes):
+        """Add a list of nodes, registering all their names at once.
+        """
+        names = self.node_names.register_all([node.name for node in nodes])
+        for node, name in zip(nodes, names):
+            node.name = name
+            self.nodes[node.id] = node
+            self._index_node(node)
+
+    def _index_node(self, node):
+        self._node_coords.setdefault((node.x, node.y), node.id)
+        if self._node_index is not None:
+            self._node_index.insert(node.x, node.y, node.id)
+
+    def default_snap_tolerance(self):
+        """Return the tolerance used to snap link endpoints to existing nodes
+        if no snap_tolerance is set. Endpoints are matched exactly by
+        default.
+        """
+        return 0.
+
+    def find_node(self, x, y, exact=False):
+        """Return the node at (x, y) or, unless exact=True, the node closest
+        to (x, y) within the snapping tolerance. Returns None if there is no
+        such node.
+        """
+        node_id = self._node_coords.get((x, y))
+        if node_id is None and not exact:
+            tolerance = self.snap_tolerance
+            if tolerance is None:
+                tolerance = self.default_snap_tolerance()
+            if tolerance > 0:
+                node_id = self._snap_index(tolerance).nearest(x, y, tolerance)
+        if node_id is None:
+            return None
+        return self.nodes[node_id]
+
+    def _snap_index(self, tolerance):
+        """Return a NodeGridIndex of all nodes with cells of the size of the
+        tolerance. The index is built when it is first needed.
+        """
+        if self._node_index is None or \
+                self._node_index.cell_size != tolerance:
+            self._node_index = NodeGridIndex(cell_size=tolerance)
+            for node in self.nodes.values():
+                self._node_index.insert(node.x, node.y, node.id)
+        return self._node_index
 
     def add_link(self, link):
-        if self.link_names.get(link.name.lower()) is not None:
-            add_string = ' (%s)' % self.link_names[link.name.lower()]
-            self.link_names[link.name.lower()] += 1
-            link.name += add_string
-        else:
-            self.link_names[link.name.lower()] = 1
+        link.name = self.link_names.register(link.name)
         self.links.append(link)
 
-    def save_network(self, network_name=None, project_name=None):
-        """Save the network to HydraPlatform server.
+    def add_links(self, links):
+        """Add a list of links, registering all their names at once.
+        """
+        names = self.link_names.register_all([link.name for link in links])
+        for link, name in zip(links, names):
+            link.name = name
+            self.links.append(link)
+
+    def save_network(self, network_name=None, project_name=None,
+                     batch_size=None, stream=False):
+        """Save the network to HydraPlatform server. If a batch size is
+        given, the network is uploaded incrementally in batches of batch_size
+        resources (see IncrementalUpload). If such an upload fails, calling
+        save_network() again resumes it with the failed batch.
+
+        With stream=True the network is saved with one add_network call whose
+        body is generated while it is sent (see NetworkPayload).
+
+        The project is removed from the tree cache afterwards (see
+        invalidate_tree()).
         """
+        try:
+            return self._save_network(network_name, project_name,
+                                      batch_size, stream)
+        finally:
+            self.invalidate_tree()
+
+    def _save_network(self, network_name, project_name, batch_size, stream):
+        if batch_size is not None and self.upload is not None and \
+                not self.upload.finished:
+            return self.upload.run()
+
         if self.project is None:
             self.create_project(name=project_name)
         self.hydra_network = dict()
@@ -217,17 +456,41 @@ class HydraNetwork(HydraResource):
         self.hydra_network['scenarios'] = []
         self.hydra_network['project_id'] = self.project['id']
 
-        for node in self.nodes.values():
-            hydra_node = self.create_hydra_node(node)
-            self.hydra_network['nodes'].append(hydra_node)
-
-        for link in self.links:
-            hydra_link = self.create_hydra_link(link)
-            self.hydra_network['links'].append(hydra_link)
+        with self.profiler.phase('create_attributes'):
+            self.create_attributes(self.attribute_names())
+        self.profiler.count('nodes_saved', len(self.nodes))
+        self.profiler.count('links_saved', len(self.links))
+
+        if batch_size is not None:
+            self.upload = IncrementalUpload(self, batch_size)
+            with self.profiler.phase('upload', hot=True):
+                return self.upload.run()
+
+        if stream:
+            with self.profiler.phase('upload', hot=True):
+                return post_stream(self.conn, NetworkPayload(self))
+
+        self.progress.start('build_payload',
+                            total=len(self.nodes) + len(self.links),
+                            unit='resources')
+        with self.profiler.phase('build_payload', hot=True):
+            for node in self.nodes.values():
+                hydra_node = self.create_hydra_node(node)
+                self.hydra_network['nodes'].append(hydra_node)
+                self.progress.update()
+
+            for link in self.links:
+                hydra_link = self.create_hydra_link(link)
+                self.hydra_network['links'].append(hydra_link)
+                self.progress.update()
+        self.progress.finish()
 
         self.hydra_network['scenarios'].append(self.hydra_scenario)
-        net_summary = self.conn.call('add_network',
-                                     {'net': self.hydra_network})
+        self.progress.start('upload', unit=None)
+        with self.profiler.phase('upload'):
+            net_summary = self.conn.call('add_network',
+                                         {'net': self.hydra_network})
+        self.progress.finish()
 
         return net_summary
 
@@ -313,26 +576,128 @@ class HydraSimpleLink(HydraResource):
         self.attributes[key] = val
 
 
-class HydraNetworkTree(object):
+def tree_cache_file(url, username):
+    """Return the path of the tree cache of a user on a server.
+    """
+    key = hashlib.sha1(('%s %s' % (url, username)).encode('utf-8'))
+    return cache_path('tree_%s.json' % key.hexdigest())
+
 
-    def __init__(self, url=None, username=None, password=None):
-        self.conn = JsonConnection(url)
-        if username is not None and password is not None:
-            self.session_id = self.conn.login(username=username,
-                                              password=password)
+class TreeCache(object):
+    """The cached networks of the projects on a server (see
+    HydraNetworkTree), stored as JSON by project ID.
+    """
+
+    def __init__(self, cache_file):
+        self.cache_file = cache_file
+
+    def read(self):
+        try:
+            with open(self.cache_file, 'r') as cachefile:
+                return json.load(cachefile)
+        except (IOError, OSError, ValueError):
+            return dict()
+
+    def write(self, cache):
+        try:
+            tmpfile = self.cache_file + '.tmp'
+            with open(tmpfile, 'w') as cachefile:
+                json.dump(cache, cachefile)
+            if os.path.exists(self.cache_file):
+                os.remove(self.cache_file)
+            os.rename(tmpfile, self.cache_file)
+        except (IOError, OSError):
+            warnings.warn('Could not write tree cache %s.' % self.cache_file)
+
+    def invalidate(self, project_id=None):
+        """Remove a project (or all projects) from the cache. Nothing is
+        written if there is no cache.
+        """
+        if not os.path.exists(self.cache_file):
+            return
+        if project_id is None:
+            cache = dict()
         else:
-            self.session_id = self.conn.login()
+            cache = self.read()
+            if cache.pop(str(project_id), None) is None:
+                return
+        self.write(cache)
+
+
+class HydraNetworkTree(object):
+    """The projects, networks and scenarios available on a server.
 
+    The networks of the projects are fetched concurrently by a pool of
+    threads. The tree can be kept in a cache file: the project list is always
+    fetched, but the networks of a project are only fetched again if the
+    project changed, or if they are older than the time to live of the cache.
+    """
+
+    def __init__(self, url=None, username=None, password=None,
+                 cache_file=None, transport=None):
+        self.url = url
+        # The worker threads share the persistent session of the transport
+        if transport is None:
+            transport = HydraTransport(JsonConnection(url=url))
+        self.conn = transport
+        self.session_id = self.conn.login(username=username,
+                                          password=password)
+
+        if cache_file is None:
+            cache_file = tree_cache_file(url, username)
+        self.cache = TreeCache(cache_file)
         self.projects = dict()
+        self.nfetched = 0
+
+    def get_tree(self, workers=8, ttl=3600, refresh=False):
+        """Fetch the tree using at most workers concurrent requests. Cached
+        networks older than ttl seconds are fetched again, refresh=True
+        ignores the cache. A ttl of 0 disables the cache.
+        """
+        cache = dict() if refresh or ttl <= 0 else self.cache.read()
+        now = time.time()
 
-    def get_tree(self):
         project_list = self.conn.call('get_projects', {})
+        stale = []
         for project in project_list:
-            networks = self.conn.call('get_networks',
-                                      {'project_id': project['id'],
-                                       'include_data': 'N'})
-            project['networks'] = networks
-            self.projects.update({project['id']: project})
+            cached = cache.get(str(project['id']))
+            if cached is not None and cached['project'] == project and \
+                    now - cached['fetched'] < ttl:
+                project['networks'] = cached['networks']
+                self.projects[project['id']] = project
+            else:
+                stale.append(project)
+
+        if len(stale) > 0:
+            pool = ThreadPool(max(1, min(workers, len(stale))))
+            try:
+                network_lists = pool.map(self._get_networks,
+                                         [p['id'] for p in stale])
+            finally:
+                pool.terminate()
+                pool.join()
+            self.nfetched += len(stale)
+            for project, networks in zip(stale, network_lists):
+                cache[str(project['id'])] = \
+                    dict(project=dict(project), networks=networks,
+                         fetched=now)
+                project['networks'] = networks
+                self.projects[project['id']] = project
+
+        if ttl > 0:
+            self.cache.write(dict((str(pid), cache[str(pid)])
+                                  for pid in self.projects
+                                  if str(pid) in cache))
+
+    def invalidate(self, project_id=None):
+        """Remove a project (or all projects) from the cache.
+        """
+        self.cache.invalidate(project_id)
+
+    def _get_networks(self, project_id):
+        return self.conn.call('get_networks',
+                              {'project_id': project_id,
+                               'include_data': 'N'})
 
     def print_tree(self, color=True):
         if color:
@@ -0,0 +1,164 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+#    Copyright (c) 2016, Philipp Meier
+#
+#    This file is part of the Hydra Platform ShapefileApp (HydraShapefileApp).
+#
+#    HydraShapefileApp is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by the
+#    Free Software Foundation, either version 3 of the License, or (at your
+#    option) any later version.
+#
+#    HydraShapefileApp is distributed in the hope that it will be useful, but
+#    WITHOUT ANY WARRANTY; without even the implied warranty of MERCHANTABILITY
+#    or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public License
+#    for more details.
+#
+#    You should have received a copy of the GNU General Public License along
+#    with HydraShapefileApp.  If not, see <http://www.gnu.org/licenses/>.
+
+
+import os
+import json
+import pickle
+import hashlib
+import warnings
+
+from app_cache import cache_path
+
+# Increase if the layout of FeatureBatch changes
+CACHE_VERSION = 2
+
+# Files belonging to a shapefile which affect the features read from it
+SHAPEFILE_EXTENSIONS = ['.shp', '.shx', '.dbf', '.prj', '.cpg']
+
+
+def content_hash(filename, blocksize=1 << 20):
+    """Return the SHA1 hash of the contents of a file and, for shapefiles,
+    of its .shx, .dbf, .prj and .cpg files.
+    """
+    base, ext = os.path.splitext(filename)
+    if ext.lower() == '.shp':
+        filenames = [base + e for e in SHAPEFILE_EXTENSIONS
+                     if os.path.exists(base + e)]
+    else:
+        filenames = [filename]
+
+    sha = hashlib.sha1()
+    for name in filenames:
+        sha.update(os.path.splitext(name)[1].encode('utf-8'))
+        with open(name, 'rb') as datafile:
+            while True:
+                block = datafile.read(blocksize)
+                if not block:
+                    break
+                sha.update(block)
+    return sha.hexdigest()
+
+
+class ImportCache(object):
+    """A cache of the FeatureBatches read from files, so files which did not
+    change since the last import are not parsed again.
+
+    There is one cache file per input file and read parameters (geometry
+    type and filters). It holds the content hash of the input files and the
+    pickled batches, as read and before they are projected. An entry is used
+    if the content hash still matches and replaced otherwise.
+
+    The entries of the cache folder take up at most max_bytes. Whenever an
+    entry is stored, the least recently used entries are deleted until the
+    limit is met again; the new entry is always kept.
+    """
+
+    def __init__(self, cache_dir=None, max_bytes=1 << 30):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._hashes = dict()
+
+    def _content_hash(self, filename):
+        if filename not in self._hashes:
+            self._hashes[filename] = content_hash(filename)
+        return self._hashes[filename]
+
+    def _entry_path(self, task):
+        key = json.dumps([CACHE_VERSION] + list(task))
+        name = 'import_%s.pickle' % \
+            hashlib.sha1(key.encode('utf-8')).hexdigest()
+        return cache_path(name, cache_dir=self.cache_dir)
+
+    def load(self, task):
+        """Return the cached batches of a read task (see
+        feature_reader.read_file_task()) or None.
+        """
+        path = self._entry_path(task)
+        if not os.path.exists(path):
+            self.misses += 1
+            return None
+        try:
+            with open(path, 'rb') as cachefile:
+                cached_hash = pickle.load(cachefile)
+                if cached_hash != self._content_hash(task[0]):
+                    self.misses += 1
+                    return None
+                batches = pickle.load(cachefile)
+        except (IOError, OSError, EOFError, pickle.UnpicklingError,
+                AttributeError, ImportError, ValueError):
+            warnings.warn('Ignoring unreadable import cache entry %s.' % path)
+            self.misses += 1
+            return None
+        self.hits += 1
+        # The modification time marks when an entry was last used
+        try:
+            os.utime(path, None)
+        except OSError:
+            pass
+        return batches
+
+    def store(self, task, batches):
+        """Store the batches read by a task.
+        """
+        path = self._entry_path(task)
+        tmppath = path + '.tmp'
+        try:
+            with open(tmppath, 'wb') as cachefile:
+                pickle.dump(self._content_hash(task[0]), cachefile,
+                            pickle.HIGHEST_PROTOCOL)
+                pickle.dump(batches, cachefile, pickle.HIGHEST_PROTOCOL)
+            if os.path.exists(path):
+                os.remove(path)
+            os.rename(tmppath, path)
+        except (IOError, OSError):
+            warnings.warn('Could not write import cache entry %s.' % path)
+            return
+        self._evict(path)
+
+    def _evict(self, keep):
+        """Delete the least recently used entries except keep until all
+        entries take up at most max_bytes.
+        """
+        cache_dir = os.path.dirname(keep)
+        entries = []
+        for name in os.listdir(cache_dir):
+            if not (name.startswith('import_') and name.endswith('.pickle')):
+                continue
+            path = os.path.join(cache_dir, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+
+        size = sum([entry[1] for entry in entries])
+        for mtime, entry_size, path in sorted(entries):
+            if size <= self.max_bytes:
+                break
+            if path == keep:
+                continue
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            size -= entry_size
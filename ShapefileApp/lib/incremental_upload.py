@@ -0,0 +1,259 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+#    Copyright (c) 2016, Philipp Meier
+#
+#    This file is part of the Hydra Platform ShapefileApp (HydraShapefileApp).
+#
+#    HydraShapefileApp is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by the
+#    Free Software Foundation, either version 3 of the License, or (at your
+#    option) any later version.
+#
+#    HydraShapefileApp is distributed in the hope that it will be useful, but
+#    WITHOUT ANY WARRANTY; without even the implied warranty of MERCHANTABILITY
+#    or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public License
+#    for more details.
+#
+#    You should have received a copy of the GNU General Public License along
+#    with HydraShapefileApp.  If not, see <http://www.gnu.org/licenses/>.
+
+
+import warnings
+
+
+class IncrementalUpload(object):
+    """Upload a network in batches instead of one single add_network call.
+
+    The network is created without any resources first. Nodes and links are
+    then added in batches of batch_size resources using add_nodes and
+    add_links, each batch followed by an update_resourcedata call with the
+    datasets of its resources. Temporary IDs are replaced by the IDs assigned
+    by the server as soon as a batch is saved, so links always refer to
+    existing nodes.
+
+    The object keeps track of all completed steps. If a step fails (after
+    a given number of retries), the error is raised and calling run() again
+    resumes the upload with the failed step. A failed call may still have
+    been carried out by the server (e.g. after a timeout), so before a call
+    adding the network or resources is repeated, the network is fetched
+    and resources which already exist (by name) are not sent again.
+
+    To add resources to a network which already exists, pass the nodes and
+    links to add, the IDs of the network and its scenario and the saved IDs
+    of existing nodes the new links refer to (by temporary node ID).
+    """
+
+    def __init__(self, network, batch_size, retries=2, nodes=None,
+                 links=None, network_id=None, scenario_id=None,
+                 node_ids=None):
+        if batch_size < 1:
+            raise ValueError("Batch size must be at least 1.")
+        self.network = network
+        self.batch_size = batch_size
+        self.retries = retries
+
+        self.finished = False
+        self.net_summary = None
+        self.network_id = network_id
+        self.scenario_id = scenario_id
+
+        self.node_ids = dict(node_ids) if node_ids is not None else dict()
+
+        self._nodes = list(nodes if nodes is not None
+                           else network.nodes.values())
+        self._links = list(links if links is not None else network.links)
+        self._done = set()
+        self._pending_data = dict()
+        # Steps whose last call failed and may have been saved anyway
+        self._uncertain = set()
+
+    def run(self):
+        """Upload everything that has not been uploaded yet.
+        """
+        if self.network_id is None:
+            self._add_skeleton()
+
+        progress = self.network.progress
+        progress.start('upload', total=len(self._nodes) + len(self._links),
+                       unit='resources')
+        for nbatch in range(self._nbatches(self._nodes)):
+            self._upload_batch('nodes', nbatch)
+            progress.update(min(self.batch_size,
+                                len(self._nodes) - nbatch * self.batch_size))
+        for nbatch in range(self._nbatches(self._links)):
+            self._upload_batch('links', nbatch)
+            progress.update(min(self.batch_size,
+                                len(self._links) - nbatch * self.batch_size))
+        progress.finish()
+
+        self.finished = True
+        return self.net_summary
+
+    def _nbatches(self, resources):
+        return (len(resources) + self.batch_size - 1) // self.batch_size
+
+    def _call(self, func, args):
+        for attempt in range(self.retries + 1):
+            try:
+                return self.network.conn.call(func, args)
+            except Exception:
+                if attempt == self.retries:
+                    raise
+                warnings.warn("Call to %s failed, retrying (%s/%s)." %
+                              (func, attempt + 1, self.retries))
+
+    def _add_skeleton(self):
+        hydra_network = dict(self.network.hydra_network)
+        hydra_network['nodes'] = []
+        hydra_network['links'] = []
+        hydra_scenario = dict(self.network.hydra_scenario)
+        hydra_scenario['resourcescenarios'] = []
+        hydra_network['scenarios'] = [hydra_scenario]
+
+        for attempt in range(self.retries + 1):
+            if 'network' in self._uncertain:
+                self.net_summary = self._saved_network(hydra_network)
+                if self.net_summary is not None:
+                    break
+            try:
+                self.net_summary = self.network.conn.call(
+                    'add_network', {'net': hydra_network})
+                break
+            except Exception:
+                self._uncertain.add('network')
+                if attempt == self.retries:
+                    raise
+                warnings.warn("Call to add_network failed, retrying "
+                              "(%s/%s)." % (attempt + 1, self.retries))
+        self._uncertain.discard('network')
+        self.network_id = self.net_summary.id
+        self.scenario_id = self.net_summary.scenarios[0].id
+
+    def _saved_network(self, hydra_network):
+        """Return the network of the project with the name of the uploaded
+        network or None.
+        """
+        networks = self._call('get_networks',
+                              {'project_id': hydra_network['project_id'],
+                               'include_data': 'N'})
+        for network in networks:
+            if network.name == hydra_network['name']:
+                return network
+        return None
+
+    def _add_resources(self, kind, nbatch, hydra_resources):
+        """Add the resources of a batch and return the saved resources.
+        """
+        func = 'add_%s' % kind
+        saved = []
+        pending = hydra_resources
+        for attempt in range(self.retries + 1):
+            if (kind, nbatch) in self._uncertain:
+                found, pending = self._saved_resources(kind, pending)
+                saved.extend(found)
+                if len(pending) == 0:
+                    break
+            try:
+                saved.extend(self.network.conn.call(
+                    func, {'network_id': self.network_id, kind: pending}))
+                break
+            except Exception:
+                self._uncertain.add((kind, nbatch))
+                if attempt == self.retries:
+                    raise
+                warnings.warn("Call to %s failed, retrying (%s/%s)." %
+                              (func, attempt + 1, self.retries))
+        self._uncertain.discard((kind, nbatch))
+        return saved
+
+    def _saved_resources(self, kind, hydra_resources):
+        """Split resources into those found in the saved network (by name),
+        returned as saved, and those missing.
+        """
+        network = self._call('get_network', {'network_id': self.network_id,
+                                             'include_data': 'N'})
+        existing = dict([(resource.name, resource)
+                         for resource in network[kind]])
+        found = []
+        missing = []
+        for hydra_resource in hydra_resources:
+            if hydra_resource['name'] in existing:
+                found.append(existing[hydra_resource['name']])
+            else:
+                missing.append(hydra_resource)
+        return found, missing
+
+    def _upload_batch(self, kind, nbatch):
+        """Save the resources of one batch and their data. Both steps are
+        recorded separately, so resources are never added twice.
+        """
+        if (kind, nbatch, 'resources') not in self._done:
+            if kind == 'nodes':
+                resources = self._nodes
+                build = self._build_node
+            else:
+                resources = self._links
+                build = self._build_link
+
+            batch = resources[nbatch * self.batch_size:
+                              (nbatch + 1) * self.batch_size]
+
+            # Resource scenarios created with the resources are collected in
+            # a list of their own, the scenario's data is left as it is
+            scenario = self.network.hydra_scenario
+            scenario_data = scenario['resourcescenarios']
+            res_scens = []
+            scenario['resourcescenarios'] = res_scens
+            try:
+                hydra_resources = [build(resource) for resource in batch]
+            finally:
+                scenario['resourcescenarios'] = scenario_data
+
+            saved = self._add_resources(kind, nbatch, hydra_resources)
+            res_attr_ids = self._map_ids(kind, hydra_resources, saved)
+
+            for res_scen in res_scens:
+                res_scen['resource_attr_id'] = \
+                    res_attr_ids[res_scen['resource_attr_id']]
+            self._pending_data[(kind, nbatch)] = res_scens
+            self._done.add((kind, nbatch, 'resources'))
+
+        if (kind, nbatch, 'data') not in self._done:
+            res_scens = self._pending_data[(kind, nbatch)]
+            if len(res_scens) > 0:
+                self._call('update_resourcedata',
+                           {'scenario_id': self.scenario_id,
+                            'resource_scenarios': res_scens})
+            del self._pending_data[(kind, nbatch)]
+            self._done.add((kind, nbatch, 'data'))
+
+    def _build_node(self, node):
+        return self.network.create_hydra_node(node)
+
+    def _build_link(self, link):
+        hydra_link = self.network.create_hydra_link(link)
+        hydra_link['node_1_id'] = self.node_ids[hydra_link['node_1_id']]
+        hydra_link['node_2_id'] = self.node_ids[hydra_link['node_2_id']]
+        return hydra_link
+
+    def _map_ids(self, kind, hydra_resources, saved):
+        """Map temporary node and resource attribute IDs to the IDs assigned
+        by the server. Resource names are unique within a network, so saved
+        resources are matched by name. Node IDs are kept for the links, the
+        resource attribute IDs of the batch are returned.
+        """
+        res_attr_ids = dict()
+        saved_by_name = dict([(resource.name, resource)
+                              for resource in saved])
+        for hydra_resource in hydra_resources:
+            saved_resource = saved_by_name[hydra_resource['name']]
+            if kind == 'nodes':
+                self.node_ids[hydra_resource['id']] = saved_resource.id
+            saved_res_attrs = dict([(res_attr.attr_id, res_attr.id)
+                                    for res_attr in
+                                    saved_resource.attributes])
+            for res_attr in hydra_resource['attributes']:
+                res_attr_ids[res_attr['id']] = \
+                    saved_res_attrs[res_attr['attr_id']]
+        return res_attr_ids
@@ -0,0 +1,134 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+#    Copyright (c) 2016, Philipp Meier
+#
+#    This file is part of the Hydra Platform ShapefileApp (HydraShapefileApp).
+#
+#    HydraShapefileApp is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by the
+#    Free Software Foundation, either version 3 of the License, or (at your
+#    option) any later version.
+#
+#    HydraShapefileApp is distributed in the hope that it will be useful, but
+#    WITHOUT ANY WARRANTY; without even the implied warranty of MERCHANTABILITY
+#    or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public License
+#    for more details.
+#
+#    You should have received a copy of the GNU General Public License along
+#    with HydraShapefileApp.  If not, see <http://www.gnu.org/licenses/>.
+
+
+import time
+
+from osgeo import ogr
+from osgeo import osr
+
+from HydraLib.PluginLib import HydraPluginError
+
+from geometry_wkb import geometry_to_wkb
+from geometry_wkb import wkb_bytes
+
+
+def ogr_geometry(geometry):
+    """Return an ogr.Geometry of a geometry given as ogr.Geometry, WKB (bytes
+    or hex string) or GeoJSON-like dict.
+    """
+    if isinstance(geometry, ogr.Geometry):
+        return geometry
+    elif isinstance(geometry, dict):
+        return ogr.CreateGeometryFromWkb(geometry_to_wkb(geometry))
+    return ogr.CreateGeometryFromWkb(wkb_bytes(geometry))
+
+
+def write_layer(datasource, layer_name, projection, geom_type, fields,
+                features, transaction_size=10000, options=None):
+    """Create a layer in an OGR data source and write features to it.
+
+    Fields is a list of (name, OGR field type) tuples. Every feature is a
+    tuple (geometry, name, values) where geometry is anything ogr_geometry()
+    accepts and values is a list of field values in the order of fields
+    (None for unset fields). A 'name' field is always created first.
+    Features are written in transactions of transaction_size features (or
+    in one transaction if it is None); fields are addressed by index, so
+    names truncated by the driver do not matter. Options are passed to the
+    driver as layer creation options.
+
+    Returns the number of features written.
+    """
+    layer = datasource.CreateLayer(layer_name, projection,
+                                   geom_type=geom_type,
+                                   options=options if options is not None
+                                   else [])
+    if layer is None:
+        raise HydraPluginError("Could not create layer %s." % layer_name)
+
+    layer.CreateField(ogr.FieldDefn('name', ogr.OFTString))
+    for field_name, field_type in fields:
+        layer.CreateField(ogr.FieldDefn(field_name, field_type))
+    feature_defn = layer.GetLayerDefn()
+
+    nfeatures = 0
+    layer.StartTransaction()
+    for geometry, name, values in features:
+        geometry = ogr_geometry(geometry)
+        if geom_type == ogr.wkbMultiLineString and \
+                geometry.GetGeometryType() == ogr.wkbLineString:
+            # Some drivers (e.g. FlatGeobuf) only accept the layer type
+            geometry = ogr.ForceToMultiLineString(geometry)
+        feature = ogr.Feature(feature_defn)
+        feature.SetGeometry(geometry)
+        feature.SetField(0, name)
+        for i, val in enumerate(values):
+            if val is not None:
+                feature.SetField(i + 1, val)
+        layer.CreateFeature(feature)
+        feature.Destroy()
+
+        nfeatures += 1
+        if transaction_size is not None and \
+                nfeatures % transaction_size == 0:
+            layer.CommitTransaction()
+            layer.StartTransaction()
+    layer.CommitTransaction()
+
+    return nfeatures
+
+
+def write_layer_file(snapshot):
+    """Write a layer to a new file. The snapshot is a dict holding the name of
+    the OGR driver, the filename, the layer name, the projection as WKT, the
+    geometry type, the fields, the features (see write_layer()), the layer
+    creation options and the transaction size. Snapshots with a list of
+    features can be pickled, so layers can be written in worker processes.
+
+    Returns a tuple (layer name, number of features, seconds).
+    """
+    return write_layers_file([snapshot])[0]
+
+
+def write_layers_file(snapshots):
+    """Write the layers of a list of snapshots (see write_layer_file()) to
+    one new file, which is given by the first snapshot.
+
+    Returns a list of (layer name, number of features, seconds).
+    """
+    driver = ogr.GetDriverByName(snapshots[0]['driver'])
+    datasource = driver.CreateDataSource(snapshots[0]['filename'])
+    if datasource is None:
+        raise HydraPluginError("Could not create %s." %
+                               snapshots[0]['filename'])
+    timings = []
+    for snapshot in snapshots:
+        start = time.time()
+        projection = osr.SpatialReference(snapshot['projection'])
+        nfeatures = write_layer(datasource, snapshot['layer_name'],
+                                projection, snapshot['geom_type'],
+                                snapshot['fields'], snapshot['features'],
+                                transaction_size=snapshot.get(
+                                    'transaction_size', 10000),
+                                options=snapshot.get('options'))
+        timings.append((snapshot['layer_name'], nfeatures,
+                        time.time() - start))
+    datasource.Destroy()
+    return timings
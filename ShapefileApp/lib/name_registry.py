@@ -0,0 +1,87 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+#    Copyright (c) 2016, Philipp Meier
+#
+#    This file is part of the Hydra Platform ShapefileApp (HydraShapefileApp).
+#
+#    HydraShapefileApp is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by the
+#    Free Software Foundation, either version 3 of the License, or (at your
+#    option) any later version.
+#
+#    HydraShapefileApp is distributed in the hope that it will be useful, but
+#    WITHOUT ANY WARRANTY; without even the implied warranty of MERCHANTABILITY
+#    or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public License
+#    for more details.
+#
+#    You should have received a copy of the GNU General Public License along
+#    with HydraShapefileApp.  If not, see <http://www.gnu.org/licenses/>.
+
+
+def fold(name):
+    """Return the case folded form of a name, the form in which names are
+    compared.
+    """
+    try:
+        return name.casefold()
+    except AttributeError:
+        return name.lower()
+
+
+class NameRegistry(object):
+    """A set of names which are unique if compared case insensitively.
+
+    Registering a name that is already taken returns the name with the
+    lowest free suffix, i.e. 'Pump', 'Pump (1)', 'Pump (2)' and so on. The
+    suffixed names are registered as well, so a later 'pump (1)' becomes
+    'pump (1) (1)'. The next suffix to try is remembered for every name,
+    so registering the same name over and over takes constant time.
+    """
+
+    def __init__(self):
+        self._names = set()
+        self._next_suffix = dict()
+
+    def __len__(self):
+        return len(self._names)
+
+    def __contains__(self, name):
+        return fold(name) in self._names
+
+    def register(self, name):
+        """Register a name and return it, made unique if necessary.
+        """
+        folded = fold(name)
+        if folded not in self._names:
+            self._names.add(folded)
+            return name
+        return self._register_suffixed(name, folded)
+
+    def register_all(self, names):
+        """Register a sequence of names and return the list of unique
+        names, in the same order.
+        """
+        registered = self._names
+        add = registered.add
+        unique = []
+        append = unique.append
+        for name in names:
+            folded = fold(name)
+            if folded not in registered:
+                add(folded)
+                append(name)
+            else:
+                append(self._register_suffixed(name, folded))
+        return unique
+
+    def _register_suffixed(self, name, folded):
+        suffix = self._next_suffix.get(folded, 1)
+        while True:
+            suffix_string = ' (%s)' % suffix
+            suffix += 1
+            if folded + suffix_string not in self._names:
+                break
+        self._next_suffix[folded] = suffix
+        self._names.add(folded + suffix_string)
+        return name + suffix_string
@@ -0,0 +1,305 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+#    Copyright (c) 2016, Philipp Meier
+#
+#    This file is part of the Hydra Platform ShapefileApp (HydraShapefileApp).
+#
+#    HydraShapefileApp is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by the
+#    Free Software Foundation, either version 3 of the License, or (at your
+#    option) any later version.
+#
+#    HydraShapefileApp is distributed in the hope that it will be useful, but
+#    WITHOUT ANY WARRANTY; without even the implied warranty of MERCHANTABILITY
+#    or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public License
+#    for more details.
+#
+#    You should have received a copy of the GNU General Public License along
+#    with HydraShapefileApp.  If not, see <http://www.gnu.org/licenses/>.
+
+
+import json
+import hashlib
+
+from geometry_wkb import wkb_to_geometry
+
+# Coordinates are compared with this number of decimals
+COORD_DECIMALS = 6
+
+
+def coord_key(x, y):
+    return '%.*f %.*f' % (COORD_DECIMALS, float(x), COORD_DECIMALS, float(y))
+
+
+def layout_geometry(layout):
+    """Return the link geometry stored in a layout (a dict or its JSON
+    representation) as GeoJSON-like dict, or None.
+    """
+    if layout is None or layout == '':
+        return None
+    if not isinstance(layout, dict):
+        try:
+            layout = json.loads(layout)
+        except ValueError:
+            return None
+        if not isinstance(layout, dict):
+            return None
+    if layout.get('wkb') is not None:
+        return wkb_to_geometry(layout['wkb'])
+    return layout.get('geometry')
+
+
+def geometry_key(geometry):
+    """Return a hash of the coordinates of a LineString or MultiLineString.
+    """
+    if geometry is None:
+        return None
+    if geometry['type'] == 'MultiLineString':
+        parts = geometry['coordinates']
+    else:
+        parts = [geometry['coordinates']]
+    text = '|'.join([','.join([coord_key(coord[0], coord[1])
+                               for coord in part]) for part in parts])
+    return hashlib.sha1(text.encode('utf-8')).hexdigest()
+
+
+def value_key(dataset_type, val):
+    """Normalise the value of a dataset of a given type for comparison.
+    Scalars are compared as numbers, all other types by their text, so e.g.
+    the descriptors '1' and '1.0' differ.
+    """
+    if val is None:
+        return None
+    if dataset_type == 'scalar':
+        try:
+            return (dataset_type, repr(float(val)))
+        except (TypeError, ValueError):
+            pass
+    return (dataset_type, u'%s' % val)
+
+
+class NetworkDiff(object):
+    """The difference between the nodes and links imported into a
+    ShapefileApp and a network saved on the server (the network dict returned
+    by get_network with data, and one of its scenarios).
+
+    Resources are matched by the value of key_field ('name' or an attribute)
+    or, without a key field (or a value for it), by their geometry: nodes by
+    their coordinates, links by a hash of their vertices. Matched resources
+    whose name, geometry, end nodes or data differ are modified. Data is
+    only compared for attributes which occur in the imported data, other
+    attributes of the saved network are left alone.
+
+    The diff consists of:
+
+    - added_nodes, added_links: new resources (HydraSimpleNodes and
+      HydraSimpleLinks)
+    - removed_nodes, removed_links: saved resources (dicts) without a match
+    - modified_nodes, modified_links: (new resource, saved resource) pairs
+      whose name or geometry changed
+    - node_ids: the saved ID of every matched node by its temporary ID
+    - new_res_attrs: (resource type, resource ID, attribute name, value) of
+      attributes missing on saved resources
+    - changed_data: resource scenarios with new or changed data
+    - removed_data: resource scenarios whose data was removed
+    """
+
+    def __init__(self, network, hydra_network, scenario, key_field=None):
+        self.network = network
+        self.key_field = key_field
+
+        self.added_nodes = []
+        self.removed_nodes = []
+        self.modified_nodes = []
+        self.added_links = []
+        self.removed_links = []
+        self.modified_links = []
+        self.node_ids = dict()
+        self.new_res_attrs = []
+        self.changed_data = []
+        self.removed_data = []
+        self.nchanged_resources = 0
+
+        self._attr_names = dict((attr.id, attr.name)
+                                for attr in network.attrs.values())
+        self._imported_attrs = set(network.attribute_names())
+        self._data = dict((res_scen['resource_attr_id'], res_scen)
+                          for res_scen in scenario['resourcescenarios'])
+
+        self._diff_nodes(hydra_network['nodes'])
+        self._diff_links(hydra_network['links'])
+
+    def summary(self):
+        return dict(added_nodes=len(self.added_nodes),
+                    removed_nodes=len(self.removed_nodes),
+                    added_links=len(self.added_links),
+                    removed_links=len(self.removed_links),
+                    modified=self.nchanged_resources,
+                    changed_data=len(self.changed_data) +
+                    len(self.new_res_attrs),
+                    removed_data=len(self.removed_data))
+
+    def is_empty(self):
+        return not any(self.summary().values())
+
+    def _diff_nodes(self, saved_nodes):
+        pairs, added, removed = self._match_resources(
+            self.network.nodes.values(), saved_nodes,
+            lambda node: coord_key(node.x, node.y),
+            lambda node: coord_key(node['x'], node['y']))
+
+        self.added_nodes = added
+        self.removed_nodes = removed
+        for node, saved in pairs:
+            self.node_ids[node.id] = saved['id']
+            changed = False
+            if node.name != saved['name'] or \
+                    coord_key(node.x, node.y) != \
+                    coord_key(saved['x'], saved['y']):
+                self.modified_nodes.append((node, saved))
+                changed = True
+            if self._diff_data(node, saved, 'NODE') or changed:
+                self.nchanged_resources += 1
+
+    def _diff_links(self, saved_links):
+        pairs, added, removed = self._match_resources(
+            self.network.links, saved_links,
+            lambda link: geometry_key(layout_geometry(link.layout)),
+            lambda link: geometry_key(layout_geometry(link['layout'])))
+
+        self.added_links = added
+        self.removed_links = removed
+        for link, saved in pairs:
+            changed = False
+            if link.name != saved['name'] or \
+                    self.node_ids.get(link.start_node.id) != \
+                    saved['node_1_id'] or \
+                    self.node_ids.get(link.end_node.id) != \
+                    saved['node_2_id'] or \
+                    geometry_key(layout_geometry(link.layout)) != \
+                    geometry_key(layout_geometry(saved['layout'])):
+                self.modified_links.append((link, saved))
+                changed = True
+            if self._diff_data(link, saved, 'LINK') or changed:
+                self.nchanged_resources += 1
+
+    def _match(self, resources, saved_resources, key, saved_key):
+        """Pair resources with saved resources of the same key. Resources
+        without a key are never matched, resources with the same key are
+        paired in order.
+        """
+        saved_by_key = dict()
+        unkeyed = []
+        for saved in saved_resources:
+            k = saved_key(saved)
+            if k is None:
+                unkeyed.append(saved)
+            else:
+                saved_by_key.setdefault(k, []).append(saved)
+
+        pairs = []
+        added = []
+        for resource in resources:
+            candidates = saved_by_key.get(key(resource))
+            if candidates:
+                pairs.append((resource, candidates.pop(0)))
+            else:
+                added.append(resource)
+
+        removed = unkeyed + [saved for candidates in saved_by_key.values()
+                             for saved in candidates]
+        removed.sort(key=lambda saved: saved['id'])
+        return pairs, added, removed
+
+    def _match_resources(self, resources, saved_resources, geometry_key,
+                         saved_geometry_key):
+        """Match resources by the key field or, if there is none or a
+        resource has no value for it, by geometry.
+        """
+        if self.key_field is None:
+            return self._match(resources, saved_resources, geometry_key,
+                               saved_geometry_key)
+
+        field = self.key_field
+        if field.lower() == 'name':
+            def field_key(resource):
+                return resource.name
+
+            def saved_field_key(saved):
+                return saved['name']
+        else:
+            def field_key(resource):
+                val = resource.attributes.get(field)
+                if val is None:
+                    return None
+                dataset = self.network.create_dataset(field, val)
+                return value_key(dataset['type'], dataset['value'])
+
+            def saved_field_key(saved):
+                for res_attr in saved['attributes']:
+                    if self._attr_names.get(res_attr['attr_id']) == field:
+                        res_scen = self._data.get(res_attr['id'])
+                        if res_scen is not None:
+                            return value_key(res_scen['value']['type'],
+                                             res_scen['value']['value'])
+                return None
+
+        def key(resource):
+            k = field_key(resource)
+            if k is None:
+                k = geometry_key(resource)
+                return ('geometry', k) if k is not None else None
+            return ('field', k)
+
+        def saved_key(saved):
+            k = saved_field_key(saved)
+            if k is None:
+                k = saved_geometry_key(saved)
+                return ('geometry', k) if k is not None else None
+            return ('field', k)
+
+        return self._match(resources, saved_resources, key, saved_key)
+
+    def _diff_data(self, resource, saved, resource_type):
+        """Compare the attribute values of a resource with the data of the
+        saved resource. Returns True if anything changed.
+        """
+        saved_attrs = dict()
+        for res_attr in saved['attributes']:
+            name = self._attr_names.get(res_attr['attr_id'])
+            if name in self._imported_attrs:
+                saved_attrs[name] = res_attr
+
+        changed = False
+        for name, val in resource.attributes.items():
+            res_attr = saved_attrs.pop(name, None)
+            if res_attr is None:
+                if val is not None:
+                    self.new_res_attrs.append((resource_type, saved['id'],
+                                               name, val))
+                    changed = True
+                continue
+            res_scen = self._data.get(res_attr['id'])
+            if val is None:
+                if res_scen is not None:
+                    self.removed_data.append(res_scen)
+                    changed = True
+                continue
+            dataset = self.network.create_dataset(name, val)
+            if res_scen is None or \
+                    value_key(dataset['type'], dataset['value']) != \
+                    value_key(res_scen['value']['type'],
+                              res_scen['value']['value']):
+                self.changed_data.append(
+                    dict(attr_id=res_attr['attr_id'],
+                         resource_attr_id=res_attr['id'],
+                         value=dataset))
+                changed = True
+
+        for name, res_attr in saved_attrs.items():
+            res_scen = self._data.get(res_attr['id'])
+            if res_scen is not None:
+                self.removed_data.append(res_scen)
+                changed = True
+        return changed
@@ -0,0 +1,127 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+#    Copyright (c) 2016, Philipp Meier
+#
+#    This file is part of the Hydra Platform ShapefileApp (HydraShapefileApp).
+#
+#    HydraShapefileApp is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by the
+#    Free Software Foundation, either version 3 of the License, or (at your
+#    option) any later version.
+#
+#    HydraShapefileApp is distributed in the hope that it will be useful, but
+#    WITHOUT ANY WARRANTY; without even the implied warranty of MERCHANTABILITY
+#    or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public License
+#    for more details.
+#
+#    You should have received a copy of the GNU General Public License along
+#    with HydraShapefileApp.  If not, see <http://www.gnu.org/licenses/>.
+
+
+import json
+import tempfile
+
+
+class SpooledJsonArray(object):
+    """A write-only list which encodes appended items as JSON to a temporary
+    file instead of keeping them in memory.
+    """
+
+    def __init__(self):
+        self._file = tempfile.TemporaryFile()
+        self._count = 0
+
+    def __len__(self):
+        return self._count
+
+    def append(self, item):
+        if self._count > 0:
+            self._file.write(b',')
+        self._file.write(json.dumps(item).encode('utf-8'))
+        self._count += 1
+
+    def iter_chunks(self, chunk_size):
+        """Return the JSON encoded items (without brackets) in chunks of
+        chunk_size bytes and close the file.
+        """
+        self._file.seek(0)
+        chunk = self._file.read(chunk_size)
+        while len(chunk) > 0:
+            yield chunk
+            chunk = self._file.read(chunk_size)
+        self._file.close()
+
+
+class NetworkPayload(object):
+    """Generate the JSON body of an add_network request incrementally.
+
+    Node and link dicts are built from network.nodes and network.links one
+    at a time while the body is sent. The resource scenarios created along
+    the way are spooled to a temporary file and appended with the scenario at
+    the end of the body. Peak memory is therefore proportional to a single
+    resource and not to the size of the network.
+
+    The network header (network.hydra_network without resources) and the
+    scenario header (network.hydra_scenario) need to be prepared by the
+    caller, see HydraNetwork.save_network().
+    """
+
+    def __init__(self, network, chunk_size=64 * 1024):
+        self.network = network
+        self.chunk_size = chunk_size
+
+    def __iter__(self):
+        buf = []
+        size = 0
+        for piece in self._pieces():
+            buf.append(piece)
+            size += len(piece)
+            if size >= self.chunk_size:
+                yield b''.join(buf)
+                buf = []
+                size = 0
+        if len(buf) > 0:
+            yield b''.join(buf)
+
+    def _encode(self, obj):
+        return json.dumps(obj).encode('utf-8')
+
+    def _pieces(self):
+        network = self.network
+        res_scens = SpooledJsonArray()
+        network.hydra_scenario['resourcescenarios'] = res_scens
+
+        yield b'{"add_network": {"net": {'
+        for key, val in network.hydra_network.items():
+            if key in ('nodes', 'links', 'scenarios'):
+                continue
+            yield self._encode(key) + b': ' + self._encode(val) + b', '
+
+        network.progress.start('upload',
+                               total=len(network.nodes) + len(network.links),
+                               unit='resources')
+        yield b'"nodes": ['
+        for i, node in enumerate(network.nodes.values()):
+            if i > 0:
+                yield b', '
+            yield self._encode(network.create_hydra_node(node))
+            network.progress.update()
+
+        yield b'], "links": ['
+        for i, link in enumerate(network.links):
+            if i > 0:
+                yield b', '
+            yield self._encode(network.create_hydra_link(link))
+            network.progress.update()
+        network.progress.finish()
+
+        yield b'], "scenarios": [{'
+        for key, val in network.hydra_scenario.items():
+            if key == 'resourcescenarios':
+                continue
+            yield self._encode(key) + b': ' + self._encode(val) + b', '
+        yield b'"resourcescenarios": ['
+        for chunk in res_scens.iter_chunks(self.chunk_size):
+            yield chunk
+        yield b']}]}}}'
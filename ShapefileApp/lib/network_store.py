@@ -0,0 +1,389 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+#    Copyright (c) 2016, Philipp Meier
+#
+#    This file is part of the Hydra Platform ShapefileApp (HydraShapefileApp).
+#
+#    HydraShapefileApp is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by the
+#    Free Software Foundation, either version 3 of the License, or (at your
+#    option) any later version.
+#
+#    HydraShapefileApp is distributed in the hope that it will be useful, but
+#    WITHOUT ANY WARRANTY; without even the implied warranty of MERCHANTABILITY
+#    or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public License
+#    for more details.
+#
+#    You should have received a copy of the GNU General Public License along
+#    with HydraShapefileApp.  If not, see <http://www.gnu.org/licenses/>.
+
+
+from array import array
+
+from geometry_wkb import geometry_to_wkb
+from geometry_wkb import wkb_to_geometry
+
+# States of an attribute in a row of an AttributeColumn
+ABSENT = 0
+NULL = 1
+VALUE = 2
+
+
+class AttributeColumn(object):
+    """The values of one attribute for all rows of a store. Values are kept
+    in a typed array as long as all of them are floats or all of them are
+    integers, otherwise in a list.
+    """
+
+    def __init__(self):
+        self.state = array('b')
+        self.values = None
+        self.kind = None
+
+    def _init_values(self, val):
+        # Rows before the first value (absent or null) get placeholders, so
+        # values stay aligned with states
+        if isinstance(val, bool):
+            self.kind = 'object'
+            self.values = []
+        elif isinstance(val, float):
+            self.kind = 'float'
+            self.values = array('d')
+        elif isinstance(val, int):
+            self.kind = 'int'
+            self.values = array('l')
+        else:
+            self.kind = 'object'
+            self.values = []
+        self._extend_values(len(self.state))
+
+    def _fits(self, val):
+        if self.kind == 'float':
+            return isinstance(val, float)
+        elif self.kind == 'int':
+            return isinstance(val, int) and not isinstance(val, bool)
+        return True
+
+    def _to_objects(self):
+        self.values = list(self.values)
+        self.kind = 'object'
+
+    def set(self, row, val):
+        if val is not None and self.values is None:
+            self._init_values(val)
+        if val is not None and not self._fits(val):
+            self._to_objects()
+        self._pad(row + 1)
+
+        if val is None:
+            self.state[row] = NULL
+            return
+        self.state[row] = VALUE
+        try:
+            self.values[row] = val
+        except OverflowError:
+            self._to_objects()
+            self.values[row] = val
+
+    def clear(self, row):
+        if row < len(self.state):
+            self.state[row] = ABSENT
+
+    def get(self, row):
+        """Return the state of a row and its value.
+        """
+        if row >= len(self.state) or self.state[row] != VALUE:
+            return (ABSENT if row >= len(self.state) else self.state[row],
+                    None)
+        return VALUE, self.values[row]
+
+    def _pad(self, length):
+        missing = length - len(self.state)
+        if missing <= 0:
+            return
+        self.state.extend([ABSENT] * missing)
+        if self.values is not None:
+            self._extend_values(missing)
+
+    def _extend_values(self, n):
+        if self.kind == 'object':
+            self.values.extend([None] * n)
+        else:
+            self.values.extend([0] * n)
+
+
+class AttributeTable(object):
+    """A set of AttributeColumns, one per attribute name.
+    """
+
+    def __init__(self):
+        self.columns = dict()
+
+    def names(self):
+        return list(self.columns.keys())
+
+    def set_row(self, row, attributes):
+        for column in self.columns.values():
+            column.clear(row)
+        for key, val in attributes.items():
+            self.set(row, key, val)
+
+    def set(self, row, key, val):
+        if self.columns.get(key) is None:
+            self.columns[key] = AttributeColumn()
+        self.columns[key].set(row, val)
+
+    def get_row(self, row):
+        attributes = dict()
+        for key, column in self.columns.items():
+            state, val = column.get(row)
+            if state != ABSENT:
+                attributes[key] = val
+        return attributes
+
+
+class NodeView(object):
+    """A node of a NodeStore. Changing the name or adding attributes changes
+    the store, the attributes dict returned is a copy.
+    """
+    __slots__ = ('_store', '_row')
+
+    def __init__(self, store, row):
+        self._store = store
+        self._row = row
+
+    @property
+    def id(self):
+        return self._store.ids[self._row]
+
+    @property
+    def x(self):
+        return self._store.x[self._row]
+
+    @property
+    def y(self):
+        return self._store.y[self._row]
+
+    @property
+    def name(self):
+        return self._store.names[self._row]
+
+    @name.setter
+    def name(self, name):
+        self._store.names[self._row] = name
+
+    @property
+    def attributes(self):
+        return self._store.attributes.get_row(self._row)
+
+    @property
+    def layout(self):
+        return None
+
+    @property
+    def types(self):
+        return []
+
+    def add_attribute(self, key, val):
+        self._store.attributes.set(self._row, key, val)
+
+
+class NodeStore(object):
+    """Columnar storage of HydraSimpleNodes with the interface of a dict
+    mapping node IDs to nodes. Instead of one object per node, coordinates
+    are kept in flat arrays and attribute values in one typed column per
+    attribute. Nodes added to the store are decomposed into these columns,
+    reading from the store returns NodeView objects created on demand.
+    """
+
+    def __init__(self):
+        self.ids = array('l')
+        self.x = array('d')
+        self.y = array('d')
+        self.names = []
+        self.attributes = AttributeTable()
+        self._rows = dict()
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __contains__(self, node_id):
+        return node_id in self._rows
+
+    def __iter__(self):
+        return iter(self.ids)
+
+    def __getitem__(self, node_id):
+        return NodeView(self, self._rows[node_id])
+
+    def __setitem__(self, node_id, node):
+        row = self._rows.get(node_id)
+        if row is None:
+            row = len(self.ids)
+            self._rows[node_id] = row
+            self.ids.append(node_id)
+            self.x.append(node.x)
+            self.y.append(node.y)
+            self.names.append(node.name)
+        else:
+            self.x[row] = node.x
+            self.y[row] = node.y
+            self.names[row] = node.name
+        self.attributes.set_row(row, node.attributes)
+
+    def get(self, node_id, default=None):
+        if node_id in self._rows:
+            return self[node_id]
+        return default
+
+    def keys(self):
+        return iter(self.ids)
+
+    def values(self):
+        return (NodeView(self, row) for row in range(len(self.ids)))
+
+    def items(self):
+        return ((self.ids[row], NodeView(self, row))
+                for row in range(len(self.ids)))
+
+    def attribute_names(self):
+        return self.attributes.names()
+
+
+class LinkView(object):
+    """A link of a LinkStore, see NodeView.
+    """
+    __slots__ = ('_store', '_row')
+
+    def __init__(self, store, row):
+        self._store = store
+        self._row = row
+
+    @property
+    def id(self):
+        return self._store.ids[self._row]
+
+    @property
+    def start_node(self):
+        return self._store.nodes[self._store.start_ids[self._row]]
+
+    @property
+    def end_node(self):
+        return self._store.nodes[self._store.end_ids[self._row]]
+
+    @property
+    def name(self):
+        return self._store.names[self._row]
+
+    @name.setter
+    def name(self, name):
+        self._store.names[self._row] = name
+
+    @property
+    def attributes(self):
+        return self._store.attributes.get_row(self._row)
+
+    @property
+    def layout(self):
+        geometry = self._store.geometry(self._row)
+        if geometry is None:
+            return None
+        if self._store.wkb_layouts[self._row]:
+            return dict(wkb=geometry_to_wkb(geometry))
+        return dict(geometry=geometry)
+
+    @property
+    def types(self):
+        return []
+
+    def add_attribute(self, key, val):
+        self._store.attributes.set(self._row, key, val)
+
+
+class LinkStore(object):
+    """Columnar storage of HydraSimpleLinks with the interface of a list.
+    Link geometries (layout['geometry'] as GeoJSON-like LineString or
+    MultiLineString or layout['wkb']) are stored in one flat coordinate
+    array. part_offsets holds the first vertex of every part,
+    geometry_offsets the first part of every link, each with a trailing end
+    marker. Layouts are returned in the format they were added in.
+    """
+
+    def __init__(self, nodes):
+        self.nodes = nodes
+        self.ids = array('l')
+        self.start_ids = array('l')
+        self.end_ids = array('l')
+        self.names = []
+        self.attributes = AttributeTable()
+        self.coords = array('d')
+        self.part_offsets = array('l', [0])
+        self.geometry_offsets = array('l', [0])
+        # 0: no geometry, 1: LineString, 2: MultiLineString
+        self.geometry_types = array('b')
+        self.wkb_layouts = array('b')
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __getitem__(self, i):
+        if i < 0:
+            i += len(self.ids)
+        if i < 0 or i >= len(self.ids):
+            raise IndexError("link index out of range")
+        return LinkView(self, i)
+
+    def __iter__(self):
+        return (LinkView(self, row) for row in range(len(self.ids)))
+
+    def append(self, link):
+        row = len(self.ids)
+        self.ids.append(link.id)
+        self.start_ids.append(link.start_node.id)
+        self.end_ids.append(link.end_node.id)
+        self.names.append(link.name)
+        self.attributes.set_row(row, link.attributes)
+
+        geometry = None
+        if link.layout is not None and link.layout.get('wkb') is not None:
+            geometry = wkb_to_geometry(link.layout['wkb'])
+            self.wkb_layouts.append(1)
+        else:
+            if link.layout is not None:
+                geometry = link.layout.get('geometry')
+            self.wkb_layouts.append(0)
+        if geometry is None:
+            self.geometry_types.append(0)
+            parts = []
+        elif geometry['type'] == 'MultiLineString':
+            self.geometry_types.append(2)
+            parts = geometry['coordinates']
+        else:
+            self.geometry_types.append(1)
+            parts = [geometry['coordinates']]
+        for part in parts:
+            for coord in part:
+                self.coords.append(coord[0])
+                self.coords.append(coord[1])
+            self.part_offsets.append(len(self.coords) // 2)
+        self.geometry_offsets.append(len(self.part_offsets) - 1)
+
+    def geometry(self, row):
+        """Return the geometry of a link as GeoJSON-like dict.
+        """
+        if self.geometry_types[row] == 0:
+            return None
+        coords = self.coords
+        parts = []
+        for p in range(self.geometry_offsets[row],
+                       self.geometry_offsets[row + 1]):
+            parts.append([(coords[2 * v], coords[2 * v + 1])
+                          for v in range(self.part_offsets[p],
+                                         self.part_offsets[p + 1])])
+        if self.geometry_types[row] == 2:
+            return dict(type='MultiLineString', coordinates=parts)
+        return dict(type='LineString', coordinates=parts[0])
+
+    def attribute_names(self):
+        return self.attributes.names()
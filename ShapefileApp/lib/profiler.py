@@ -0,0 +1,176 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+#    Copyright (c) 2016, Philipp Meier
+#
+#    This file is part of the Hydra Platform ShapefileApp (HydraShapefileApp).
+#
+#    HydraShapefileApp is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by the
+#    Free Software Foundation, either version 3 of the License, or (at your
+#    option) any later version.
+#
+#    HydraShapefileApp is distributed in the hope that it will be useful, but
+#    WITHOUT ANY WARRANTY; without even the implied warranty of MERCHANTABILITY
+#    or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public License
+#    for more details.
+#
+#    You should have received a copy of the GNU General Public License along
+#    with HydraShapefileApp.  If not, see <http://www.gnu.org/licenses/>.
+
+
+import json
+import time
+import warnings
+import cProfile
+
+from collections import OrderedDict
+from contextlib import contextmanager
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+process_time = getattr(time, 'process_time', None) or time.clock
+
+
+class PhaseStats(object):
+
+    def __init__(self):
+        self.calls = 0
+        self.wall_seconds = 0.
+        self.cpu_seconds = 0.
+        self.peak_memory = None
+
+    def as_dict(self):
+        return OrderedDict([('calls', self.calls),
+                            ('wall_seconds', self.wall_seconds),
+                            ('cpu_seconds', self.cpu_seconds),
+                            ('peak_memory_bytes', self.peak_memory)])
+
+
+class Profiler(object):
+    """Records the wall and CPU time of named phases of an import or export,
+    counts of processed items and, with trace_memory=True, the peak of the
+    memory allocated by Python during every phase (using tracemalloc).
+    Tracing memory slows down allocations and thus distorts the timings, so
+    it is off by default. tracemalloc needs Python 3.4 or later; on older
+    versions the report states that memory tracing is unavailable instead
+    of holding peaks.
+
+    Phases can be nested and entered many times; the statistics of all calls
+    of a phase are summed. Phases marked as hot are additionally profiled
+    with cProfile if a cprofile_file is given. A disabled profiler (the
+    default) records nothing and costs next to nothing.
+    """
+
+    def __init__(self, enabled=False, trace_memory=False, cprofile_file=None):
+        self.enabled = enabled
+        self.memory_unavailable = enabled and trace_memory and \
+            tracemalloc is None
+        if self.memory_unavailable:
+            warnings.warn("Memory tracing needs tracemalloc (Python 3.4 or "
+                          "later), peak memory is not reported.")
+        self.trace_memory = enabled and trace_memory and \
+            tracemalloc is not None
+        self.cprofile_file = cprofile_file
+        self.phases = OrderedDict()
+        self.counts = OrderedDict()
+        self._stack = []
+        self._cprofile = cProfile.Profile() \
+            if enabled and cprofile_file is not None else None
+        self._hot_depth = 0
+        self._peak = 0
+        self._start = time.time()
+        if self.trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    @contextmanager
+    def phase(self, name, hot=False):
+        """Context manager measuring a phase.
+        """
+        if not self.enabled:
+            yield
+            return
+
+        stats = self.phases.get(name)
+        if stats is None:
+            stats = PhaseStats()
+            self.phases[name] = stats
+        entry = [0]
+        if self.trace_memory:
+            if len(self._stack) > 0:
+                self._stack[-1][0] = max(self._stack[-1][0],
+                                         tracemalloc.get_traced_memory()[1])
+            self._reset_peak()
+        self._stack.append(entry)
+        profile = hot and self._cprofile is not None
+        if profile:
+            if self._hot_depth == 0:
+                self._cprofile.enable()
+            self._hot_depth += 1
+
+        start = time.time()
+        cpu_start = process_time()
+        try:
+            yield
+        finally:
+            stats.calls += 1
+            stats.wall_seconds += time.time() - start
+            stats.cpu_seconds += process_time() - cpu_start
+            if profile:
+                self._hot_depth -= 1
+                if self._hot_depth == 0:
+                    self._cprofile.disable()
+            self._stack.pop()
+            if self.trace_memory:
+                peak = max(entry[0], tracemalloc.get_traced_memory()[1])
+                stats.peak_memory = max(stats.peak_memory or 0, peak)
+                self._peak = max(self._peak, peak)
+                if len(self._stack) > 0:
+                    self._stack[-1][0] = max(self._stack[-1][0], peak)
+
+    def _reset_peak(self):
+        # tracemalloc.reset_peak() is only available from Python 3.9 on,
+        # before that peaks are measured from the start of the trace.
+        if hasattr(tracemalloc, 'reset_peak'):
+            tracemalloc.reset_peak()
+
+    def count(self, name, n=1):
+        """Add n to a counter.
+        """
+        if self.enabled:
+            self.counts[name] = self.counts.get(name, 0) + n
+
+    def report(self, rpc_stats=None):
+        """Return all measurements as a dict. The statistics of the server
+        calls (see HydraTransport.stats) can be included.
+        """
+        report = OrderedDict()
+        report['total_wall_seconds'] = time.time() - self._start
+        report['phases'] = OrderedDict([(name, stats.as_dict())
+                                        for name, stats in
+                                        self.phases.items()])
+        report['counts'] = self.counts
+        if rpc_stats is not None:
+            report['rpc'] = rpc_stats
+        if self.trace_memory:
+            report['memory_tracing'] = 'on'
+            report['peak_memory_bytes'] = \
+                max(self._peak, tracemalloc.get_traced_memory()[1])
+        elif self.memory_unavailable:
+            report['memory_tracing'] = 'unavailable'
+        else:
+            report['memory_tracing'] = 'off'
+        return report
+
+    def write_report(self, filename, rpc_stats=None):
+        """Write the report as JSON and, if enabled, the cProfile statistics
+        of the hot phases.
+        """
+        with open(filename, 'w') as reportfile:
+            json.dump(self.report(rpc_stats=rpc_stats), reportfile,
+                      indent=2)
+        if self._cprofile is not None:
+            self._cprofile.dump_stats(self.cprofile_file)
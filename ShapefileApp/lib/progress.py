@@ -0,0 +1,176 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+#    Copyright (c) 2016, Philipp Meier
+#
+#    This file is part of the Hydra Platform ShapefileApp (HydraShapefileApp).
+#
+#    HydraShapefileApp is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by the
+#    Free Software Foundation, either version 3 of the License, or (at your
+#    option) any later version.
+#
+#    HydraShapefileApp is distributed in the hope that it will be useful, but
+#    WITHOUT ANY WARRANTY; without even the implied warranty of MERCHANTABILITY
+#    or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public License
+#    for more details.
+#
+#    You should have received a copy of the GNU General Public License along
+#    with HydraShapefileApp.  If not, see <http://www.gnu.org/licenses/>.
+
+
+import sys
+import json
+import time
+
+from collections import OrderedDict
+from datetime import timedelta
+
+from HydraLib.PluginLib import write_progress
+from HydraLib.PluginLib import write_output
+
+
+class PhaseProgress(object):
+    """The state of a phase of a ProgressReporter.
+    """
+
+    def __init__(self, phase, total, layer, unit, start):
+        self.phase = phase
+        self.total = total
+        self.layer = layer
+        self.unit = unit
+        self.done = 0
+        self.start = start
+        self.last = start
+
+
+class ProgressReporter(object):
+    """Reports the progress of the current phases of an import or export:
+    the layer being processed, the number of items processed, the
+    throughput and the estimated time until the layer is finished.
+
+    Phases can overlap, e.g. reading files and adding the nodes of the
+    files read so far. update() and finish() apply to the phase given by
+    name or, by default, to the phase started last.
+
+    Messages are written when a phase starts and ends and at most every
+    interval seconds in between, as Hydra plugin messages (write_progress()
+    and write_output(), shown by the Hydra GUI) if hydra=True and as JSON
+    lines to the file json_log ('-' for standard error). A reporter without
+    any output (the default) does nothing.
+    """
+
+    def __init__(self, hydra=False, json_log=None, interval=1.):
+        self.hydra = hydra
+        self.interval = interval
+        self.enabled = hydra or json_log is not None
+        if json_log == '-':
+            self._json_file = sys.stderr
+        elif json_log is not None:
+            self._json_file = open(json_log, 'w')
+        else:
+            self._json_file = None
+        self._phases = OrderedDict()
+
+    def start(self, phase, total=None, layer=None, unit='features'):
+        """Start a phase processing total items (if known) of a layer. Phases
+        without unit do not count items, only their duration is reported.
+        """
+        if not self.enabled:
+            return
+        now = time.time()
+        self._phases.pop(phase, None)
+        state = PhaseProgress(phase, total, layer, unit, now)
+        self._phases[phase] = state
+        self.emit(state, now)
+
+    def _state(self, phase):
+        if phase is not None:
+            return self._phases.get(phase)
+        if len(self._phases) == 0:
+            return None
+        return self._phases[next(reversed(self._phases))]
+
+    def update(self, n=1, phase=None):
+        """Count n processed items.
+        """
+        if not self.enabled:
+            return
+        state = self._state(phase)
+        if state is None:
+            return
+        state.done += n
+        now = time.time()
+        if now - state.last >= self.interval:
+            state.last = now
+            self.emit(state, now)
+
+    def finish(self, phase=None):
+        """End a phase.
+        """
+        if not self.enabled:
+            return
+        state = self._state(phase)
+        if state is None:
+            return
+        del self._phases[state.phase]
+        self.emit(state, time.time(), finished=True)
+
+    def status(self, state, now=None, finished=False):
+        """Return the state of a phase as a dict.
+        """
+        if now is None:
+            now = time.time()
+        elapsed = now - state.start
+        rate = state.done / elapsed if elapsed > 0 else None
+        eta = None
+        if finished:
+            eta = 0.
+        elif state.total is not None and rate:
+            eta = max(state.total - state.done, 0) / rate
+        return OrderedDict([('time', now),
+                            ('phase', state.phase),
+                            ('layer', state.layer),
+                            ('unit', state.unit),
+                            ('done', state.done),
+                            ('total', state.total),
+                            ('elapsed_seconds', elapsed),
+                            ('rate', rate),
+                            ('eta_seconds', eta),
+                            ('finished', finished)])
+
+    def message(self, status):
+        """Format a status as a line of text.
+        """
+        text = status['phase'].replace('_', ' ').capitalize()
+        if status['layer'] is not None:
+            text += ' (%s)' % status['layer']
+        if status['unit'] is not None:
+            if status['total'] is not None:
+                text += ': %d/%d %s' % (status['done'], status['total'],
+                                        status['unit'])
+            else:
+                text += ': %d %s' % (status['done'], status['unit'])
+            if status['rate'] is not None:
+                text += ', %.0f %s/s' % (status['rate'], status['unit'])
+        if status['finished']:
+            text += ', done in %s' % \
+                timedelta(seconds=int(status['elapsed_seconds']))
+        elif status['eta_seconds'] is not None:
+            text += ', ETA %s' % timedelta(seconds=int(status['eta_seconds']))
+        return text
+
+    def emit(self, state, now=None, finished=False):
+        status = self.status(state, now=now, finished=finished)
+        if self.hydra:
+            if state.total:
+                write_progress(state.done, state.total)
+            write_output(self.message(status))
+        if self._json_file is not None:
+            self._json_file.write(json.dumps(status) + '\n')
+            self._json_file.flush()
+
+    def close(self):
+        if self._json_file is not None and self._json_file is not sys.stderr:
+            self._json_file.close()
+        self._json_file = None
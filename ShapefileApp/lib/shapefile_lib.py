@@ -20,7 +20,13 @@
 
 
 import os
+import re
 import json
+import numbers
+import warnings
+import multiprocessing
+
+from collections import OrderedDict
 
 from osgeo import ogr
 from osgeo import osr
@@ -28,101 +34,435 @@ from osgeo import osr
 from HydraLib.PluginLib import temp_ids
 from HydraLib.PluginLib import HydraPluginError
 
-from epsg_lookup import prj2epsg
+from epsg_lookup import wkt2epsg
+from feature_reader import read_file_task
+from feature_reader import iter_file_batches
 from hydra_network import HydraNetwork
 from hydra_network import HydraSimpleNode
 from hydra_network import HydraSimpleLink
+from network_store import NodeStore
+from network_diff import NetworkDiff
+from incremental_upload import IncrementalUpload
+from layer_writer import write_layer_file
+from layer_writer import write_layers_file
+from formats import get_format
+from sidecar import SidecarWriter
+from sidecar import SIDECAR_TYPES
+from geometry_wkb import geometry_to_wkb
+from geometry_wkb import wkb_hex
+
+
+# Shapefile field type of every Hydra dataset type
+OGR_FIELD_TYPES = {
+    'scalar': ogr.OFTReal,
+    'descriptor': ogr.OFTString,
+    'array': ogr.OFTString,
+    'timeseries': ogr.OFTString,
+}
 
 
 class ShapefileApp(HydraNetwork):
 
-    def __init__(self, **kwargs):
+    def __init__(self, online_epsg_lookup=False, jobs=1, target_epsg=None,
+                 wkb_layout=False, import_cache=None, sidecar=False,
+                 output_format='shapefile', input_format=None, **kwargs):
         super(ShapefileApp, self).__init__(**kwargs)
         self._node_type_index = dict()
         self._link_type_index = dict()
-        self.driver = ogr.GetDriverByName('ESRI Shapefile')
+        self._node_type_schema = dict()
+        self._link_type_schema = dict()
+        self.layer_timings = []
+        self._sidecars = []
+        # Formats of exported and imported files (see formats.FORMATS), by
+        # default input files are opened with any driver that reads them
+        self.format = get_format(output_format)
+        self.input_format = get_format(input_format) \
+            if input_format is not None else None
+        self.driver = ogr.GetDriverByName(self.format.driver)
 
         self.temp_node_ids = temp_ids()
         self.temp_link_ids = temp_ids()
         self.temp_res_attr_ids = temp_ids()
 
+        self.unmatched_endpoints = []
+        self.online_epsg_lookup = online_epsg_lookup
+        self.jobs = jobs
+        # Number of features read at a time from a layer when files are not
+        # read in a pool or cached, which needs whole layers
+        self.read_chunk_size = 100000
+
+        # Imported data is projected to the target projection or, if none is
+        # given, to the projection of the first file.
+        self.epsg = target_epsg
+        self._transformations = dict()
+        # Default snapping tolerance of the last EPSG code (epsg, tolerance)
+        self._default_tolerance = (None, 0.)
+
+        # Store link geometries as WKB instead of GeoJSON in the layout
+        self.wkb_layout = wkb_layout
+
+        # An ImportCache of the batches read from unchanged files
+        self.import_cache = import_cache
+
+        # Export arrays and timeseries to sidecar files (see SidecarWriter)
+        # instead of writing placeholders
+        self.sidecar = sidecar
+
     def from_shp(self, linkfiles, nodefiles=None, net_name=None,
-                 proj_name=None):
+                 proj_name=None, node_filter=None, link_filter=None,
+                 bbox=None, batch_size=None, stream=False,
+                 update_network=None, update_scenario=None, key_field=None):
         """Import network data from shapefiles. There needs to be at least one
         shapefile that contains MultiLine objects, defining links. If no node
         file is specified, nodes will be derived from the start and end point
         of individual links.
+
+        Node and link features can be restricted by an OGR SQL WHERE clause
+        (node_filter, link_filter) and by a bounding box (minx, miny, maxx,
+        maxy) which applies to both. See HydraNetwork.save_network() for the
+        batch size and streaming.
+
+        If the ID of an existing network is given as update_network, no new
+        network is created. Only the differences between the shapefiles and
+        the network (and its scenario update_scenario, by default the first
+        one) are sent to the server, see update_saved_network().
         """
 
         self.load_attributes()
+        if update_network is not None:
+            self.load_target_network(update_network,
+                                     scenario_id=update_scenario)
 
         if nodefiles is not None:
-            self.shp_import_nodes(nodefiles)
+            self.shp_import_nodes(nodefiles, attribute_filter=node_filter,
+                                  spatial_filter=bbox)
             create_nodes = False
         else:
             create_nodes = True
 
-        self.shp_import_links(linkfiles, create_nodes=create_nodes)
+        self.shp_import_links(linkfiles, create_nodes=create_nodes,
+                              attribute_filter=link_filter,
+                              spatial_filter=bbox)
 
-        self.save_network(network_name=net_name, project_name=proj_name)
+        if update_network is not None:
+            return self.update_saved_network(key_field=key_field,
+                                             batch_size=batch_size)
+        return self.save_network(network_name=net_name,
+                                 project_name=proj_name,
+                                 batch_size=batch_size, stream=stream)
 
-    def shp_import_nodes(self, nodefiles):
-        """Import nodes from all shapefiles in a given list.
+    def load_target_network(self, network_id, scenario_id=None):
+        """Load a saved network and its data for an update. Imported data is
+        projected to the projection of this network.
         """
-        for nodefile in nodefiles:
-            nodefile = os.path.abspath(os.path.expanduser(nodefile))
-            nodeshp = self.driver.Open(nodefile)
-            if nodeshp is None:
-                raise HydraPluginError("Shapefile %s not readable!!!" %
-                                       nodefile)
-            nlayers = nodeshp.GetLayerCount()
-            for nl in range(nlayers):
-                layer = nodeshp.GetLayer(nl)
-                layer_name = layer.GetName()
-                #TODO: Project data if files feature different projections
+        with self.profiler.phase('get_network'):
+            self.hydra_network = self.conn.call('get_network',
+                                                {'network_id': network_id,
+                                                 'include_data': 'Y'})
+        self.hydra_scenario = None
+        for scenario in self.hydra_network['scenarios']:
+            if scenario_id is None or scenario['id'] == scenario_id:
+                self.hydra_scenario = scenario
+                break
+        if self.hydra_scenario is None:
+            raise HydraPluginError("Scenario %s not found in network %s." %
+                                   (scenario_id, network_id))
+
+        projection = self.hydra_network.get('projection')
+        if self.epsg is None and projection:
+            try:
+                self.epsg = int(projection.split(':')[1])
+            except (ValueError, IndexError):
+                warnings.warn('Could not load EPSG code.')
+
+    def update_saved_network(self, key_field=None, batch_size=None):
+        """Update the network loaded by load_target_network() with the
+        imported nodes and links. Resources are matched by key_field or by
+        geometry (see NetworkDiff). New resources are added in batches of
+        batch_size (see IncrementalUpload), changed resources are updated,
+        missing resources are deleted (nodes only after all links are
+        updated) and changed data is sent with one update_resourcedata
+        call. Resources which did not change are not sent at all. The
+        project is removed from the tree cache afterwards (see
+        invalidate_tree()).
+
+        Returns the NetworkDiff.
+        """
+        try:
+            return self._update_saved_network(key_field, batch_size)
+        finally:
+            self.invalidate_tree()
+
+    def _update_saved_network(self, key_field, batch_size):
+        network_id = self.hydra_network['id']
+        scenario_id = self.hydra_scenario['id']
+        with self.profiler.phase('create_attributes'):
+            self.create_attributes(self.attribute_names())
+        with self.profiler.phase('diff', hot=True):
+            diff = NetworkDiff(self, self.hydra_network, self.hydra_scenario,
+                               key_field=key_field)
+        self.profiler.count('resources_changed', diff.nchanged_resources)
+
+        # Links are deleted and updated before any node is deleted, as
+        # deleting a node also affects the links still attached to it
+        for link in diff.removed_links:
+            self.conn.call('delete_link', {'link_id': link['id']})
+
+        # Removed nodes are only deleted at the end. Those whose names are
+        # taken by new or renamed nodes are renamed out of the way first.
+        taken = set([node.name for node in diff.added_nodes] +
+                    [node.name for node, saved in diff.modified_nodes])
+        for node in diff.removed_nodes:
+            if node['name'] in taken:
+                hydra_node = dict(node)
+                hydra_node['name'] = '%s (deleted %s)' % (node['name'],
+                                                          node['id'])
+                self.conn.call('update_node', {'node': hydra_node})
+
+        if len(diff.added_nodes) > 0 or len(diff.added_links) > 0:
+            self.upload = IncrementalUpload(self, batch_size or 1000,
+                                            nodes=diff.added_nodes,
+                                            links=diff.added_links,
+                                            network_id=network_id,
+                                            scenario_id=scenario_id,
+                                            node_ids=diff.node_ids)
+            self.upload.run()
+            node_ids = self.upload.node_ids
+        else:
+            node_ids = diff.node_ids
+
+        for node, saved in diff.modified_nodes:
+            hydra_node = dict(saved)
+            hydra_node['name'] = node.name
+            hydra_node['x'] = repr(node.x)
+            hydra_node['y'] = repr(node.y)
+            self.conn.call('update_node', {'node': hydra_node})
+
+        for link, saved in diff.modified_links:
+            hydra_link = dict(saved)
+            hydra_link['name'] = link.name
+            hydra_link['node_1_id'] = node_ids[link.start_node.id]
+            hydra_link['node_2_id'] = node_ids[link.end_node.id]
+            hydra_link['layout'] = self.hydra_layout(link)
+            self.conn.call('update_link', {'link': hydra_link})
+
+        for node in diff.removed_nodes:
+            self.conn.call('delete_node', {'node_id': node['id']})
+
+        res_scens = list(diff.changed_data)
+        for resource_type, resource_id, key, val in diff.new_res_attrs:
+            res_attr = self.conn.call('add_resource_attribute',
+                                      {'resource_type': resource_type,
+                                       'resource_id': resource_id,
+                                       'attr_id': self.attr_ids[key],
+                                       'is_var': 'N'})
+            res_scens.append(dict(attr_id=res_attr.attr_id,
+                                  resource_attr_id=res_attr.id,
+                                  value=self.create_dataset(key, val)))
+        if len(res_scens) > 0:
+            self.conn.call('update_resourcedata',
+                           {'scenario_id': scenario_id,
+                            'resource_scenarios': res_scens})
+
+        for res_scen in diff.removed_data:
+            self.conn.call('delete_resourcedata',
+                           {'scenario_id': scenario_id,
+                            'resource_scenario': res_scen})
+
+        return diff
+
+    def shp_import_nodes(self, nodefiles, attribute_filter=None,
+                         spatial_filter=None):
+        """Import nodes from all shapefiles in a given list. See
+        feature_reader.set_filters() for the optional filters.
+        """
+        layer = None
+        for batch in self.read_batches(nodefiles, 'Point', attribute_filter,
+                                       spatial_filter):
+            if (batch.filename, batch.layer_name) != layer:
+                layer = (batch.filename, batch.layer_name)
+                self.progress.finish('import_nodes')
+                self.progress.start('import_nodes', total=batch.layer_size,
+                                    layer=batch.layer_name)
+            with self.profiler.phase('add_nodes', hot=True):
+                self.add_nodes_from_batch(batch)
+        self.progress.finish('import_nodes')
+
+    def shp_import_links(self, linkfiles, create_nodes=False,
+                         attribute_filter=None, spatial_filter=None):
+        """Import links from a given list of shapefiles. See
+        feature_reader.set_filters() for the optional filters.
+        """
+        layer = None
+        for batch in self.read_batches(linkfiles, 'LineString',
+                                       attribute_filter, spatial_filter):
+            if (batch.filename, batch.layer_name) != layer:
+                layer = (batch.filename, batch.layer_name)
+                self.progress.finish('import_links')
+                self.progress.start('import_links', total=batch.layer_size,
+                                    layer=batch.layer_name)
+            with self.profiler.phase('add_links', hot=True):
+                self.add_links_from_batch(batch, create_nodes=create_nodes)
+        self.progress.finish('import_links')
+
+        if len(self.unmatched_endpoints) > 0:
+            tolerance = self.snap_tolerance
+            if tolerance is None:
+                tolerance = self.default_snap_tolerance()
+            warnings.warn("%s link endpoints are further than %s map units "
+                          "from any node, the respective links were "
+                          "skipped." % (len(self.unmatched_endpoints),
+                                        tolerance))
+
+    def read_batches(self, filenames, geometry_type, attribute_filter=None,
+                     spatial_filter=None):
+        """Read all layers of a list of files into FeatureBatches. With more
+        than one job, files are read in a pool of worker processes. Batches
+        are returned in the order of files and layers in any case, so
+        resources are named and numbered the same way no matter how the work
+        is scheduled. Files found in the import cache (if any) are not read
+        at all. The progress of the files is reported as phase read_files.
+
+        Without a pool and import cache, layers are read and returned in
+        batches of at most read_chunk_size features while they are consumed,
+        so only one batch of features is held in memory at a time.
+        """
+        if isinstance(spatial_filter, ogr.Geometry):
+            spatial_filter = spatial_filter.ExportToWkt()
+        driver = self.input_format.driver \
+            if self.input_format is not None else None
+        tasks = [(os.path.abspath(os.path.expanduser(filename)),
+                  geometry_type, attribute_filter, spatial_filter, driver)
+                 for filename in filenames]
+
+        if self.import_cache is not None:
+            with self.profiler.phase('import_cache'):
+                cached = [self.import_cache.load(task) for task in tasks]
+        else:
+            cached = [None] * len(tasks)
+        missing = [task for task, batches in zip(tasks, cached)
+                   if batches is None]
+
+        pool = None
+        if self.jobs > 1 and len(missing) > 1:
+            pool = multiprocessing.Pool(min(self.jobs, len(missing)))
+            results = pool.imap(read_file_task, missing)
+        elif self.import_cache is None:
+            results = (iter_file_batches(*task,
+                                         chunk_size=self.read_chunk_size)
+                       for task in missing)
+        else:
+            results = (read_file_task(task) for task in missing)
+
+        self.progress.start('read_files', total=len(tasks), unit='files')
+        try:
+            for task, file_batches in zip(tasks, cached):
+                if file_batches is None:
+                    with self.profiler.phase('read_files', hot=True):
+                        file_batches = next(results)
+                    self.profiler.count('files_read')
+                    if self.import_cache is not None:
+                        with self.profiler.phase('import_cache'):
+                            self.import_cache.store(task, file_batches)
+                else:
+                    self.profiler.count('files_cached')
+                # A file read in chunks is only done when all are consumed
+                streamed = not isinstance(file_batches, list)
+                if not streamed:
+                    self.progress.update(phase='read_files')
+                for batch in self._checked_batches(file_batches):
+                    yield batch
+                if streamed:
+                    self.progress.update(phase='read_files')
+            self.progress.finish('read_files')
+        finally:
+            if pool is not None:
+                pool.terminate()
+                pool.join()
+
+    def _checked_batches(self, batches):
+        """Identify the projection of the network from the first batch (if no
+        target EPSG code is set) and project all batches to it.
+        """
+        batches = iter(batches)
+        while True:
+            # Batches of a layer read in chunks are read here
+            with self.profiler.phase('read_files', hot=True):
+                batch = next(batches, None)
+            if batch is None:
+                return
+            with self.profiler.phase('project'):
                 if self.epsg is None:
-                    layer_proj = layer.GetSpatialRef()
-                    layer_proj.AutoIdentifyEPSG()
-                    self.epsg = layer_proj.GetAuthorityCode(None)
-                    if self.epsg is None:
-                        prj_file = os.path.splitext(nodefile)[0] + '.prj'
-                        self.epsg = prj2epsg(prj_file)['epsg'][0]
-
-                nfeatures = layer.GetFeatureCount()
-                for nf in range(nfeatures):
-                    feature = layer.GetFeature(nf)
-                    feature_json = feature.ExportToJson()
-                    self.add_node_from_json(feature_json)
-
-    def shp_import_links(self, linkfiles, create_nodes=False):
-        """Import links from a given list of shapefiles.
+                    self.epsg = self._identify_epsg(batch)
+                self._project_batch(batch)
+            self.profiler.count('features_read', len(batch))
+            yield batch
+
+    def _project_batch(self, batch):
+        """Transform the coordinates of a batch into the projection of the
+        network. This happens before nodes are snapped and merged, so files
+        in different projections fit together.
         """
+        if self.epsg is None:
+            return
+        if batch.srs_wkt is None:
+            warnings.warn("%s has no projection, assuming EPSG:%s." %
+                          (batch.filename, self.epsg))
+            return
+
+        transformation = self._transformations.get(batch.srs_wkt)
+        if transformation is None:
+            source = osr.SpatialReference(batch.srs_wkt)
+            target = osr.SpatialReference()
+            target.ImportFromEPSG(int(self.epsg))
+            if hasattr(osr, 'OAMS_TRADITIONAL_GIS_ORDER'):
+                source.SetAxisMappingStrategy(osr.OAMS_TRADITIONAL_GIS_ORDER)
+                target.SetAxisMappingStrategy(osr.OAMS_TRADITIONAL_GIS_ORDER)
+            if source.IsSame(target):
+                transformation = False
+            else:
+                transformation = osr.CoordinateTransformation(source, target)
+            self._transformations[batch.srs_wkt] = transformation
 
-        for linkfile in linkfiles:
-            linkfile = os.path.abspath(os.path.expanduser(linkfile))
-            linkshp = self.driver.Open(linkfile)
-            if linkshp is None:
-                raise HydraPluginError("Shapefile %s not readable!!!" %
-                                       linkfile)
-            nlayers = linkshp.GetLayerCount()
-            for nl in range(nlayers):
-                layer = linkshp.GetLayer(nl)
-                layer_name = layer.GetName()
-                #TODO: Project data if files feature different projections
-                if self.epsg is None:
-                    layer_proj = layer.GetSpatialRef()
-                    layer_proj.AutoIdentifyEPSG()
-                    self.epsg = layer_proj.GetAuthorityCode(None)
-                    if self.epsg is None:
-                        prj_file = os.path.splitext(linkfile)[0] + '.prj'
-                        self.epsg = prj2epsg(prj_file)['epsg'][0]
-
-                nfeatures = layer.GetFeatureCount()
-                for nf in range(nfeatures):
-                    feature = layer.GetFeature(nf)
-                    feature_json = feature.ExportToJson()
-                    self.add_link_from_json(feature_json,
-                                            create_nodes=create_nodes)
+        if transformation:
+            batch.transform(transformation)
+
+    def _identify_epsg(self, batch):
+        """Return the EPSG code of the projection of a batch.
+        """
+        if batch.srs_wkt is None:
+            return None
+        layer_proj = osr.SpatialReference(batch.srs_wkt)
+        layer_proj.AutoIdentifyEPSG()
+        epsg = layer_proj.GetAuthorityCode(None)
+        if epsg is None:
+            result = wkt2epsg(batch.srs_wkt, online=self.online_epsg_lookup)
+            if result is None or len(result['epsg']) == 0:
+                raise HydraPluginError(
+                    "Could not identify the EPSG code of the projection "
+                    "of %s." % batch.filename)
+            epsg = result['epsg'][0]
+        return epsg
+
+    def add_nodes_from_batch(self, batch, chunk_size=10000):
+        """Add all nodes of a FeatureBatch, in chunks of chunk_size nodes.
+        """
+        nodes = []
+        for x, y, properties in batch.iter_points():
+            nodes.append(self._build_node(x, y, properties))
+            if len(nodes) == chunk_size:
+                self.add_nodes(nodes)
+                self.progress.update(len(nodes), phase='import_nodes')
+                nodes = []
+        self.add_nodes(nodes)
+        self.progress.update(len(nodes), phase='import_nodes')
+
+    def add_links_from_batch(self, batch, create_nodes=False):
+        """Add all links of a FeatureBatch and, if requested, their nodes.
+        """
+        for geometry, properties in batch.iter_lines():
+            self._add_link(geometry, properties, create_nodes=create_nodes)
+            self.progress.update(phase='import_links')
 
     def add_node_from_json(self, nodejson):
         """Add a new node from a GeoJSON string.
@@ -134,10 +474,16 @@ class ShapefileApp(HydraNetwork):
                 nodedict['geometry']['type'])
         x = nodedict['geometry']['coordinates'][0]
         y = nodedict['geometry']['coordinates'][1]
+        self._add_node(x, y, nodedict.get('properties'))
+
+    def _add_node(self, x, y, properties):
+        self.add_node(self._build_node(x, y, properties))
+
+    def _build_node(self, x, y, properties):
         node = HydraSimpleNode(x=x, y=y)
         node.id = self.temp_node_ids.next()
-        if nodedict.get('properties') is not None:
-            for key, val in nodedict['properties'].iteritems():
+        if properties is not None:
+            for key, val in properties.iteritems():
                 if key.lower() == 'name':
                     node.name = val
                 else:
@@ -145,57 +491,75 @@ class ShapefileApp(HydraNetwork):
 
         if node.name is None:
             node.name = "Node %s" % abs(node.id)
+        return node
+
+    def default_snap_tolerance(self):
+        """Snap link endpoints to nodes within 1 mm: 0.001 map units in
+        metric projections, converted for other linear units and 1e-8
+        degrees in geographic coordinate systems.
+        """
+        if self.epsg is None:
+            return 0.
+        if self._default_tolerance[0] != self.epsg:
+            projection = osr.SpatialReference()
+            projection.ImportFromEPSG(int(self.epsg))
+            if projection.IsGeographic():
+                tolerance = 1e-8
+            else:
+                tolerance = 1e-3 / projection.GetLinearUnits()
+            self._default_tolerance = (self.epsg, tolerance)
+        return self._default_tolerance[1]
+
+    def _create_node(self, x, y):
+        node = HydraSimpleNode(x=x, y=y)
+        node.id = self.temp_node_ids.next()
+        node.name = "Node %s" % abs(node.id)
         self.add_node(node)
+        return node
 
     def add_link_from_json(self, linkjson, create_nodes=False):
         """Add a new link and respective nodes from a GeoJSON string.
         """
-
         linkdict = json.loads(linkjson)
-        us_node_coord = tuple(linkdict['geometry']['coordinates'][0])
-        ds_node_coord = tuple(linkdict['geometry']['coordinates'][-1])
+        self._add_link(linkdict['geometry'], linkdict.get('properties'),
+                       create_nodes=create_nodes)
 
-        if create_nodes:
-            if self._node_coord_index.get((us_node_coord[0], us_node_coord[1]))\
-                    is not None:
-                us_node = self.nodes[self._node_coord_index[(us_node_coord[0],
-                                                             us_node_coord[1])]]
-            else:
-                us_node = HydraSimpleNode(x=us_node_coord[0],
-                                          y=us_node_coord[1])
-                us_node.id = self.temp_node_ids.next()
-                us_node.name = "Node %s" % abs(us_node.id)
-                self.add_node(us_node)
-            if self._node_coord_index.get((ds_node_coord[0], ds_node_coord[1]))\
-                    is not None:
-                ds_node = self.nodes[self._node_coord_index[(ds_node_coord[0],
-                                                             ds_node_coord[1])]]
-            else:
-                ds_node = HydraSimpleNode(x=ds_node_coord[0],
-                                          y=ds_node_coord[1])
-                ds_node.id = self.temp_node_ids.next()
-                ds_node.name = "Node %s" % abs(ds_node.id)
-                self.add_node(ds_node)
+    def _add_link(self, geometry, properties, create_nodes=False):
+        if geometry['type'] == 'MultiLineString':
+            us_node_coord = tuple(geometry['coordinates'][0][0][:2])
+            ds_node_coord = tuple(geometry['coordinates'][-1][-1][:2])
         else:
-            round_digits = range(12, 0, -1)
-            us_i = 0
-            while self._node_coord_index.get(us_node_coord) is None:
-                us_node_coord = tuple([round(i, round_digits[us_i])
-                                       for i in us_node_coord])
-                us_i += 1
-            ds_i = 0
-            while self._node_coord_index.get(ds_node_coord) is None:
-                ds_node_coord = tuple([round(i, round_digits[ds_i])
-                                       for i in ds_node_coord])
-                ds_i += 1
-            us_node = self.nodes[self._node_coord_index[us_node_coord]]
-            ds_node = self.nodes[self._node_coord_index[ds_node_coord]]
+            us_node_coord = tuple(geometry['coordinates'][0][:2])
+            ds_node_coord = tuple(geometry['coordinates'][-1][:2])
+
+        # Nodes created from endpoints are only merged with nodes at exactly
+        # the same coordinates, unless a snapping tolerance is set
+        exact = create_nodes and self.snap_tolerance is None
+        us_node = self.find_node(us_node_coord[0], us_node_coord[1],
+                                 exact=exact)
+        ds_node = self.find_node(ds_node_coord[0], ds_node_coord[1],
+                                 exact=exact)
+
+        if create_nodes:
+            if us_node is None:
+                us_node = self._create_node(*us_node_coord)
+            if ds_node is None:
+                ds_node = self._create_node(*ds_node_coord)
+        elif us_node is None or ds_node is None:
+            for node, coord in ((us_node, us_node_coord),
+                                (ds_node, ds_node_coord)):
+                if node is None:
+                    self.unmatched_endpoints.append(coord)
+            return
 
         link = HydraSimpleLink(start_node=us_node, end_node=ds_node)
         link.id = self.temp_link_ids.next()
-        link.layout = dict(geometry=linkdict['geometry'])
-        if linkdict.get('properties') is not None:
-            for key, val in linkdict['properties'].iteritems():
+        if self.wkb_layout:
+            link.layout = dict(wkb=geometry_to_wkb(geometry))
+        else:
+            link.layout = dict(geometry=geometry)
+        if properties is not None:
+            for key, val in properties.iteritems():
                 if key.lower() == 'name':
                     link.name = val
                 else:
@@ -234,7 +598,7 @@ class ShapefileApp(HydraNetwork):
         hydra_link['attributes'] = []
         hydra_link['node_1_id'] = link.start_node.id
         hydra_link['node_2_id'] = link.end_node.id
-        hydra_link['layout'] = link.layout
+        hydra_link['layout'] = self.hydra_layout(link)
 
         for key, val in link.attributes.iteritems():
             res_attr = self.create_attribute(key, val)
@@ -242,13 +606,39 @@ class ShapefileApp(HydraNetwork):
 
         return hydra_link
 
+    def hydra_layout(self, link):
+        """Return the layout of a link as it is sent to the server, with WKB
+        encoded as hex string.
+        """
+        if link.layout is not None and link.layout.get('wkb') is not None:
+            layout = dict(link.layout)
+            layout['wkb'] = wkb_hex(link.layout['wkb'])
+            return layout
+        return link.layout
+
+    def attribute_names(self):
+        """Collect the names of all attributes of imported nodes and links.
+        """
+        names = set()
+        if isinstance(self.nodes, NodeStore):
+            names.update(self.nodes.attribute_names())
+            names.update(self.links.attribute_names())
+            return names
+
+        for node in self.nodes.values():
+            names.update(node.attributes.keys())
+        for link in self.links:
+            names.update(link.attributes.keys())
+        return names
+
     def create_attribute(self, key, val):
         """Create a resource attribute and a resource scenario.
         """
         if self.attr_ids.get(key) is None:
             attr = dict(name=key)
 
-            #TODO: This is not really efficient, but it works
+            # Missing attributes are created in bulk by save_network(), this
+            # only happens for attributes added after that.
             attr = self.conn.call('add_attribute', {'attr': attr})
             self.attr_ids[key] = attr.id
             self.attrs[attr.id] = attr
@@ -261,217 +651,300 @@ class ShapefileApp(HydraNetwork):
         if val is None:
             res_attr['attr_is_var'] = 'Y'
         else:
-            dataset = dict(id=None,
-                           type=None,
-                           unit=None,
-                           dimension=None,
-                           name='Shapefile data %s' % key,
-                           value=None,
-                           hidden='N',
-                           metadata='{"source": "ShapefileApp"}',
-                           )
-            if isinstance(val, str) or isinstance(val, unicode):
-                dataset['type'] = 'descriptor'
-            elif isinstance(val, float) or isinstance(val, int):
-                dataset['type'] = 'scalar'
-
-            dataset['value'] = str(val)
-
             res_scen = dict(attr_id=attr.id,
                             resource_attr_id=res_attr['id'],
-                            value=dataset)
+                            value=self.create_dataset(key, val))
 
             self.hydra_scenario['resourcescenarios'].append(res_scen)
 
         return res_attr
 
+    def create_dataset(self, key, val):
+        """Create the dataset of an attribute value.
+        """
+        dataset = dict(id=None,
+                       type=None,
+                       unit=None,
+                       dimension=None,
+                       name='Shapefile data %s' % key,
+                       value=None,
+                       hidden='N',
+                       metadata='{"source": "ShapefileApp"}',
+                       )
+        if isinstance(val, str) or isinstance(val, unicode):
+            dataset['type'] = 'descriptor'
+        elif isinstance(val, numbers.Number):
+            dataset['type'] = 'scalar'
+
+        dataset['value'] = str(val)
+        return dataset
+
     def build_node_type_index(self):
-        for node in self.nodes.values():
-            combined_type = '_'.join([t.name for t in node.types])
-            if combined_type == '':
-                combined_type = 'Generic node'
-            if self._node_type_index.get(combined_type) is None:
-                self._node_type_index[combined_type] = [node]
-            else:
-                self._node_type_index[combined_type].append(node)
+        self._build_type_index(self.nodes.values(), 'Generic node',
+                               self._node_type_index,
+                               self._node_type_schema)
 
     def build_link_type_index(self):
-        for link in self.links:
-            combined_type = '_'.join([t.name for t in link.types])
+        self._build_type_index(self.links, 'Generic link',
+                               self._link_type_index,
+                               self._link_type_schema)
+
+    def _build_type_index(self, resources, default_type, type_index,
+                          type_schema):
+        """Group resources by their combined type and collect the field type
+        of every attribute per combined type, all in one pass.
+        """
+        for resource in resources:
+            combined_type = '_'.join([t.name for t in resource.types])
             if combined_type == '':
-                combined_type = 'Generic link'
-            if self._link_type_index.get(combined_type) is None:
-                self._link_type_index[combined_type] = [link]
+                combined_type = default_type
+            if type_index.get(combined_type) is None:
+                type_index[combined_type] = [resource]
+                type_schema[combined_type] = OrderedDict()
             else:
-                self._link_type_index[combined_type].append(link)
+                type_index[combined_type].append(resource)
+
+            schema = type_schema[combined_type]
+            for attr in resource.attributes:
+                if attr.dataset_type is None:
+                    continue
+                field_type = self._get_ogr_type(attr)
+                if schema.get(attr.name) is None:
+                    schema[attr.name] = field_type
+                elif schema[attr.name] != field_type:
+                    raise HydraPluginError(
+                        "Ambiguous data type for attribute '%s'." %
+                        attr.name)
 
     def to_shp(self, outfolder, overwrite=False):
-        """Export the network to a shapefile. Up to now the export only
-        supports strings and scalars as attribute values.
+        """Export the network to a shapefile. Shapefiles only hold strings
+        and scalars as attribute values. Arrays and timeseries are replaced
+        by a placeholder or, in sidecar mode, written to an NPZ file next to
+        the shapefile, with the number of the entry in the attribute field.
+
+        Every combined node and link type is written to its own layer, in its
+        own file or, for formats like GeoPackage, all in one file named after
+        the network (see formats.FORMATS). With more than one job, separate
+        files are written in parallel by a pool of worker processes. Returns
+        a list of (layer name, number of features, seconds) for all layers
+        written.
         """
-        #TODO: Create folder if necessary
         outfolder = os.path.abspath(os.path.expanduser(outfolder))
+        if not os.path.isdir(outfolder):
+            os.makedirs(outfolder)
 
-        self.build_node_type_index()
-        self.build_link_type_index()
+        with self.profiler.phase('build_type_index', hot=True):
+            self.build_node_type_index()
+            self.build_link_type_index()
 
         projection = osr.SpatialReference()
         projection.ImportFromEPSG(int(self.hydra_network.projection.split(':')[1]))
 
+        # Formats holding all layers in one file are written serially
+        parallel = self.jobs > 1 and not self.format.single_file and \
+            len(self._node_type_index) + len(self._link_type_index) > 1
+
+        outfile = None
+        if self.format.single_file:
+            outfile = os.path.join(outfolder,
+                                   re.sub(r'[^\w\-]+', '_',
+                                          self.hydra_network['name']) +
+                                   self.format.extension)
+            self._check_outfile(outfile, overwrite)
+
+        self._sidecars = []
+        snapshots = self._layer_snapshots(outfolder, projection, overwrite,
+                                          packed=parallel, outfile=outfile)
+        with self.profiler.phase('write_layers', hot=True):
+            self.layer_timings = []
+            if self.format.single_file:
+                snapshots = list(snapshots)
+                if len(snapshots) > 0:
+                    self.layer_timings = write_layers_file(snapshots)
+            elif parallel:
+                self.layer_timings = self._write_parallel(snapshots)
+            else:
+                self.layer_timings = [write_layer_file(snapshot)
+                                      for snapshot in snapshots]
+
+        self.profiler.count('features_written',
+                            sum([timing[1] for timing in self.layer_timings]))
+
+        with self.profiler.phase('write_sidecars'):
+            for sidecar in self._sidecars:
+                sidecar.save()
+
+        return self.layer_timings
+
+    def _layer_snapshots(self, outfolder, projection, overwrite, packed=False,
+                         outfile=None):
+        """Generate the snapshots of all node and link layers, see
+        _layer_snapshot().
+        """
         for nodetype in self._node_type_index.keys():
-            outfile = outfolder + os.path.sep +\
-                nodetype.replace(" ", "_") + ".shp"
-            if overwrite and os.path.exists(outfile):
-                self.driver.DeleteDataSource(outfile)
-            elif os.path.exists(outfile) and not overwrite:
-                raise HydraPluginError("Outputfile exists!")
-            basepath, filename = os.path.split(outfile)
-
-            target_file = self.driver.CreateDataSource(outfile)
-
-            target_layer = target_file.CreateLayer(nodetype.encode('ascii',
-                                                                   'ignore'),
-                                                   projection,
-                                                   geom_type=ogr.wkbPoint)
-
-            featureDefn = target_layer.GetLayerDefn()
-
-            # Collect all attributes to add them to the layer
-            attrs = dict()
-            field_type = dict()
-
-            for node in self._node_type_index[nodetype]:
-                for attr in node.attributes:
-                    attr = self._filter_data_types(attr)
-                    if attrs.get(attr.name) is None:
-                        attrs[attr.name] = [self._get_ogr_type(attr)]
-                    else:
-                        attrs[attr.name].append(self._get_ogr_type(attr))
-
-            for attr in attrs.keys():
-                type_set = set(attrs[attr])
-                if len(type_set) > 1:
-                    raise HydraPluginError(
-                        "Ambiguous data type for attribute '%s'." % attr)
-                else:
-                    field_type[attr] = type_set.pop()
-
-            field = dict()
-            name_field = ogr.FieldDefn('name', ogr.OFTString)
-            target_layer.CreateField(name_field)
-            for attr in field_type.keys():
-                field[attr] = ogr.FieldDefn(attr.encode('ascii', 'ignore'),
-                                            field_type[attr])
-                target_layer.CreateField(field[attr])
-
-            for node in self._node_type_index[nodetype]:
-                #node_wkt = "POINT (%s %s)" % (node.x, node.y)
-                #node_geom = ogr.CreateGeometryFromWkt(node_wkt)
-                node_geom = ogr.Geometry(ogr.wkbPoint)
-                node_geom.AddPoint(node.x, node.y)
-                #node_dict = dict(type="Point",
-                #                 coordinates=[node.x, node.y])
-                #node_json = json.dumps(node_dict)
-                #node_geom = ogr.CreateGeometryFromJson(node_json)
-                node_feature = ogr.Feature(featureDefn)
-                node_feature.SetGeometry(node_geom)
-                node_feature.SetField('name',
-                                      node.name.encode('ascii', 'ignore'))
-                for attr in node.attributes:
-                    node_feature.SetField( \
-                        attr.name.encode('ascii', 'ignore')[:10],
-                        attr.value)
-                target_layer.CreateFeature(node_feature)
-                node_feature.Destroy()
-
-            target_file.Destroy()
-
-        attrs = dict()
-        field_type = dict()
+            with self.profiler.phase('prepare_layers'):
+                snapshot = self._layer_snapshot(
+                    outfolder, nodetype, self._node_type_index[nodetype],
+                    self._node_type_schema[nodetype], projection, ogr.wkbPoint,
+                    self._node_geometry, overwrite, packed=packed,
+                    outfile=outfile)
+            yield snapshot
 
         for linktype in self._link_type_index.keys():
-            outfile = outfolder + os.path.sep +\
-                linktype.replace(" ", "_") + ".shp"
-            if overwrite and os.path.exists(outfile):
-                self.driver.DeleteDataSource(outfile)
-            elif os.path.exists(outfile) and not overwrite:
-                raise HydraPluginError("Outputfile exists!")
-            basepath, filename = os.path.split(outfile)
-
-            target_file = self.driver.CreateDataSource(outfile)
-
-            target_layer = target_file.CreateLayer(linktype.encode('ascii'),
-                projection, geom_type=ogr.wkbMultiLineString)
-
-            featureDefn = target_layer.GetLayerDefn()
-
-            attrs = dict()
-            field_type = dict()
-
-            for link in self._link_type_index[linktype]:
-                for attr in link.attributes:
-                    attr = self._filter_data_types(attr)
-                    if attrs.get(attr.name) is None:
-                        attrs[attr.name] = [self._get_ogr_type(attr)]
-                    else:
-                        attrs[attr.name].append(self._get_ogr_type(attr))
-
-            for attr in attrs.keys():
-                type_set = set(attrs[attr])
-                if len(type_set) > 1:
-                    raise HydraPluginError(
-                        "Ambiguous data type for attribute '%s'." % attr)
-                else:
-                    field_type[attr] = type_set.pop()
-
-            field = dict()
-            name_field = ogr.FieldDefn('name', ogr.OFTString)
-            target_layer.CreateField(name_field)
-            for attr in field_type.keys():
-                field[attr] = ogr.FieldDefn(attr.encode('ascii', 'ignore'),
-                                            field_type[attr])
-                target_layer.CreateField(field[attr])
-
-            for link in self._link_type_index[linktype]:
-                if 'geometry' in link.layout.keys():
-                    geom = json.dumps(link.layout['geometry'])
-                    link_geom = ogr.CreateGeometryFromJson(geom)
-                else:
-                    link_geom = ogr.Geometry(ogr.wkbLineString)
-                    link_geom.AddPoint(link.start_node.x, link.start_node.y)
-                    link_geom.AddPoint(link.end_node.x, link.end_node.y)
-                link_feature = ogr.Feature(featureDefn)
-                link_feature.SetGeometry(link_geom)
-                link_feature.SetField('name',
-                                      link.name.encode('ascii', 'ignore'))
-                for attr in link.attributes:
-                    link_feature.SetField( \
-                        attr.name.encode('ascii', 'ignore')[:10],
-                        attr.value)
-                target_layer.CreateFeature(link_feature)
-                link_feature.Destroy()
-
-            target_file.Destroy()
+            with self.profiler.phase('prepare_layers'):
+                snapshot = self._layer_snapshot(
+                    outfolder, linktype, self._link_type_index[linktype],
+                    self._link_type_schema[linktype], projection,
+                    ogr.wkbMultiLineString, self._link_geometry, overwrite,
+                    packed=packed, outfile=outfile)
+            yield snapshot
+
+    def _write_parallel(self, snapshots):
+        """Write the layers of packed snapshots to their files in a pool of
+        worker processes. Snapshots are only prepared while fewer than jobs
+        layers are being written, so at most jobs + 1 packed layers are held
+        in memory and preparing layers overlaps with writing them. Layers
+        are reported as phase write_layers as soon as they are written.
+        Returns the timings in the order of the snapshots.
+        """
+        nlayers = len(self._node_type_index) + len(self._link_type_index)
+        pool = multiprocessing.Pool(min(self.jobs, nlayers))
+        self.progress.start('write_layers', total=nlayers, unit='layers')
+        results = []
+        running = []
+        try:
+            for snapshot in snapshots:
+                while len(running) >= self.jobs:
+                    self._collect_layers(results, running)
+                results.append(pool.apply_async(write_layer_file,
+                                                (snapshot,)))
+                running.append(len(results) - 1)
+            while len(running) > 0:
+                self._collect_layers(results, running)
+        finally:
+            pool.terminate()
+            pool.join()
+        self.progress.finish('write_layers')
+        return [result.get() for result in results]
+
+    def _collect_layers(self, results, running, poll_interval=0.1):
+        """Wait until at least one of the running layers is written and
+        remove all written layers from running.
+        """
+        while True:
+            done = [i for i in running if results[i].ready()]
+            if len(done) > 0:
+                break
+            results[running[0]].wait(poll_interval)
+        for i in done:
+            running.remove(i)
+            # Raises the exception of a failed layer right away
+            results[i].get()
+            self.progress.update(phase='write_layers')
+
+    def _layer_snapshot(self, outfolder, resource_type, resources, schema,
+                        projection, geom_type, geometry_func, overwrite,
+                        packed=False, outfile=None):
+        """Prepare the export of all resources of one combined type, see
+        layer_writer.write_layer_file(). Packed snapshots contain a list of
+        features and can be sent to a worker process, otherwise features are
+        generated while they are written. Geometries are passed as WKB or
+        GeoJSON-like dicts and only turned into OGR geometries by the
+        writer, i.e. in the worker process. Unless the
+        file is given (for formats holding all layers in one file), every
+        type is written to its own file.
+        """
+        basename = outfolder + os.path.sep + resource_type.replace(" ", "_")
+        if outfile is None:
+            outfile = basename + self.format.extension
+            self._check_outfile(outfile, overwrite)
+
+        sidecar = None
+        if self.sidecar:
+            sidecar = SidecarWriter(basename + '.npz')
+            if os.path.exists(sidecar.filename):
+                if not overwrite:
+                    raise HydraPluginError("Outputfile exists!")
+                os.remove(sidecar.filename)
+            self._sidecars.append(sidecar)
+
+        fields = [(attr_name.encode('ascii', 'ignore'), field_type)
+                  for attr_name, field_type in schema.items()]
+        field_index = dict([(attr_name, i)
+                            for i, attr_name in enumerate(schema.keys())])
+
+        def features():
+            self.progress.start('prepare_layer' if packed else 'export_layer',
+                                total=len(resources), layer=resource_type)
+            # Keep the data of all attributes of the layer while it is read
+            if self.dataset_cache is not None:
+                self.dataset_cache.begin_layer()
+            try:
+                for resource in resources:
+                    values = [None] * len(fields)
+                    for attr in resource.attributes:
+                        i = field_index.get(attr.name)
+                        if i is None or attr.value is None:
+                            continue
+                        if sidecar is not None and \
+                                attr.dataset_type in SIDECAR_TYPES:
+                            values[i] = sidecar.add(resource.id, attr.name,
+                                                    attr.dataset_type,
+                                                    attr.value)
+                        else:
+                            values[i] = self._filter_value(attr)
+                    yield (geometry_func(resource),
+                           resource.name.encode('ascii', 'ignore'),
+                           values)
+                    self.progress.update()
+            finally:
+                if self.dataset_cache is not None:
+                    self.dataset_cache.end_layer()
+            self.progress.finish()
+
+        return dict(driver=self.driver.GetName(),
+                    filename=outfile,
+                    layer_name=resource_type.encode('ascii', 'ignore'),
+                    projection=projection.ExportToWkt(),
+                    geom_type=geom_type,
+                    fields=fields,
+                    features=list(features()) if packed else features(),
+                    options=self.format.layer_options,
+                    transaction_size=self.format.transaction_size)
+
+    def _check_outfile(self, outfile, overwrite):
+        if overwrite and os.path.exists(outfile):
+            self.driver.DeleteDataSource(outfile)
+        elif os.path.exists(outfile) and not overwrite:
+            raise HydraPluginError("Outputfile exists!")
+
+    def _node_geometry(self, node):
+        return dict(type='Point', coordinates=(node.x, node.y))
+
+    def _link_geometry(self, link):
+        if link.layout is not None and link.layout.get('wkb') is not None:
+            return link.layout['wkb']
+        elif link.layout is not None and 'geometry' in link.layout.keys():
+            return link.layout['geometry']
+        return dict(type='LineString',
+                    coordinates=[(link.start_node.x, link.start_node.y),
+                                 (link.end_node.x, link.end_node.y)])
 
     def _get_ogr_type(self, attr):
         """Return the field type used for an attribute type."""
+        if self.sidecar and attr.dataset_type in SIDECAR_TYPES:
+            return ogr.OFTInteger
+        return OGR_FIELD_TYPES.get(attr.dataset_type, ogr.OFTString)
+
+    def _filter_value(self, attr):
+        """Return the value of an attribute as written to its field. The
+        attribute itself is not changed, so lazily loaded values are not
+        kept beyond their page of the DatasetCache.
+        """
         if attr.dataset_type == 'array':
-            return ogr.OFTString
-        elif attr.dataset_type == 'scalar':
-            return ogr.OFTReal
-        elif attr.dataset_type == 'descriptor':
-            return ogr.OFTString
-        elif attr.dataset_type == 'timeseries':
-            return ogr.OFTString
-        else:
-            return ogr.OFTString
-
-    def _filter_data_types(self, attr):
-        if attr.dataset_type == 'array':
-            attr.value = 'Array'
+            return 'Array'
         elif attr.dataset_type == 'scalar':
-            attr.value = float(attr.value)
+            return float(attr.value)
         elif attr.dataset_type == 'timeseries':
-            attr.value = 'Timeseries'
-
-        return attr
+            return 'Timeseries'
+        return attr.value
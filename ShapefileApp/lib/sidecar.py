@@ -0,0 +1,162 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+#    Copyright (c) 2016, Philipp Meier
+#
+#    This file is part of the Hydra Platform ShapefileApp (HydraShapefileApp).
+#
+#    HydraShapefileApp is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by the
+#    Free Software Foundation, either version 3 of the License, or (at your
+#    option) any later version.
+#
+#    HydraShapefileApp is distributed in the hope that it will be useful, but
+#    WITHOUT ANY WARRANTY; without even the implied warranty of MERCHANTABILITY
+#    or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public License
+#    for more details.
+#
+#    You should have received a copy of the GNU General Public License along
+#    with HydraShapefileApp.  If not, see <http://www.gnu.org/licenses/>.
+
+
+import json
+
+from HydraLib.PluginLib import HydraPluginError
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# Dataset types written to sidecar files
+SIDECAR_TYPES = ('array', 'timeseries')
+
+
+def _dataset_value(value):
+    if isinstance(value, (bytes, type(u''))):
+        return json.loads(value)
+    return value
+
+
+def _column(values):
+    """Convert a list of values to a float array if possible.
+    """
+    try:
+        return np.asarray(values, dtype=np.float64)
+    except (TypeError, ValueError):
+        return np.asarray([u'%s' % val for val in values])
+
+
+def decode_array(value):
+    """Decode the value of an array dataset (nested lists, usually as JSON
+    string) into a NumPy array.
+    """
+    return _column(_dataset_value(value))
+
+
+def decode_timeseries(value):
+    """Decode the value of a timeseries dataset, a dict of columns mapping
+    timestamps to values (usually as JSON string), into an array of times
+    and an array of values with one column per timeseries column. Times are
+    converted to datetime64 if they can be parsed, otherwise they are kept
+    as strings (e.g. for seasonal timestamps).
+    """
+    columns = _dataset_value(value)
+    names = sorted(columns.keys())
+    times = list(columns[names[0]].keys()) if len(names) > 0 else []
+    values = _column([[columns[name].get(t, float('nan')) for name in names]
+                      for t in times])
+    try:
+        times = np.asarray(times, dtype='datetime64[s]')
+    except (TypeError, ValueError):
+        times = np.asarray(times)
+    order = np.argsort(times, kind='mergesort')
+    return times[order], values[order]
+
+
+def _concatenate(arrays):
+    """Concatenate 1-D arrays. Arrays of different kinds (e.g. numbers and
+    strings, or datetimes and seasonal timestamps) are joined as strings.
+    """
+    if len(arrays) == 0:
+        return np.zeros(0)
+    if len(set([array.dtype.kind for array in arrays])) > 1:
+        arrays = [array.astype('U') for array in arrays]
+    return np.concatenate(arrays)
+
+
+class SidecarWriter(object):
+    """Collects the arrays and timeseries of one exported layer and writes
+    them to a compressed NumPy file (NPZ) next to the shapefile.
+
+    Every array or timeseries is one entry. The DBF field of the attribute
+    holds the number of the entry. The file contains the index of all
+    entries (resource_id, attribute and type, one element per entry) and
+    the data of all entries in a few flat arrays, so the number of members
+    does not grow with the number of entries:
+
+    - values: the values of all entries, each flattened
+    - times: the timestamps of all timeseries
+    - shapes: the dimensions of the values of all entries
+    - offsets: for every entry and a trailing end marker, the index of its
+      first element in values, times and shapes
+
+    The values of entry n are values[offsets[n, 0]:offsets[n + 1, 0]]
+    reshaped to shapes[offsets[n, 2]:offsets[n + 1, 2]], the times of a
+    timeseries times[offsets[n, 1]:offsets[n + 1, 1]]. Values and times are
+    stored as strings if they cannot all be stored as numbers or datetimes.
+    """
+
+    def __init__(self, filename):
+        if np is None:
+            raise HydraPluginError("Exporting sidecar files requires NumPy.")
+        self.filename = filename
+        self.resource_ids = []
+        self.attributes = []
+        self.types = []
+        self._values = []
+        self._times = []
+
+    def __len__(self):
+        return len(self.resource_ids)
+
+    def add(self, resource_id, attribute, dataset_type, value):
+        """Decode a dataset value and add it as a new entry. Returns the
+        number of the entry.
+        """
+        n = len(self.resource_ids)
+        if dataset_type == 'timeseries':
+            times, values = decode_timeseries(value)
+            self._times.append(times)
+        else:
+            values = decode_array(value)
+        self._values.append(values)
+        self.resource_ids.append(resource_id)
+        self.attributes.append(attribute)
+        self.types.append(dataset_type)
+        return n
+
+    def save(self):
+        """Write all entries, if there are any.
+        """
+        if len(self) == 0:
+            return
+        offsets = np.zeros((len(self) + 1, 3), dtype=np.int64)
+        shapes = []
+        times = iter(self._times)
+        for n, (values, dataset_type) in enumerate(zip(self._values,
+                                                       self.types)):
+            ntimes = len(next(times)) if dataset_type == 'timeseries' else 0
+            offsets[n + 1] = offsets[n] + (values.size, ntimes, values.ndim)
+            shapes.extend(values.shape)
+        with open(self.filename, 'wb') as npzfile:
+            np.savez_compressed(
+                npzfile,
+                resource_id=np.asarray(self.resource_ids, dtype=np.int64),
+                attribute=np.asarray(self.attributes),
+                type=np.asarray(self.types),
+                offsets=offsets,
+                shapes=np.asarray(shapes, dtype=np.int64),
+                values=_concatenate([values.ravel()
+                                     for values in self._values]),
+                times=_concatenate(self._times))
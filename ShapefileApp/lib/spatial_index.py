@@ -0,0 +1,73 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+#    Copyright (c) 2016, Philipp Meier
+#
+#    This file is part of the Hydra Platform ShapefileApp (HydraShapefileApp).
+#
+#    HydraShapefileApp is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by the
+#    Free Software Foundation, either version 3 of the License, or (at your
+#    option) any later version.
+#
+#    HydraShapefileApp is distributed in the hope that it will be useful, but
+#    WITHOUT ANY WARRANTY; without even the implied warranty of MERCHANTABILITY
+#    or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public License
+#    for more details.
+#
+#    You should have received a copy of the GNU General Public License along
+#    with HydraShapefileApp.  If not, see <http://www.gnu.org/licenses/>.
+
+
+import math
+
+
+class NodeGridIndex(object):
+    """A uniform grid hash over node coordinates. Every node is stored in the
+    square cell containing it, so a nearest node query within a tolerance only
+    needs to look at the few cells overlapping the search radius.
+    """
+
+    def __init__(self, cell_size=1.0):
+        if cell_size <= 0:
+            raise ValueError("Cell size must be positive.")
+        self.cell_size = float(cell_size)
+        self._cells = dict()
+        self._count = 0
+
+    def __len__(self):
+        return self._count
+
+    def _cell(self, x, y):
+        return (int(math.floor(x / self.cell_size)),
+                int(math.floor(y / self.cell_size)))
+
+    def insert(self, x, y, node_id):
+        """Add a node to the index.
+        """
+        cell = self._cell(x, y)
+        if self._cells.get(cell) is None:
+            self._cells[cell] = [(x, y, node_id)]
+        else:
+            self._cells[cell].append((x, y, node_id))
+        self._count += 1
+
+    def nearest(self, x, y, tolerance=0.0):
+        """Return the ID of the node closest to (x, y) if it is not further
+        away than the tolerance, None otherwise.
+        """
+        reach = int(math.ceil(tolerance / self.cell_size))
+        cx, cy = self._cell(x, y)
+        max_dist = tolerance * tolerance
+        nearest_id = None
+        nearest_dist = None
+        for i in range(cx - reach, cx + reach + 1):
+            for j in range(cy - reach, cy + reach + 1):
+                for nx, ny, node_id in self._cells.get((i, j), ()):
+                    dist = (nx - x) * (nx - x) + (ny - y) * (ny - y)
+                    if dist > max_dist:
+                        continue
+                    if nearest_dist is None or dist < nearest_dist:
+                        nearest_id = node_id
+                        nearest_dist = dist
+        return nearest_id
@@ -0,0 +1,185 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+#    Copyright (c) 2016, Philipp Meier
+#
+#    This file is part of the Hydra Platform ShapefileApp (HydraShapefileApp).
+#
+#    HydraShapefileApp is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by the
+#    Free Software Foundation, either version 3 of the License, or (at your
+#    option) any later version.
+#
+#    HydraShapefileApp is distributed in the hope that it will be useful, but
+#    WITHOUT ANY WARRANTY; without even the implied warranty of MERCHANTABILITY
+#    or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public License
+#    for more details.
+#
+#    You should have received a copy of the GNU General Public License along
+#    with HydraShapefileApp.  If not, see <http://www.gnu.org/licenses/>.
+
+
+import json
+import gzip
+import time
+
+from io import BytesIO
+from collections import OrderedDict
+
+import requests
+
+from HydraLib.PluginLib import HydraPluginError
+
+
+class JSONObject(dict):
+    """A dict whose items can also be accessed as attributes, like the
+    objects returned by JsonConnection.call().
+    """
+
+    def __getattr__(self, name):
+        try:
+            return self[name]
+        except KeyError:
+            raise AttributeError(name)
+
+
+def decode_response(response):
+    """Decode the response of a JSON-RPC call or raise a HydraPluginError
+    with the fault returned by the server.
+    """
+    if not response.ok:
+        try:
+            fault = json.loads(response.content.decode('utf-8'))
+            msg = "%s: %s" % (fault['faultcode'], fault['faultstring'])
+        except (ValueError, KeyError, TypeError):
+            msg = "HTTP %s: %s" % (response.status_code, response.reason)
+        raise HydraPluginError(msg)
+
+    return json.loads(response.content.decode('utf-8'),
+                      object_hook=JSONObject)
+
+
+def gzip_bytes(data):
+    buf = BytesIO()
+    gz = gzip.GzipFile(fileobj=buf, mode='wb', compresslevel=6)
+    gz.write(data)
+    gz.close()
+    return buf.getvalue()
+
+
+class HydraTransport(object):
+    """Sends the JSON-RPC calls of a JsonConnection over a persistent
+    requests.Session, so connections to the server are kept alive and reused
+    instead of being opened for every call.
+
+    Responses are always requested with gzip compression. Request bodies
+    larger than compress_min_size bytes are gzip compressed if
+    compress_requests is True (the server has to accept Content-Encoding:
+    gzip). The number of calls, the time spent and the bytes sent and
+    received are recorded per function in stats.
+
+    Logging in is left to the wrapped JsonConnection. To run against a local
+    stand-in server, pass a connection to its URL (or any object with url,
+    app_name, session_id and login()).
+    """
+
+    def __init__(self, conn, compress_requests=False, compress_min_size=4096,
+                 timeout=None, session=None):
+        self.conn = conn
+        self.compress_requests = compress_requests
+        self.compress_min_size = compress_min_size
+        self.timeout = timeout
+        self.session = session if session is not None else requests.Session()
+        self.session.headers.update({'Content-Type': 'application/json',
+                                     'Accept-Encoding': 'gzip'})
+        self.stats = OrderedDict()
+
+    @property
+    def url(self):
+        return self.conn.url
+
+    @property
+    def app_name(self):
+        return self.conn.app_name
+
+    @property
+    def session_id(self):
+        return self.conn.session_id
+
+    def login(self, username=None, password=None):
+        if username is not None and password is not None:
+            return self.conn.login(username=username, password=password)
+        return self.conn.login()
+
+    def headers(self):
+        return {'session_id': self.session_id,
+                'app_name': self.app_name}
+
+    def call(self, func, args):
+        start = time.time()
+        data = json.dumps({func: args}).encode('utf-8')
+        headers = self.headers()
+        if self.compress_requests and len(data) >= self.compress_min_size:
+            data = gzip_bytes(data)
+            headers['Content-Encoding'] = 'gzip'
+        response = self.session.post(self.url, data=data, headers=headers,
+                                     timeout=self.timeout)
+        result = decode_response(response)
+        self.record(func, time.time() - start, len(data),
+                    len(response.content))
+        return result
+
+    def record(self, func, seconds, sent, received):
+        """Add a call to the statistics. The received size is the size of the
+        decompressed response.
+        """
+        stats = self.stats.get(func)
+        if stats is None:
+            stats = dict(calls=0, seconds=0., sent=0, received=0)
+            self.stats[func] = stats
+        stats['calls'] += 1
+        stats['seconds'] += seconds
+        stats['sent'] += sent
+        stats['received'] += received
+
+    def close(self):
+        self.session.close()
+
+
+def post_stream(conn, body):
+    """Send a request body produced by an iterable of byte strings (e.g. a
+    NetworkPayload) to the server of a logged in JsonConnection or
+    HydraTransport. The body is sent with chunked transfer encoding, so it
+    never exists as a whole.
+    """
+    headers = {'Content-Type': 'application/json',
+               'session_id': conn.session_id,
+               'app_name': conn.app_name}
+    if isinstance(conn, HydraTransport):
+        start = time.time()
+        counted = _CountingIterator(body)
+        response = conn.session.post(conn.url, data=counted, headers=headers,
+                                     timeout=conn.timeout)
+        result = decode_response(response)
+        conn.record('add_network', time.time() - start, counted.nbytes,
+                    len(response.content))
+        return result
+    response = requests.post(conn.url, data=iter(body), headers=headers)
+    return decode_response(response)
+
+
+class _CountingIterator(object):
+
+    def __init__(self, chunks):
+        self._chunks = iter(chunks)
+        self.nbytes = 0
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        chunk = next(self._chunks)
+        self.nbytes += len(chunk)
+        return chunk
+
+    next = __next__
@@ -20,30 +20,59 @@
 
 import os
 import sys
+import multiprocessing
 
 sys.path.append(os.path.sep.join(['..', '..', '..', 'lib']))
 
+from HydraLib.PluginLib import write_output
+
 from hydra_network import HydraNetworkTree
 from shapefile_lib import ShapefileApp
+from profiler import Profiler
+from progress import ProgressReporter
 
 from app_interface import export_parser
 
 
 if __name__ == '__main__':
+    multiprocessing.freeze_support()
     parser = export_parser()
     args = parser.parse_args()
 
     if args.print_tree:
         tree = HydraNetworkTree(url=args.url, username=args.user,
                                 password=args.password)
-        tree.get_tree()
+        for project_id in args.invalidate_tree:
+            tree.invalidate(project_id)
+        tree.get_tree(workers=args.tree_workers, ttl=args.tree_ttl,
+                      refresh=args.refresh_tree)
         tree.print_tree()
     else:
+        profiler = Profiler(enabled=args.profile is not None,
+                            trace_memory=args.trace_memory,
+                            cprofile_file=args.cprofile)
+        progress = ProgressReporter(hydra=True, json_log=args.progress_log,
+                                    interval=args.progress_interval)
         exporter = ShapefileApp(url=args.url, username=args.user,
-                                password=args.password)
+                                password=args.password, jobs=args.jobs,
+                                compress_requests=args.gzip,
+                                sidecar=args.sidecar,
+                                output_format=args.format,
+                                profiler=profiler, progress=progress)
         exporter.login()
 
     if args.output is not None:
         # Export network to shapefile
-        exporter.load_network(int(args.network_id), int(args.scenario_id))
-        exporter.to_shp(args.output, overwrite=args.overwrite)
+        exporter.load_network(int(args.network_id), int(args.scenario_id),
+                              lazy=args.lazy, cache_size=args.cache_size,
+                              include_attrs=args.include_attrs,
+                              exclude_attrs=args.exclude_attrs,
+                              types=args.types, bbox=args.bbox)
+        timings = exporter.to_shp(args.output, overwrite=args.overwrite)
+        for layer_name, nfeatures, seconds in timings:
+            write_output('%s: %d features in %.1f s' %
+                         (layer_name, nfeatures, seconds))
+        if args.profile is not None:
+            profiler.write_report(args.profile,
+                                  rpc_stats=exporter.conn.stats)
+        progress.close()
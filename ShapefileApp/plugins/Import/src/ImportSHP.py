@@ -21,29 +21,71 @@
 
 import os
 import sys
+import multiprocessing
 
 sys.path.append(os.path.sep.join(['..', '..', '..', 'lib']))
 
 from hydra_network import HydraNetworkTree
 from shapefile_lib import ShapefileApp
+from import_cache import ImportCache
+from profiler import Profiler
+from progress import ProgressReporter
 
 from app_interface import import_parser
 
 
 if __name__ == '__main__':
+    multiprocessing.freeze_support()
     parser = import_parser()
     args = parser.parse_args()
 
     if args.print_tree:
         tree = HydraNetworkTree(url=args.url, username=args.user,
                                 password=args.password)
-        tree.get_tree()
+        for project_id in args.invalidate_tree:
+            tree.invalidate(project_id)
+        tree.get_tree(workers=args.tree_workers, ttl=args.tree_ttl,
+                      refresh=args.refresh_tree)
         tree.print_tree()
     else:
+        profiler = Profiler(enabled=args.profile is not None,
+                            trace_memory=args.trace_memory,
+                            cprofile_file=args.cprofile)
+        progress = ProgressReporter(hydra=True, json_log=args.progress_log,
+                                    interval=args.progress_interval)
+        import_cache = None
+        if args.import_cache:
+            import_cache = ImportCache(args.cache_dir,
+                                       max_bytes=args.cache_limit << 20)
         importer = ShapefileApp(url=args.url, username=args.user,
-                                password=args.password)
+                                password=args.password,
+                                compress_requests=args.gzip,
+                                snap_tolerance=args.snap_tolerance,
+                                online_epsg_lookup=args.online_epsg_lookup,
+                                jobs=args.jobs,
+                                compact=args.compact,
+                                target_epsg=args.target_epsg,
+                                wkb_layout=args.wkb_layout,
+                                input_format=args.format,
+                                import_cache=import_cache,
+                                profiler=profiler, progress=progress)
         importer.login()
 
     if args.input_links is not None:
         # Import network from shapefile
-        importer.from_shp(args.input_links, args.input_nodes)
+        result = importer.from_shp(args.input_links, args.input_nodes,
+                                   node_filter=args.node_filter,
+                                   link_filter=args.link_filter,
+                                   bbox=args.bbox,
+                                   batch_size=args.batch_size,
+                                   stream=args.stream,
+                                   update_network=args.update_network,
+                                   update_scenario=args.update_scenario,
+                                   key_field=args.key_field)
+        if args.update_network is not None:
+            for key, count in sorted(result.summary().items()):
+                print('%s: %d' % (key.replace('_', ' '), count))
+        if args.profile is not None:
+            profiler.write_report(args.profile,
+                                  rpc_stats=importer.conn.stats)
+        progress.close()
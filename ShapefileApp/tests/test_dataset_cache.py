@@ -0,0 +1,86 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+#    Copyright (c) 2016, Philipp Meier
+#
+#    This file is part of the Hydra Platform ShapefileApp (HydraShapefileApp).
+#
+#    HydraShapefileApp is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by the
+#    Free Software Foundation, either version 3 of the License, or (at your
+#    option) any later version.
+#
+#    HydraShapefileApp is distributed in the hope that it will be useful, but
+#    WITHOUT ANY WARRANTY; without even the implied warranty of MERCHANTABILITY
+#    or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public License
+#    for more details.
+#
+#    You should have received a copy of the GNU General Public License along
+#    with HydraShapefileApp.  If not, see <http://www.gnu.org/licenses/>.
+
+
+
+from dataset_cache import DatasetCache
+
+
+class CountingConnection(object):
+    """Answers get_attribute_datasets with one scalar dataset per resource
+    attribute and counts the calls.
+    """
+
+    def __init__(self, nresources):
+        self.nresources = nresources
+        self.calls = 0
+
+    def call(self, func, args):
+        assert func == 'get_attribute_datasets'
+        self.calls += 1
+        attr_id = args['attr_id']
+        return [{'resource_attr_id': (attr_id, i),
+                 'value': {'id': i, 'type': 'scalar', 'value': i}}
+                for i in range(self.nresources)]
+
+
+def read_layer(cache, attr_ids, nresources):
+    for i in range(nresources):
+        for attr_id in attr_ids:
+            assert cache.get(attr_id, (attr_id, i))['value'] == i
+
+
+def test_small_cache_fetches_every_page_once_per_layer():
+    conn = CountingConnection(100)
+    cache = DatasetCache(conn, 1, max_datasets=150)
+    cache.begin_layer()
+    read_layer(cache, [1, 2, 3], 100)
+    cache.end_layer()
+    assert conn.calls == 3
+    assert cache._size <= 150
+
+
+def test_small_cache_without_layer_is_bounded():
+    conn = CountingConnection(100)
+    cache = DatasetCache(conn, 1, max_datasets=150)
+    read_layer(cache, [1, 2, 3], 10)
+    assert cache._size <= 150
+    assert len(cache._pages) == 1
+
+
+def test_types_do_not_pin_pages():
+    conn = CountingConnection(100)
+    cache = DatasetCache(conn, 1, max_datasets=150)
+    cache.begin_layer()
+    for attr_id in [1, 2, 3]:
+        assert cache.get_type(attr_id, (attr_id, 0)) == 'scalar'
+    assert cache._size <= 150
+    cache.end_layer()
+    assert conn.calls == 3
+
+
+def test_unselected_resource_attributes_are_dropped():
+    conn = CountingConnection(100)
+    selected = set([(1, i) for i in range(10)])
+    cache = DatasetCache(conn, 1, resource_attr_ids=selected)
+    assert cache.get(1, (1, 5))['value'] == 5
+    assert cache.get(1, (1, 50)) is None
+    assert cache.get_type(1, (1, 50)) is None
+    assert cache._size == 10
@@ -0,0 +1,82 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+#    Copyright (c) 2016, Philipp Meier
+#
+#    This file is part of the Hydra Platform ShapefileApp (HydraShapefileApp).
+#
+#    HydraShapefileApp is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by the
+#    Free Software Foundation, either version 3 of the License, or (at your
+#    option) any later version.
+#
+#    HydraShapefileApp is distributed in the hope that it will be useful, but
+#    WITHOUT ANY WARRANTY; without even the implied warranty of MERCHANTABILITY
+#    or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public License
+#    for more details.
+#
+#    You should have received a copy of the GNU General Public License along
+#    with HydraShapefileApp.  If not, see <http://www.gnu.org/licenses/>.
+
+
+
+import warnings
+
+import pytest
+
+pytest.importorskip('osgeo')
+
+from epsg_lookup import EPSGCache
+from epsg_lookup import prj2epsg
+from epsg_lookup import wkt2epsg
+
+CH1903_WKT = 'PROJCS["CH1903+_LV95",GEOGCS["GCS_CH1903+",' \
+    'DATUM["D_CH1903+",SPHEROID["Bessel_1841",6377397.155,299.1528128]],' \
+    'PRIMEM["Greenwich",0.0],UNIT["Degree",0.0174532925199433]],' \
+    'PROJECTION["Hotine_Oblique_Mercator_Azimuth_Center"],' \
+    'PARAMETER["False_Easting",2600000.0],' \
+    'PARAMETER["False_Northing",1200000.0],' \
+    'PARAMETER["Scale_Factor",1.0],' \
+    'PARAMETER["Azimuth",90.0],' \
+    'PARAMETER["Longitude_Of_Center",7.439583333333333],' \
+    'PARAMETER["Latitude_Of_Center",46.95240555555556],' \
+    'UNIT["Meter",1.0]]'
+
+
+class CountingCache(EPSGCache):
+    """A cache which already holds every lookup and counts writes.
+    """
+
+    def __init__(self, filename):
+        super(CountingCache, self).__init__(filename)
+        self.puts = 0
+
+    def get(self, key):
+        return {u'exact': True, u'codes': [{u'code': u'2056'}]}
+
+    def put(self, key, entry):
+        self.puts += 1
+
+
+def test_cache_hit_is_not_written(tmpdir):
+    prjfile = tmpdir.join('network.prj')
+    prjfile.write(CH1903_WKT)
+    cache = CountingCache(str(tmpdir.join('epsg_cache.json')))
+    assert prj2epsg(str(prjfile), cache=cache) == {'epsg': [2056]}
+    assert cache.puts == 0
+
+
+def test_lookup_without_prj_file(tmpdir):
+    # GeoPackage and FlatGeobuf layers have no .prj file
+    cache = CountingCache(str(tmpdir.join('epsg_cache.json')))
+    assert wkt2epsg(CH1903_WKT, cache=cache) == {'epsg': [2056]}
+
+
+def test_unreadable_cache_is_ignored(tmpdir):
+    # A folder in place of the cache file cannot be read
+    filename = str(tmpdir.mkdir('epsg_cache.json'))
+    with warnings.catch_warnings(record=True) as caught:
+        warnings.simplefilter('always')
+        cache = EPSGCache(filename)
+    assert len(caught) == 1
+    assert cache.get('key') is None
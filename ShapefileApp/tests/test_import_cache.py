@@ -0,0 +1,64 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+#    Copyright (c) 2016, Philipp Meier
+#
+#    This file is part of the Hydra Platform ShapefileApp (HydraShapefileApp).
+#
+#    HydraShapefileApp is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by the
+#    Free Software Foundation, either version 3 of the License, or (at your
+#    option) any later version.
+#
+#    HydraShapefileApp is distributed in the hope that it will be useful, but
+#    WITHOUT ANY WARRANTY; without even the implied warranty of MERCHANTABILITY
+#    or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public License
+#    for more details.
+#
+#    You should have received a copy of the GNU General Public License along
+#    with HydraShapefileApp.  If not, see <http://www.gnu.org/licenses/>.
+
+
+
+import os
+import time
+
+from import_cache import ImportCache
+
+
+def cache_entries(cache_dir):
+    return sorted([name for name in os.listdir(cache_dir)
+                   if name.startswith('import_')])
+
+
+def store_file(cache, tmpdir, name, nbytes):
+    filename = str(tmpdir.join(name))
+    with open(filename, 'w') as datafile:
+        datafile.write(name)
+    task = (filename, 'Point', None, None, None)
+    cache.store(task, ['x' * nbytes])
+    return task
+
+
+def test_cache_is_bounded(tmpdir):
+    cache_dir = str(tmpdir.mkdir('cache'))
+    cache = ImportCache(cache_dir, max_bytes=25000)
+    first = store_file(cache, tmpdir, 'a.geojson', 10000)
+    second = store_file(cache, tmpdir, 'b.geojson', 10000)
+    assert len(cache_entries(cache_dir)) == 2
+
+    # Using the first entry makes the second the least recently used one
+    past = time.time() - 60
+    os.utime(cache._entry_path(second), (past, past))
+    assert cache.load(first) == ['x' * 10000]
+    store_file(cache, tmpdir, 'c.geojson', 10000)
+    assert len(cache_entries(cache_dir)) == 2
+    assert cache.load(second) is None
+    assert cache.load(first) is not None
+
+
+def test_new_entry_is_kept(tmpdir):
+    cache_dir = str(tmpdir.mkdir('cache'))
+    cache = ImportCache(cache_dir, max_bytes=1000)
+    task = store_file(cache, tmpdir, 'a.geojson', 10000)
+    assert cache.load(task) is not None
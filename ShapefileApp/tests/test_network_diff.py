@@ -0,0 +1,38 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+#    Copyright (c) 2016, Philipp Meier
+#
+#    This file is part of the Hydra Platform ShapefileApp (HydraShapefileApp).
+#
+#    HydraShapefileApp is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by the
+#    Free Software Foundation, either version 3 of the License, or (at your
+#    option) any later version.
+#
+#    HydraShapefileApp is distributed in the hope that it will be useful, but
+#    WITHOUT ANY WARRANTY; without even the implied warranty of MERCHANTABILITY
+#    or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public License
+#    for more details.
+#
+#    You should have received a copy of the GNU General Public License along
+#    with HydraShapefileApp.  If not, see <http://www.gnu.org/licenses/>.
+
+
+
+from network_diff import value_key
+
+
+def test_descriptors_compare_as_text():
+    assert value_key('descriptor', '1') != value_key('descriptor', '1.0')
+    assert value_key('descriptor', u'PVC') == value_key('descriptor', 'PVC')
+
+
+def test_scalars_compare_as_numbers():
+    assert value_key('scalar', '1') == value_key('scalar', '1.0')
+    assert value_key('scalar', 2.5) == value_key('scalar', '2.5')
+
+
+def test_types_differ():
+    assert value_key('scalar', '1') != value_key('descriptor', '1')
+    assert value_key('scalar', None) is None
@@ -0,0 +1,106 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+#    Copyright (c) 2016, Philipp Meier
+#
+#    This file is part of the Hydra Platform ShapefileApp (HydraShapefileApp).
+#
+#    HydraShapefileApp is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by the
+#    Free Software Foundation, either version 3 of the License, or (at your
+#    option) any later version.
+#
+#    HydraShapefileApp is distributed in the hope that it will be useful, but
+#    WITHOUT ANY WARRANTY; without even the implied warranty of MERCHANTABILITY
+#    or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public License
+#    for more details.
+#
+#    You should have received a copy of the GNU General Public License along
+#    with HydraShapefileApp.  If not, see <http://www.gnu.org/licenses/>.
+
+
+import gc
+
+import pytest
+
+pytest.importorskip('osgeo')
+pytest.importorskip('HydraLib')
+
+from shapefile_lib import ShapefileApp
+from network_payload import NetworkPayload
+
+
+def build_network(url, nnodes, project=None):
+    """Return a logged in ShapefileApp holding a chain of nnodes nodes with
+    scalar and descriptor attributes and the links between them.
+    """
+    app = ShapefileApp(url=url, username='test', password='test')
+    app.login()
+    app.load_attributes()
+    if project is None:
+        app.create_project(name='Test project')
+    else:
+        app.project = project
+    app.add_nodes([app._build_node(float(i), 0.,
+                                   {'name': 'Node %s' % i,
+                                    'depth': 1.5 * i,
+                                    'material': 'PVC'})
+                   for i in range(nnodes)])
+    for i in range(nnodes - 1):
+        app._add_link({'type': 'LineString',
+                       'coordinates': [[float(i), 0.], [i + .5, 1.],
+                                       [i + 1., 0.]]},
+                      {'name': 'Link %s' % i, 'length': 1.0})
+    return app
+
+
+def record_add_network(server):
+    """Keep the arguments of all add_network calls the server receives.
+    """
+    bodies = []
+    add_network = server.hydra.rpc_add_network
+
+    def rpc_add_network(net):
+        bodies.append(net)
+        return add_network(net)
+
+    server.hydra.rpc_add_network = rpc_add_network
+    return bodies
+
+
+def test_streamed_body_equals_add_network_payload(hydra_server):
+    bodies = record_add_network(hydra_server)
+
+    plain = build_network(hydra_server.url, 50)
+    plain.save_network(network_name='Network')
+    streamed = build_network(hydra_server.url, 50, project=plain.project)
+    streamed.save_network(network_name='Network', stream=True)
+
+    assert len(bodies) == 2
+    assert len(bodies[0]['nodes']) == 50
+    assert len(bodies[0]['links']) == 49
+    assert len(bodies[0]['scenarios'][0]['resourcescenarios']) == 149
+    assert bodies[1] == bodies[0]
+
+
+def test_streamed_body_memory_is_bounded(hydra_server):
+    app = build_network(hydra_server.url, 5000)
+    app.hydra_network = dict(name='Network', project_id=app.project['id'])
+    app.hydra_scenario = dict(name='Scenario', resourcescenarios=[])
+    app.create_attributes(app.attribute_names())
+
+    payload = NetworkPayload(app)
+    size = 0
+    growth = 0
+    gc.collect()
+    baseline = len(gc.get_objects())
+    for chunk in payload:
+        assert len(chunk) < 2 * payload.chunk_size
+        size += len(chunk)
+        growth = max(growth, len(gc.get_objects()) - baseline)
+
+    # Resources are encoded one at a time and their data is spooled to a
+    # file: the objects alive while the body is generated do not grow with
+    # the 15000 resource dicts and datasets
+    assert size > 20 * payload.chunk_size
+    assert growth < 1000
@@ -0,0 +1,58 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+#    Copyright (c) 2016, Philipp Meier
+#
+#    This file is part of the Hydra Platform ShapefileApp (HydraShapefileApp).
+#
+#    HydraShapefileApp is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by the
+#    Free Software Foundation, either version 3 of the License, or (at your
+#    option) any later version.
+#
+#    HydraShapefileApp is distributed in the hope that it will be useful, but
+#    WITHOUT ANY WARRANTY; without even the implied warranty of MERCHANTABILITY
+#    or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public License
+#    for more details.
+#
+#    You should have received a copy of the GNU General Public License along
+#    with HydraShapefileApp.  If not, see <http://www.gnu.org/licenses/>.
+
+
+
+from network_store import AttributeColumn
+from network_store import AttributeTable
+from network_store import ABSENT
+from network_store import NULL
+from network_store import VALUE
+
+
+def test_column_with_leading_nulls():
+    column = AttributeColumn()
+    column.set(0, None)
+    column.set(1, 3.0)
+    column.set(3, 4.5)
+    assert column.get(0) == (NULL, None)
+    assert column.get(1) == (VALUE, 3.0)
+    assert column.get(2) == (ABSENT, None)
+    assert column.get(3) == (VALUE, 4.5)
+
+
+def test_column_converted_to_objects_keeps_rows():
+    column = AttributeColumn()
+    column.set(0, None)
+    column.set(1, 2)
+    column.set(2, 'PVC')
+    assert column.kind == 'object'
+    assert [column.get(row) for row in range(3)] == \
+        [(NULL, None), (VALUE, 2), (VALUE, 'PVC')]
+
+
+def test_table_rows_with_null_and_missing_attributes():
+    table = AttributeTable()
+    table.set_row(0, {'depth': None})
+    table.set_row(1, {'name': 'Node 1'})
+    table.set_row(2, {'depth': 1.5, 'name': None})
+    assert table.get_row(0) == {'depth': None}
+    assert table.get_row(1) == {'name': 'Node 1'}
+    assert table.get_row(2) == {'depth': 1.5, 'name': None}
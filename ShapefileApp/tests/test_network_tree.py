@@ -0,0 +1,67 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+#    Copyright (c) 2016, Philipp Meier
+#
+#    This file is part of the Hydra Platform ShapefileApp (HydraShapefileApp).
+#
+#    HydraShapefileApp is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by the
+#    Free Software Foundation, either version 3 of the License, or (at your
+#    option) any later version.
+#
+#    HydraShapefileApp is distributed in the hope that it will be useful, but
+#    WITHOUT ANY WARRANTY; without even the implied warranty of MERCHANTABILITY
+#    or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public License
+#    for more details.
+#
+#    You should have received a copy of the GNU General Public License along
+#    with HydraShapefileApp.  If not, see <http://www.gnu.org/licenses/>.
+
+
+
+import pytest
+
+pytest.importorskip('osgeo')
+pytest.importorskip('HydraLib')
+
+import app_cache
+from hydra_network import HydraNetworkTree
+from test_network_payload import build_network
+
+
+@pytest.fixture
+def tree_cache_dir(tmpdir, monkeypatch):
+    monkeypatch.setattr(app_cache, 'CACHE_DIR', str(tmpdir))
+    return tmpdir
+
+
+def test_saving_a_network_invalidates_its_project(hydra_server,
+                                                  tree_cache_dir):
+    app = build_network(hydra_server.url, 5)
+    tree = HydraNetworkTree(url=hydra_server.url, username='test',
+                            password='test')
+    tree.get_tree()
+    assert len(tree.projects[app.project['id']]['networks']) == 0
+
+    app.save_network(network_name='Network')
+    tree = HydraNetworkTree(url=hydra_server.url, username='test',
+                            password='test')
+    tree.get_tree()
+    assert tree.nfetched == 1
+    assert len(tree.projects[app.project['id']]['networks']) == 1
+
+
+def test_invalidate_project(hydra_server, tree_cache_dir):
+    build_network(hydra_server.url, 5)
+    build_network(hydra_server.url, 5)
+    tree = HydraNetworkTree(url=hydra_server.url, username='test',
+                            password='test')
+    tree.get_tree()
+    assert tree.nfetched == 2
+
+    tree.invalidate(sorted(tree.projects)[0])
+    tree = HydraNetworkTree(url=hydra_server.url, username='test',
+                            password='test')
+    tree.get_tree()
+    assert tree.nfetched == 1
@@ -0,0 +1,94 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+#    Copyright (c) 2016, Philipp Meier
+#
+#    This file is part of the Hydra Platform ShapefileApp (HydraShapefileApp).
+#
+#    HydraShapefileApp is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by the
+#    Free Software Foundation, either version 3 of the License, or (at your
+#    option) any later version.
+#
+#    HydraShapefileApp is distributed in the hope that it will be useful, but
+#    WITHOUT ANY WARRANTY; without even the implied warranty of MERCHANTABILITY
+#    or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public License
+#    for more details.
+#
+#    You should have received a copy of the GNU General Public License along
+#    with HydraShapefileApp.  If not, see <http://www.gnu.org/licenses/>.
+
+
+
+import json
+
+import pytest
+
+pytest.importorskip('osgeo')
+pytest.importorskip('HydraLib')
+
+from progress import ProgressReporter
+from shapefile_lib import ShapefileApp
+
+
+class PointBatch(object):
+    """A batch of the points of a layer, like a FeatureBatch.
+    """
+
+    def __init__(self, filename, layer_size, start, stop):
+        self.filename = filename
+        self.layer_name = filename
+        self.layer_size = layer_size
+        self.points = [(float(i), 0., {'name': 'Node %s' % i})
+                       for i in range(start, stop)]
+
+    def iter_points(self):
+        return iter(self.points)
+
+
+def read_log(filename):
+    with open(filename) as logfile:
+        return [json.loads(line) for line in logfile]
+
+
+def test_phases_overlap(tmpdir):
+    log = str(tmpdir.join('progress.json'))
+    progress = ProgressReporter(json_log=log)
+    progress.start('read_files', total=2, unit='files')
+    progress.start('import_nodes', total=10)
+    progress.update(phase='read_files')
+    progress.update(10)
+    progress.finish('import_nodes')
+    progress.update(phase='read_files')
+    progress.finish()
+    progress.close()
+
+    finished = dict((status['phase'], status['done'])
+                    for status in read_log(log) if status['finished'])
+    assert finished == {'read_files': 2, 'import_nodes': 10}
+
+
+def test_import_finishes_only_its_own_phase(tmpdir):
+    log = str(tmpdir.join('progress.json'))
+    progress = ProgressReporter(json_log=log)
+    app = ShapefileApp(progress=progress)
+
+    def read_batches(filenames, *args):
+        # Like ShapefileApp.read_batches(), which reports the files read
+        # while their features are imported
+        progress.start('read_files', total=len(filenames), unit='files')
+        for i, filename in enumerate(filenames):
+            yield PointBatch(filename, 4, 2 * i, 2 * i + 2)
+            yield PointBatch(filename, 4, 2 * i + 10, 2 * i + 12)
+            progress.update(phase='read_files')
+        progress.finish('read_files')
+
+    app.read_batches = read_batches
+    app.shp_import_nodes(['a.shp', 'b.shp'])
+    progress.close()
+
+    finished = [(status['phase'], status['layer'], status['done'])
+                for status in read_log(log) if status['finished']]
+    assert finished == [('import_nodes', 'a.shp', 4),
+                        ('read_files', None, 2),
+                        ('import_nodes', 'b.shp', 4)]
@@ -0,0 +1,57 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+#    Copyright (c) 2016, Philipp Meier
+#
+#    This file is part of the Hydra Platform ShapefileApp (HydraShapefileApp).
+#
+#    HydraShapefileApp is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by the
+#    Free Software Foundation, either version 3 of the License, or (at your
+#    option) any later version.
+#
+#    HydraShapefileApp is distributed in the hope that it will be useful, but
+#    WITHOUT ANY WARRANTY; without even the implied warranty of MERCHANTABILITY
+#    or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public License
+#    for more details.
+#
+#    You should have received a copy of the GNU General Public License along
+#    with HydraShapefileApp.  If not, see <http://www.gnu.org/licenses/>.
+
+
+
+import json
+
+import pytest
+
+np = pytest.importorskip('numpy')
+pytest.importorskip('HydraLib')
+
+from sidecar import SidecarWriter
+
+
+def entry(npz, n):
+    offsets = npz['offsets']
+    values = npz['values'][offsets[n, 0]:offsets[n + 1, 0]]
+    shape = npz['shapes'][offsets[n, 2]:offsets[n + 1, 2]]
+    times = npz['times'][offsets[n, 1]:offsets[n + 1, 1]]
+    return values.reshape(shape).tolist(), times
+
+
+def test_entries_in_flat_arrays(tmpdir):
+    filename = str(tmpdir.join('pipes.npz'))
+    sidecar = SidecarWriter(filename)
+    for i in range(100):
+        sidecar.add(i, 'demand', 'array', json.dumps([[i, 1], [2, 3]]))
+    sidecar.add(100, 'flow', 'timeseries',
+                json.dumps({'0': {'2020-01-02T00:00:00': 2.5,
+                                  '2020-01-01T00:00:00': 1.5}}))
+    sidecar.save()
+
+    npz = np.load(filename)
+    assert sorted(npz.files) == ['attribute', 'offsets', 'resource_id',
+                                 'shapes', 'times', 'type', 'values']
+    assert entry(npz, 42)[0] == [[42., 1.], [2., 3.]]
+    values, times = entry(npz, 100)
+    assert values == [[1.5], [2.5]]
+    assert times.tolist()[0].day == 1